@@ -1,10 +1,38 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional, Union
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Dict, Any, Literal, Optional, Union
+
+from app.utils.dates import parse_date
+
+
+class SearchFilters(BaseModel):
+    law_id: Optional[List[str]] = Field(default=None, description="Law IDs to search within (a string or a list)")
+    law_title: Optional[List[str]] = Field(default=None, description="Law titles to search within (e.g., 民法)")
+    law_type: Optional[List[str]] = Field(default=None, description="Law types to search within (e.g., Act, CabinetOrder)")
+    update_date_from: Optional[str] = Field(default=None, description="Earliest update date (YYYY-MM-DD)")
+    update_date_to: Optional[str] = Field(default=None, description="Latest update date (YYYY-MM-DD)")
+
+    @field_validator("law_id", "law_title", "law_type", mode="before")
+    @classmethod
+    def _single_value_to_list(cls, value: Any) -> Any:
+        """単一の文字列も1件のリストとして受け付ける"""
+        return [value] if isinstance(value, str) else value
+
+    @field_validator("update_date_from", "update_date_to")
+    @classmethod
+    def _validate_date(cls, value: Optional[str]) -> Optional[str]:
+        if value and parse_date(value) is None:
+            raise ValueError("Invalid date; expected YYYY-MM-DD, YYYY/MM/DD or YYYYMMDD")
+        return value
 
 
 class SearchRequest(BaseModel):
     query: str
     max_results: int = 5
+    mode: Optional[Literal["vector", "hybrid"]] = Field(default=None, description="Search mode: 'vector' or 'hybrid' (default: server setting)")
+    filters: Optional[SearchFilters] = Field(default=None, description="Metadata filters")
+    namespaces: Optional[List[str]] = Field(default=None, description="Namespaces (partitions) to search (default: all)")
+    expand_to_parent: Optional[bool] = Field(default=None, description="Replace paragraph/item passages with their parent article (default: server setting)")
+    multi_query: Optional[bool] = Field(default=None, description="Also search query rewrites / a hypothetical answer and fuse the results (default: server setting)")
 
 
 class DocumentMetadata(BaseModel):
@@ -17,12 +45,29 @@ class DocumentMetadata(BaseModel):
     original_text: str = Field(default="", description="Original text content")
     revisionID: str = Field(default="", description="Revision ID")
     updateDate: str = Field(default="", description="Update date")
+    ParentID: str = Field(default="", description="Parent article ID (paragraph/item passages only)")
+    ParagraphNum: int = Field(default=0, description="Paragraph (項) number of the passage")
+    ItemNum: int = Field(default=0, description="Item (号) number of the passage")
 
 
 class SearchResult(BaseModel):
     document: str
     similarity_score: float
     metadata: DocumentMetadata
+    matched_passage: Optional[str] = Field(default=None, description="Matched passage when expanded to the parent article")
+
+
+def to_search_results(documents: List[Dict[str, Any]]) -> List[SearchResult]:
+    """検索結果（search_service の戻り値）をレスポンス形式に変換"""
+    return [
+        SearchResult(
+            document=doc["document"],
+            similarity_score=doc["similarity_score"],
+            metadata=DocumentMetadata(**doc["metadata"]),
+            matched_passage=doc.get("matched_passage")
+        )
+        for doc in documents
+    ]
 
 
 class SearchResponse(BaseModel):
@@ -31,6 +76,23 @@ class SearchResponse(BaseModel):
     total_results: int
 
 
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchRequest] = Field(..., description="Search requests, processed concurrently")
+
+
+class BatchSearchItem(BaseModel):
+    query: str
+    results: List[SearchResult] = Field(default_factory=list)
+    total_results: int = 0
+    error: Optional[str] = Field(default=None, description="Error message if this query failed")
+
+
+class BatchSearchResponse(BaseModel):
+    results: List[BatchSearchItem] = Field(..., description="Results in request order")
+    total_queries: int
+    failed_queries: int
+
+
 class HealthResponse(BaseModel):
     status: str
     vector_store_info: Optional[Dict[str, Any]] = None
@@ -45,10 +107,42 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[Message] = Field(..., description="Conversation history")
     max_context_docs: int = Field(default=3, description="Maximum number of context documents")
+    rerank: Optional[bool] = Field(default=None, description="Rerank over-fetched candidates (default: server setting)")
+    use_cache: bool = Field(default=True, description="Reuse a cached answer for the same conversation and context documents")
 
 
 class ChatResponse(BaseModel):
     user_query: str
     ai_response: str
     context_documents: List[SearchResult]
-    total_context_docs: int
\ No newline at end of file
+    total_context_docs: int
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Per-stage timings in milliseconds")
+    context_packing: Optional[Dict[str, Any]] = Field(default=None, description="Prompt token budget statistics (tokens saved etc.)")
+    cached: bool = Field(default=False, description="Whether the answer was served from the answer cache")
+
+# Offline chat job models
+class ChatJobItem(BaseModel):
+    """ジョブに投入するJSONLの1行"""
+    id: Optional[str] = Field(default=None, description="Caller-defined identifier echoed in the results (default: line number)")
+    messages: List[Message] = Field(..., description="Conversation history")
+    max_context_docs: Optional[int] = Field(default=None, description="Overrides the job-level max_context_docs")
+
+
+class ChatJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued / running / completed / cancelled / interrupted")
+    options: Dict[str, Any]
+    total: int
+    pending: int
+    running: int
+    completed: int
+    failed: int
+    created_at: float
+    updated_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class ChatJobListResponse(BaseModel):
+    jobs: List[ChatJobStatus]
+    worker: Dict[str, Any] = Field(..., description="Worker pool statistics")
@@ -1,10 +1,19 @@
+import json
+from typing import Any, Dict
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import ChatRequest, ChatResponse, SearchResult, DocumentMetadata
+from fastapi.responses import StreamingResponse
+from app.models.schemas import ChatRequest, ChatResponse, to_search_results
 from app.services.rag import rag_service
+from app.services.concurrency_limiter import UpstreamOverloaded
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events形式に整形"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.post("", response_model=ChatResponse)
 async def chat_with_ai(request: ChatRequest):
     """AIチャット（RAG機能付き）"""
@@ -16,25 +25,68 @@ async def chat_with_ai(request: ChatRequest):
         # RAGパイプライン実行
         rag_result = await rag_service.chat_with_rag(
             messages=request.messages,
-            max_context_docs=request.max_context_docs
+            max_context_docs=request.max_context_docs,
+            rerank=request.rerank,
+            use_cache=request.use_cache
         )
         
         # レスポンス形式に変換
-        context_results = []
-        for doc in rag_result["context_documents"]:
-            search_result = SearchResult(
-                document=doc["document"],
-                similarity_score=doc["similarity_score"],
-                metadata=DocumentMetadata(**doc["metadata"])
-            )
-            context_results.append(search_result)
+        context_results = to_search_results(rag_result["context_documents"])
         
         return ChatResponse(
             user_query=rag_result["user_query"],
             ai_response=rag_result["ai_response"],
             context_documents=context_results,
-            total_context_docs=rag_result["total_context_docs"]
+            total_context_docs=rag_result["total_context_docs"],
+            timings=rag_result["timings"],
+            context_packing=rag_result["context_packing"],
+            cached=rag_result["cached"]
         )
         
+    except UpstreamOverloaded:
+        # 503 + Retry-After（main.py の例外ハンドラ）
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    """AIチャット（RAG機能付き、Server-Sent Eventsでストリーミング）
+    
+    イベント順: context → token（複数） → done。失敗時は error を送って終了する
+    （上流APIが過負荷の場合は retry_after を含む error）。
+    OpenRouterの待ち行列が溢れている場合はストリーミングを開始せずに 503 を返す
+    """
+    if not request.messages:
+        raise HTTPException(status_code=422, detail="Messages array cannot be empty")
+    rag_service.chat_service.limiter.reject_if_full()
+    
+    async def event_stream():
+        try:
+            async for event in rag_service.stream_chat_with_rag(
+                messages=request.messages,
+                max_context_docs=request.max_context_docs,
+                rerank=request.rerank,
+                use_cache=request.use_cache
+            ):
+                event_type = event.pop("type")
+                if event_type == "context":
+                    event["context_documents"] = [
+                        result.model_dump()
+                        for result in to_search_results(event["context_documents"])
+                    ]
+                yield _format_sse(event_type, event)
+        except UpstreamOverloaded as e:
+            yield _format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield _format_sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
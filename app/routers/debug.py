@@ -117,4 +117,100 @@ async def test_openai_connection() -> Dict[str, Any]:
         return {
             "status": "failed",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+@router.get("/debug/upstreams")
+async def upstream_stats():
+    """上流APIごとの同時実行数の制限・待ち行列・負荷遮断の統計を返すエンドポイント"""
+    stats: Dict[str, Any] = {}
+    
+    try:
+        from app.services.chat import chat_service
+        stats[chat_service.limiter.name] = chat_service.limiter.get_stats()
+    except Exception as e:
+        stats["openrouter"] = {"error": str(e)}
+    
+    try:
+        from app.services.embeddings import embeddings_service
+        stats[embeddings_service.limiter.name] = embeddings_service.limiter.get_stats()
+    except Exception as e:
+        stats["openai"] = {"error": str(e)}
+    
+    try:
+        from app.services.vector_store import vector_store
+        stats[vector_store.limiter.name] = vector_store.limiter.get_stats()
+    except Exception as e:
+        stats["vector_store"] = {"error": str(e)}
+    
+    return stats
+
+@router.get("/debug/cache")
+async def cache_stats():
+    """キャッシュの統計情報を返すエンドポイント"""
+    stats: Dict[str, Any] = {}
+    
+    try:
+        from app.services.embeddings import embeddings_service
+        stats["embedding_cache"] = (
+            embeddings_service.cache.get_stats() if embeddings_service.cache else {"enabled": False}
+        )
+    except Exception as e:
+        stats["embedding_cache"] = {"error": str(e)}
+    
+    try:
+        from app.services.embeddings import embeddings_service
+        stats["embedding_batching"] = (
+            embeddings_service.batcher.get_stats() if embeddings_service.batcher else {"enabled": False}
+        )
+    except Exception as e:
+        stats["embedding_batching"] = {"error": str(e)}
+    
+    try:
+        from app.services.search import search_service
+        stats["search_result_cache"] = (
+            search_service.result_cache.get_stats() if search_service.result_cache else {"enabled": False}
+        )
+    except Exception as e:
+        stats["search_result_cache"] = {"error": str(e)}
+    
+    try:
+        from app.services.search import search_service
+        lexical_index = search_service.lexical_index
+        stats["lexical_index"] = lexical_index.get_stats() if lexical_index else {"enabled": False}
+    except Exception as e:
+        stats["lexical_index"] = {"error": str(e)}
+    
+    try:
+        from app.services.search import search_service
+        citation_index = search_service.citation_index
+        stats["citation_fast_path"] = citation_index.get_stats() if citation_index else {"enabled": False}
+    except Exception as e:
+        stats["citation_fast_path"] = {"error": str(e)}
+    
+    try:
+        from app.services.answer_cache import answer_cache
+        stats["answer_cache"] = answer_cache.get_stats() if answer_cache else {"enabled": False}
+    except Exception as e:
+        stats["answer_cache"] = {"error": str(e)}
+    
+    try:
+        from app.services.search import search_service
+        from app.services.rag import rag_service
+        stats["single_flight"] = {
+            flight.name: flight.get_stats()
+            for flight in (
+                search_service.single_flight, rag_service.single_flight, rag_service.stream_single_flight
+            )
+            if flight is not None
+        } or {"enabled": False}
+    except Exception as e:
+        stats["single_flight"] = {"error": str(e)}
+    
+    try:
+        from config import settings
+        from app.services.query_expansion import query_expander
+        stats["multi_query"] = {"enabled": settings.multi_query_enabled, **query_expander.get_stats()}
+    except Exception as e:
+        stats["multi_query"] = {"error": str(e)}
+    
+    return stats
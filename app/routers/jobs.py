@@ -0,0 +1,122 @@
+import json
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from config import settings
+from app.models.schemas import ChatJobItem, ChatJobStatus, ChatJobListResponse
+from app.services.chat_jobs import chat_job_manager
+
+router = APIRouter(prefix="/chat/jobs", tags=["chat-jobs"])
+
+
+def _parse_jsonl(content: bytes) -> List[Dict[str, Any]]:
+    """JSONL（1行 = 1会話）を検証してジョブの会話リストに変換"""
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=422, detail="File must be UTF-8 encoded JSONL")
+
+    items = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = ChatJobItem(**json.loads(line))
+        except (json.JSONDecodeError, TypeError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=f"Line {line_number}: {str(e)}")
+        if not any(message.role == "user" for message in item.messages):
+            raise HTTPException(status_code=422, detail=f"Line {line_number}: No user message found")
+        items.append({
+            "id": item.id or str(line_number),
+            "messages": [message.model_dump() for message in item.messages],
+            "max_context_docs": item.max_context_docs
+        })
+
+    if not items:
+        raise HTTPException(status_code=422, detail="File contains no conversations")
+    if len(items) > settings.chat_job_max_items:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many conversations: {len(items)} (max {settings.chat_job_max_items})"
+        )
+    return items
+
+
+def _get_job_or_404(job: Optional[Dict[str, Any]]) -> ChatJobStatus:
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ChatJobStatus(**job)
+
+
+@router.post("", response_model=ChatJobStatus, status_code=202)
+async def submit_chat_job(
+    file: UploadFile = File(..., description="JSONL: one {\"id\", \"messages\", \"max_context_docs\"} object per line"),
+    max_context_docs: int = Form(default=3),
+    rerank: Optional[bool] = Form(default=None),
+    use_cache: bool = Form(default=True)
+):
+    """会話のJSONLファイルをバッチジョブとして投入（バックグラウンドで処理し、進捗は GET /chat/jobs/{job_id} で確認）"""
+    items = _parse_jsonl(await file.read())
+
+    try:
+        job_id = await chat_job_manager.submit(items, {
+            "max_context_docs": max_context_docs,
+            "rerank": rerank,
+            "use_cache": use_cache
+        })
+        return _get_job_or_404(await chat_job_manager.get_job(job_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("", response_model=ChatJobListResponse)
+async def list_chat_jobs(limit: int = 50):
+    """ジョブの一覧（新しい順）"""
+    jobs = await chat_job_manager.list_jobs(limit)
+    return ChatJobListResponse(
+        jobs=[ChatJobStatus(**job) for job in jobs],
+        worker=chat_job_manager.get_stats()
+    )
+
+
+@router.get("/{job_id}", response_model=ChatJobStatus)
+async def get_chat_job(job_id: str):
+    """ジョブの状態と進捗"""
+    return _get_job_or_404(await chat_job_manager.get_job(job_id))
+
+
+@router.post("/{job_id}/cancel", response_model=ChatJobStatus)
+async def cancel_chat_job(job_id: str):
+    """ジョブをキャンセル（処理中の会話の完了後に停止し、未処理の会話は resume で再開できる）"""
+    return _get_job_or_404(await chat_job_manager.cancel(job_id))
+
+
+@router.post("/{job_id}/resume", response_model=ChatJobStatus)
+async def resume_chat_job(job_id: str, retry_failed: bool = False):
+    """キャンセル・中断したジョブを続きから再開（retry_failed=true の場合は失敗した会話も再処理）"""
+    return _get_job_or_404(await chat_job_manager.resume(job_id, retry_failed=retry_failed))
+
+
+@router.get("/{job_id}/results")
+async def download_chat_job_results(job_id: str):
+    """処理済みの会話の結果をJSONLでダウンロード（処理中のジョブでは完了した分のみ）"""
+    _get_job_or_404(await chat_job_manager.get_job(job_id))
+
+    def result_lines():
+        for record in chat_job_manager.store.iter_results(job_id):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        result_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-job-{job_id}.jsonl"'}
+    )
+
+
+@router.delete("/{job_id}")
+async def delete_chat_job(job_id: str):
+    """ジョブと結果を削除"""
+    if not await chat_job_manager.delete(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "deleted": True}
@@ -1,29 +1,38 @@
+from typing import Any, Dict
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import SearchRequest, SearchResponse, SearchResult, DocumentMetadata
+from config import settings
+from app.models.schemas import (
+    SearchRequest, SearchResponse, BatchSearchRequest, BatchSearchResponse, BatchSearchItem,
+    to_search_results
+)
 from app.services.search import search_service
+from app.services.concurrency_limiter import UpstreamOverloaded
 
 router = APIRouter(prefix="/search", tags=["search"])
 
 
+def _search_kwargs(request: SearchRequest) -> Dict[str, Any]:
+    """リクエストを search_documents の引数に変換"""
+    return {
+        "query": request.query,
+        "n_results": request.max_results,
+        "mode": request.mode,
+        "filters": request.filters.model_dump(exclude_none=True) if request.filters else None,
+        "namespaces": request.namespaces,
+        "expand_to_parent": request.expand_to_parent,
+        "multi_query": request.multi_query
+    }
+
+
 @router.post("/", response_model=SearchResponse)
 async def search_documents(request: SearchRequest):
     """法律文書を検索"""
     try:
         # 検索実行
-        results = await search_service.search_documents(
-            query=request.query,
-            n_results=request.max_results
-        )
+        results = await search_service.search_documents(**_search_kwargs(request))
         
         # レスポンス形式に変換
-        search_results = []
-        for result in results:
-            search_result = SearchResult(
-                document=result["document"],
-                similarity_score=result["similarity_score"],
-                metadata=DocumentMetadata(**result["metadata"])
-            )
-            search_results.append(search_result)
+        search_results = to_search_results(results)
         
         return SearchResponse(
             query=request.query,
@@ -31,5 +40,54 @@ async def search_documents(request: SearchRequest):
             total_results=len(search_results)
         )
         
+    except UpstreamOverloaded:
+        # 503 + Retry-After（main.py の例外ハンドラ）
+        raise
+    except ValueError as e:
+        # 検索モード・フィルタの指定誤り
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/batch", response_model=BatchSearchResponse)
+async def search_documents_batch(request: BatchSearchRequest):
+    """複数クエリをまとめて検索（埋め込みは1回のバッチ呼び出し、失敗したクエリは error を返す）"""
+    if not request.queries:
+        raise HTTPException(status_code=422, detail="Queries array cannot be empty")
+    if len(request.queries) > settings.search_batch_max_queries:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many queries: {len(request.queries)} (max {settings.search_batch_max_queries})"
+        )
+    
+    try:
+        outcomes = await search_service.search_batch([_search_kwargs(query) for query in request.queries])
+        
+        items = []
+        for query, outcome in zip(request.queries, outcomes):
+            if "error" in outcome:
+                items.append(BatchSearchItem(query=query.query, error=outcome["error"]))
+                continue
+            try:
+                search_results = to_search_results(outcome["results"])
+            except Exception as e:
+                items.append(BatchSearchItem(query=query.query, error=str(e)))
+                continue
+            items.append(BatchSearchItem(
+                query=query.query,
+                results=search_results,
+                total_results=len(search_results)
+            ))
+        
+        return BatchSearchResponse(
+            results=items,
+            total_queries=len(items),
+            failed_queries=sum(1 for item in items if item.error is not None)
+        )
+        
+    except UpstreamOverloaded:
+        # まとめて行う埋め込みが遮断された場合は 503 + Retry-After（main.py の例外ハンドラ）
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
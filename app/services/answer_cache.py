@@ -0,0 +1,54 @@
+"""
+回答キャッシュ
+
+(正規化した会話, モデル, プロンプトに含めた条文のID・改訂) をキーに生成済みの回答を保持し、
+同じ質問へのOpenRouter呼び出しを省略する
+- 条文の revisionID（ない場合は本文のハッシュ）をキーに含めるため、条文が改訂されると
+  別のキーになり、古い条文に基づく回答は使われない（古いエントリはLRU・TTLで破棄）
+- LRU+TTL・メモリ使用量の上限は ResultCache と共通
+"""
+
+import hashlib
+import json
+from typing import Dict, Any, List, Optional
+
+from config import settings
+from .embedding_cache import normalize_query
+from .result_cache import ResultCache
+
+
+def document_revision(document: Dict[str, Any]) -> str:
+    """条文の改訂を表す値（revisionID、ない場合は本文のハッシュ）"""
+    revision = document.get("metadata", {}).get("revisionID")
+    if revision:
+        return str(revision)
+    return hashlib.sha256(document.get("document", "").encode("utf-8")).hexdigest()[:16]
+
+
+def make_answer_cache_key(
+    messages: List[Dict[str, str]],
+    documents: List[Dict[str, Any]],
+    model: str
+) -> str:
+    """会話・条文・モデルからキャッシュキーを作成（条文はプロンプトでの順序どおり）"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": [[message["role"], normalize_query(message["content"])] for message in messages],
+            "documents": [[document.get("id"), document_revision(document)] for document in documents]
+        },
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# シングルトンインスタンス（無効の場合はNone）
+answer_cache: Optional[ResultCache] = (
+    ResultCache(
+        max_entries=settings.answer_cache_max_entries,
+        max_bytes=settings.answer_cache_max_bytes,
+        ttl_seconds=settings.answer_cache_ttl_seconds
+    )
+    if settings.answer_cache_enabled
+    else None
+)
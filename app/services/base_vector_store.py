@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Callable, Optional
+import asyncio
+import heapq
+from config import settings
+from .concurrency_limiter import AdaptiveLimiter
+from .result_cache import index_revision
+
+
+_RESULT_KEYS = ("documents", "metadatas", "distances", "ids")
+
+
+def merge_search_results(results: List[Dict[str, Any]], n_results: int) -> Dict[str, Any]:
+    """複数namespaceの検索結果を距離の小さい順にヒープでマージし、上位n_results件を返す"""
+    entries = (
+        (distance, index, position)
+        for index, result in enumerate(results)
+        for position, distance in enumerate(result["distances"][0] if result["distances"] else [])
+    )
+    top = heapq.nsmallest(n_results, entries)
+    return {
+        key: [[results[index][key][0][position] for _, index, position in top]]
+        for key in _RESULT_KEYS
+    }
+
+
+class BaseVectorStore:
+    """ベクターストアの共通インターフェース
+    
+    各バックエンドは add_documents / search / get_collection_info を実装する。
+    search は ChromaDB形式（documents / metadatas / distances / ids）の辞書を返す。
+    filters は metadata_filter.normalize_filters で正規化済みの条件（Noneは全件）。
+    namespace は文書の区画（法令分類・テナントなど）で、"" はデフォルトnamespace
+    """
+    
+    # 同時実行数の制限・統計で使う名前
+    upstream_name = "vector_store"
+    
+    def __init__(
+        self,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limiter: Optional[AdaptiveLimiter] = None
+    ):
+        # 同期APIをイベントループ外で実行するための専用スレッドプール（指定時は共有し、closeで終了しない）
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=settings.vector_store_max_workers,
+            thread_name_prefix="vector-store"
+        )
+        # 同時に実行する検索数の上限（過負荷に応じて調整）
+        self.limiter = limiter or AdaptiveLimiter(self.upstream_name, settings.vector_store_max_concurrency)
+        # 文書追加時に呼び出すキャッシュ無効化コールバック
+        self._invalidation_callbacks: List[Callable[[], None]] = []
+    
+    def add_invalidation_callback(self, callback: Callable[[], None]):
+        """文書追加時に呼び出すコールバックを登録"""
+        self._invalidation_callbacks.append(callback)
+    
+    def _notify_updated(self):
+        # 別プロセスのキャッシュにも更新を伝えるため、ディスク上のリビジョンを更新する
+        index_revision.bump()
+        for callback in self._invalidation_callbacks:
+            callback()
+    
+    def add_documents(
+        self, 
+        documents: List[str], 
+        metadatas: List[Dict[str, Any]], 
+        ids: List[str],
+        embeddings: List[List[float]],
+        namespace: str = ""
+    ):
+        """文書をベクターストアに追加"""
+        raise NotImplementedError
+    
+    def delete_documents(self, ids: List[str], namespace: str = ""):
+        """文書をベクターストアから削除"""
+        raise NotImplementedError
+    
+    def search(
+        self, 
+        query_embedding: List[float], 
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ) -> Dict[str, Any]:
+        """類似文書を検索"""
+        raise NotImplementedError
+    
+    def get_collection_info(self) -> Dict[str, Any]:
+        """インデックス情報を取得"""
+        raise NotImplementedError
+    
+    def list_namespaces(self) -> List[str]:
+        """文書が入っているnamespaceの一覧"""
+        return [""]
+    
+    async def async_search(
+        self, 
+        query_embedding: List[float], 
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ) -> Dict[str, Any]:
+        """類似文書を検索（イベントループをブロックしない）"""
+        async with self.limiter.acquire():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                partial(
+                    self.search,
+                    query_embedding=query_embedding,
+                    n_results=n_results,
+                    filters=filters,
+                    namespace=namespace
+                )
+            )
+    
+    async def async_search_namespaces(
+        self, 
+        query_embedding: List[float], 
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """複数のnamespaceを並行して検索し、上位n_results件にマージ
+        
+        namespacesがNoneの場合は文書が入っている全namespaceを対象にする
+        """
+        if namespaces is None:
+            loop = asyncio.get_running_loop()
+            namespaces = await loop.run_in_executor(self._executor, self.list_namespaces)
+        if not namespaces:
+            return {key: [[]] for key in _RESULT_KEYS}
+        if len(namespaces) == 1:
+            return await self.async_search(query_embedding, n_results, filters, namespaces[0])
+        
+        results = await asyncio.gather(*[
+            self.async_search(query_embedding, n_results, filters, namespace)
+            for namespace in namespaces
+        ])
+        return merge_search_results(results, n_results)
+    
+    async def async_add_documents(
+        self, 
+        documents: List[str], 
+        metadatas: List[Dict[str, Any]], 
+        ids: List[str],
+        embeddings: List[List[float]],
+        namespace: str = ""
+    ):
+        """文書をベクターストアに追加（イベントループをブロックしない）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(
+                self.add_documents,
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings,
+                namespace=namespace
+            )
+        )
+    
+    async def async_delete_documents(self, ids: List[str], namespace: str = ""):
+        """文書を削除（イベントループをブロックしない）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(self.delete_documents, ids=ids, namespace=namespace)
+        )
+    
+    def close(self):
+        """スレッドプールを終了"""
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
@@ -1,10 +1,29 @@
 import httpx
 import json
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 from config import settings
 from app.utils.railway_logger import railway_logger
+from .context_packer import ContextPacker, PackedPrompt, PreparedHistory
+from .answer_cache import answer_cache, make_answer_cache_key
+from .concurrency_limiter import AdaptiveLimiter, UpstreamOverloaded
+
+
+SYSTEM_PROMPT_TEMPLATE = """あなたは日本の法律に精通した専門家です。正確で分かりやすい法的回答を提供してください。
+
+【重要】必ず日本語で回答してください。
+
+以下の関連条文を参考に回答してください：
+{context_text}
+
+回答指針：
+1. 関連条文を根拠として明示してください
+2. 法律用語は分かりやすく説明してください
+3. 具体的で実践的なアドバイスを含めてください
+4. 必要に応じて注意事項や例外についても言及してください"""
+
+NO_ANSWER_MESSAGE = "申し訳ございませんが、回答を生成できませんでした。"
 
 
 class ChatService:
@@ -20,45 +39,53 @@ class ChatService:
             "Content-Type": "application/json",
             "X-Title": "Legal AI RAG System"
         }
+        # アプリ全体で共有するHTTPクライアント（接続を再利用する）
+        self._client: Optional[httpx.AsyncClient] = None
+        # 同時に発行するリクエスト数の上限（過負荷に応じて調整）
+        self.limiter = AdaptiveLimiter("openrouter", settings.openrouter_max_concurrency)
+        # プロンプトのトークン予算管理（無効の場合はNone）
+        self.context_packer = ContextPacker() if settings.context_packing_enabled else None
+        # 生成済み回答のキャッシュ（無効の場合はNone）
+        self.answer_cache = answer_cache
+    
+    async def startup(self):
+        """共有HTTPクライアントを作成（アプリ起動時に呼び出す）"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.openrouter_timeout,
+                http2=settings.openrouter_http2,
+                limits=httpx.Limits(
+                    max_connections=settings.openrouter_max_connections,
+                    max_keepalive_connections=settings.openrouter_max_keepalive_connections,
+                    keepalive_expiry=settings.openrouter_keepalive_expiry
+                )
+            )
+    
+    async def shutdown(self):
+        """共有HTTPクライアントを閉じる（アプリ終了時に呼び出す）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """共有HTTPクライアントを取得（未作成の場合は作成）"""
+        if self._client is None:
+            await self.startup()
+        return self._client
     
     async def generate_response(
         self, 
         messages: List, 
-        context_documents: List[Dict[str, Any]]
+        context_documents: List[Dict[str, Any]],
+        prompt: Optional[PackedPrompt] = None,
+        cache_key: Optional[str] = None
     ) -> str:
-        """会話履歴と関連条文からAI回答を生成"""
+        """会話履歴と関連条文からAI回答を生成（promptは build_prompt で作成済みのもの）
         
-        # コンテキスト文書を整形
-        context_text = self._format_context(context_documents)
+        cache_key を指定した場合、生成した回答を回答キャッシュに保存する
+        """
         
-        # 会話履歴をOpenRouter形式に変換
-        conversation_messages = []
-        
-        # システムプロンプトを追加
-        system_prompt = f"""あなたは日本の法律に精通した専門家です。正確で分かりやすい法的回答を提供してください。
-
-【重要】必ず日本語で回答してください。
-
-以下の関連条文を参考に回答してください：
-{context_text}
-
-回答指針：
-1. 関連条文を根拠として明示してください
-2. 法律用語は分かりやすく説明してください
-3. 具体的で実践的なアドバイスを含めてください
-4. 必要に応じて注意事項や例外についても言及してください"""
-
-        conversation_messages.append({
-            "role": "system",
-            "content": system_prompt
-        })
-        
-        # 会話履歴を追加
-        for message in messages:
-            conversation_messages.append({
-                "role": message.role,
-                "content": message.content
-            })
+        conversation_messages = (prompt or self.build_prompt(messages, context_documents)).messages
         
         # OpenRouterリクエスト準備とログ（Railway最適化）
         openrouter_request = {
@@ -78,58 +105,264 @@ class ChatService:
 
         # OpenRouter APIを呼び出し
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = await self._get_client()
+            async with self.limiter.acquire() as slot:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
                     headers=self.headers,
                     json=openrouter_request
                 )
+                slot.record_status(response.status_code)
+            
+            if response.status_code == 200:
+                result = response.json()
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    # OpenRouterレスポンスログ（Railway最適化）
-                    response_time_ms = (time.time() - start_time) * 1000
-                    message = result["choices"][0]["message"]
-                    content = message.get("content", "")
-                    
-                    # GPT-5の場合、reasoningフィールドから回答を取得
-                    if not content and "reasoning" in message:
-                        content = message["reasoning"]
-                    
-                    # reasoning_detailsのsummaryからも回答を取得
-                    if not content and "reasoning_details" in message:
-                        for detail in message["reasoning_details"]:
-                            if detail.get("type") == "reasoning.summary":
-                                content = detail.get("summary", "")
-                                break
-                    
-                    final_content = content or "申し訳ございませんが、回答を生成できませんでした。"
-                    
-                    railway_logger.log_openrouter_response(
-                        model=result.get("model", self.model),
-                        response_length=len(final_content),
-                        response_time_ms=response_time_ms,
-                        usage=result.get("usage", {})
-                    )
-                    
-                    return final_content
-                else:
-                    # エラーレスポンス（Railway最適化）
+                # OpenRouterレスポンスログ（Railway最適化）
+                response_time_ms = (time.time() - start_time) * 1000
+                content = self._extract_content(result["choices"][0]["message"])
+                
+                final_content = content or NO_ANSWER_MESSAGE
+                
+                railway_logger.log_openrouter_response(
+                    model=result.get("model", self.model),
+                    response_length=len(final_content),
+                    response_time_ms=response_time_ms,
+                    usage=result.get("usage", {})
+                )
+                self._store_answer(cache_key, final_content, result.get("model", self.model), result.get("usage", {}))
+                
+                return final_content
+            else:
+                # エラーレスポンス（Railway最適化）
+                railway_logger.log_error(
+                    error_type="openrouter_api_error",
+                    error_message=f"OpenRouter API error: {response.status_code}",
+                    error_details={
+                        "status_code": response.status_code,
+                        "error_text": response.text,
+                        "response_time_ms": (time.time() - start_time) * 1000
+                    }
+                )
+                
+                raise Exception(f"OpenRouter API error: {response.status_code} - {response.text}")
+                
+        except UpstreamOverloaded:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to generate chat response: {str(e)}")
+    
+    def prepare_history(self, messages: List) -> Optional[PreparedHistory]:
+        """会話履歴をトークン予算内に整理（関連条文に依存しないため検索と並行して実行できる。予算管理が無効の場合はNone）"""
+        if self.context_packer is None:
+            return None
+        return self.context_packer.prepare_history(
+            [{"role": message.role, "content": message.content} for message in messages]
+        )
+    
+    def answer_cache_key(self, messages: List, prompt: PackedPrompt) -> Optional[str]:
+        """会話とプロンプトに含めた条文（ID・改訂）から回答キャッシュのキーを作成（キャッシュ無効時はNone）"""
+        if self.answer_cache is None:
+            return None
+        return make_answer_cache_key(
+            [{"role": message.role, "content": message.content} for message in messages],
+            prompt.documents,
+            self.model
+        )
+    
+    def get_cached_answer(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みの回答（{"content", "model", "usage"}）を取得"""
+        if cache_key is None or self.answer_cache is None:
+            return None
+        return self.answer_cache.get(cache_key)
+    
+    def _store_answer(self, cache_key: Optional[str], content: str, model: str, usage: Dict[str, Any]):
+        # 回答を生成できなかった場合は保存しない
+        if cache_key is None or self.answer_cache is None or not content or content == NO_ANSWER_MESSAGE:
+            return
+        self.answer_cache.set(cache_key, {"content": content, "model": model, "usage": usage})
+    
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float = 0.3,
+        model: Optional[str] = None
+    ) -> str:
+        """RAGを介さない短い補助生成（クエリ拡張など）。回答が空の場合は空文字を返す"""
+        try:
+            client = await self._get_client()
+            async with self.limiter.acquire() as slot:
+                response = await client.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self.headers,
+                    json={
+                        "model": model or self.model,
+                        "messages": messages,
+                        "temperature": temperature,
+                        "max_tokens": max_tokens
+                    }
+                )
+                slot.record_status(response.status_code)
+            if response.status_code != 200:
+                raise Exception(f"OpenRouter API error: {response.status_code} - {response.text}")
+            return self._extract_content(response.json()["choices"][0]["message"])
+        except UpstreamOverloaded:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to generate completion: {str(e)}")
+    
+    def _extract_content(self, message: Dict[str, Any]) -> str:
+        """レスポンスのメッセージから回答を取得"""
+        content = message.get("content", "")
+        
+        # GPT-5の場合、reasoningフィールドから回答を取得
+        if not content and "reasoning" in message:
+            content = message["reasoning"]
+        
+        # reasoning_detailsのsummaryからも回答を取得
+        if not content and "reasoning_details" in message:
+            for detail in message["reasoning_details"]:
+                if detail.get("type") == "reasoning.summary":
+                    content = detail.get("summary", "")
+                    break
+        
+        return content or ""
+    
+    def build_prompt(
+        self, 
+        messages: List, 
+        context_documents: List[Dict[str, Any]],
+        history: Optional[PreparedHistory] = None
+    ) -> PackedPrompt:
+        """システムプロンプト・関連条文・会話履歴をトークン予算内に収めたプロンプトを作成
+        
+        history は prepare_history で整理済みの会話履歴
+        """
+        history_messages = [{"role": message.role, "content": message.content} for message in messages]
+        
+        if self.context_packer is None:
+            conversation_messages = [{
+                "role": "system",
+                "content": SYSTEM_PROMPT_TEMPLATE.format(context_text=self._format_context(context_documents))
+            }] + history_messages
+            return PackedPrompt(
+                messages=conversation_messages, documents=context_documents, source_documents=context_documents
+            )
+        
+        prompt = self.context_packer.pack(
+            SYSTEM_PROMPT_TEMPLATE, history_messages, context_documents, self._format_context, history=history
+        )
+        railway_logger.log_system_event("context_packed", "Prompt context packed", **prompt.stats)
+        return prompt
+    
+    async def stream_response(
+        self, 
+        messages: List, 
+        context_documents: List[Dict[str, Any]],
+        prompt: Optional[PackedPrompt] = None,
+        cache_key: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """会話履歴と関連条文からAI回答をストリーミング生成
+        
+        {"type": "token", "content": ...} を逐次返し、最後に
+        {"type": "done", "usage": ..., "model": ..., "response_time_ms": ...} を返す。
+        cache_key を指定した場合、最後まで生成した回答を回答キャッシュに保存する
+        """
+        conversation_messages = (prompt or self.build_prompt(messages, context_documents)).messages
+        
+        openrouter_request = {
+            "model": self.model,
+            "messages": conversation_messages,
+            "temperature": 0.3,
+            "max_tokens": 1500,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        
+        start_time = time.time()
+        railway_logger.log_openrouter_request(
+            model=self.model,
+            messages_count=len(conversation_messages),
+            temperature=0.3,
+            max_tokens=1500
+        )
+        
+        client = await self._get_client()
+        # ストリーミングは生成完了まで実行枠を使う
+        async with self.limiter.acquire() as slot:
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                json=openrouter_request
+            ) as response:
+                slot.record_status(response.status_code)
+                if response.status_code != 200:
+                    error_text = (await response.aread()).decode("utf-8", errors="replace")
                     railway_logger.log_error(
                         error_type="openrouter_api_error",
                         error_message=f"OpenRouter API error: {response.status_code}",
                         error_details={
                             "status_code": response.status_code,
-                            "error_text": response.text,
+                            "error_text": error_text,
                             "response_time_ms": (time.time() - start_time) * 1000
                         }
                     )
+                    raise Exception(f"OpenRouter API error: {response.status_code} - {error_text}")
+                
+                model = self.model
+                usage: Dict[str, Any] = {}
+                content_parts: List[str] = []
+                reasoning_parts: List[str] = []
+                first_token_ms: Optional[float] = None
+                
+                async for line in response.aiter_lines():
+                    # SSEのコメント行（": OPENROUTER PROCESSING"）や空行は無視
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
                     
-                    raise Exception(f"OpenRouter API error: {response.status_code} - {response.text}")
+                    chunk = json.loads(data)
+                    model = chunk.get("model", model)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
                     
-        except Exception as e:
-            raise Exception(f"Failed to generate chat response: {str(e)}")
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta", {})
+                        if delta.get("content"):
+                            if first_token_ms is None:
+                                first_token_ms = (time.time() - start_time) * 1000
+                            content_parts.append(delta["content"])
+                            yield {"type": "token", "content": delta["content"]}
+                        elif delta.get("reasoning"):
+                            reasoning_parts.append(delta["reasoning"])
+                
+                # GPT-5の場合、contentが空でreasoningのみ返ることがある
+                if not content_parts:
+                    fallback = "".join(reasoning_parts) or NO_ANSWER_MESSAGE
+                    first_token_ms = (time.time() - start_time) * 1000
+                    content_parts.append(fallback)
+                    yield {"type": "token", "content": fallback}
+                content = "".join(content_parts)
+                
+                response_time_ms = (time.time() - start_time) * 1000
+                railway_logger.log_openrouter_response(
+                    model=model,
+                    response_length=len(content),
+                    response_time_ms=response_time_ms,
+                    usage=usage
+                )
+                self._store_answer(cache_key, content, model, usage)
+                
+                yield {
+                    "type": "done",
+                    "model": model,
+                    "usage": usage,
+                    "first_token_ms": first_token_ms,
+                    "response_time_ms": response_time_ms
+                }
     
     def _format_context(self, documents: List[Dict[str, Any]]) -> str:
         """関連条文を読みやすい形式に整形"""
@@ -146,6 +379,11 @@ class ChatService:
             
             # 条文番号の表示形式を整理
             article_display = f"第{article_num}条" if article_num > 0 else article_title
+            # 項・号単位のチャンク
+            if metadata.get("ParagraphNum"):
+                article_display += f"第{metadata['ParagraphNum']}項"
+            if metadata.get("ItemNum"):
+                article_display += f"第{metadata['ItemNum']}号"
             
             context_parts.append(
                 f"【参考条文{i}】\n"
@@ -0,0 +1,516 @@
+"""
+オフラインのバッチチャットジョブ
+
+法改正の影響レポート等、対話的なレイテンシを必要としない大量の質問を /chat から切り離し、
+RAGService.chat_with_rag を使ってバックグラウンドで処理する
+- 投入された会話（JSONLの1行 = 1会話）と処理状況・結果はSQLiteファイルに保存する
+- ジョブは投入順に1件ずつ処理し、ジョブ内の会話は chat_job_concurrency 件まで並行して処理する
+- 会話の処理開始は chat_job_rate_per_second 件/秒までに制限する（上流APIと対話的な利用を保護）
+- 同時に処理する会話はジョブ専用の適応的な枠（chat_job_max_upstream_concurrency、OpenRouterの上限未満）に収め、
+  上流APIが過負荷の間は枠を下げて、対話的な /chat が 503 になるのを防ぐ
+- キャンセルすると処理中の会話の完了後に停止し、未処理の会話は pending のまま残る（resume で続きから再開）
+- 処理中にプロセスが終了した場合も、起動時に未完了のジョブを続きから再開する
+- SQLiteの読み書きはスレッドで実行し、対話的なリクエストを処理するイベントループを止めない
+
+ジョブの状態: queued → running → completed / cancelled（interrupted: 起動時に再開しない設定で中断されたもの）
+会話の状態: pending → running → done / failed
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator
+
+from config import settings
+from app.models.schemas import Message
+from app.utils.railway_logger import railway_logger
+from .concurrency_limiter import AdaptiveLimiter, UpstreamOverloaded
+
+
+JOB_ACTIVE_STATUSES = ("queued", "running")
+_RESULT_PAGE_SIZE = 500
+# ジョブの枠の待ち時間の上限（対話的なリクエストと違い、枠が空くまで待ってよい）
+_UPSTREAM_SLOT_MAX_WAIT_MS = 3600 * 1000
+
+
+class ChatJobStore:
+    """ジョブ・会話・結果をSQLiteファイルに保存"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, options TEXT NOT NULL, "
+            "total INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, item_id TEXT NOT NULL, "
+            "input TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (job_id, seq))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items(job_id, status, seq)"
+        )
+        self._lock = threading.Lock()
+
+    def create_job(self, items: List[Dict[str, Any]], options: Dict[str, Any]) -> str:
+        """ジョブと会話を保存してジョブIDを返す"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, status, options, total, created_at, updated_at) "
+                    "VALUES (?, 'queued', ?, ?, ?, ?)",
+                    (job_id, json.dumps(options), len(items), now, now)
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, seq, item_id, input, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'pending', ?)",
+                    [
+                        (job_id, seq, item["id"], json.dumps(item, ensure_ascii=False), now)
+                        for seq, item in enumerate(items)
+                    ]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態と会話の状態ごとの件数を返す（存在しない場合はNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, options, total, created_at, updated_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        return self._job_record(row, counts)
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """新しい順にジョブを返す"""
+        with self._lock:
+            job_ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()]
+        return [job for job in (self.get_job(job_id) for job_id in job_ids) if job is not None]
+
+    def job_ids_with_status(self, statuses: tuple) -> List[str]:
+        """指定した状態のジョブIDを投入順に返す"""
+        placeholders = ",".join("?" * len(statuses))
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at ASC",
+                statuses
+            ).fetchall()]
+
+    def set_job_status(self, job_id: str, status: str):
+        now = time.time()
+        with self._lock:
+            if status == "running":
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, started_at = COALESCE(started_at, ?), "
+                    "finished_at = NULL WHERE id = ?",
+                    (status, now, now, job_id)
+                )
+            elif status in JOB_ACTIVE_STATUSES:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, finished_at = NULL WHERE id = ?",
+                    (status, now, job_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                    (status, now, now, job_id)
+                )
+
+    def claim_next_item(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """未処理の会話を1件取り出して running にする（残っていない場合はNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq, input, attempts FROM job_items "
+                "WHERE job_id = ? AND status = 'pending' ORDER BY seq LIMIT 1", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            seq, item_input, attempts = row
+            self._conn.execute(
+                "UPDATE job_items SET status = 'running', attempts = ?, updated_at = ? "
+                "WHERE job_id = ? AND seq = ?",
+                (attempts + 1, time.time(), job_id, seq)
+            )
+        return {"seq": seq, "input": json.loads(item_input), "attempts": attempts + 1}
+
+    def complete_item(self, job_id: str, seq: int, result: Dict[str, Any]):
+        self._finish_item(job_id, seq, "done", json.dumps(result, ensure_ascii=False), None)
+
+    def fail_item(self, job_id: str, seq: int, error: str):
+        self._finish_item(job_id, seq, "failed", None, error)
+
+    def release_item(self, job_id: str, seq: int):
+        """処理中の会話を未処理に戻す（キャンセル・終了時）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = 'pending', attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE job_id = ? AND seq = ? AND status = 'running'",
+                (time.time(), job_id, seq)
+            )
+
+    def reset_items(self, job_id: str, statuses: tuple) -> int:
+        """指定した状態の会話を未処理に戻し、件数を返す"""
+        placeholders = ",".join("?" * len(statuses))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE job_items SET status = 'pending', updated_at = ? "
+                f"WHERE job_id = ? AND status IN ({placeholders})",
+                (time.time(), job_id, *statuses)
+            )
+            return cursor.rowcount
+
+    def iter_results(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """処理済み（done / failed）の会話の結果を投入順に返す"""
+        last_seq = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, item_id, status, result, error, attempts FROM job_items "
+                    "WHERE job_id = ? AND seq > ? AND status IN ('done', 'failed') "
+                    "ORDER BY seq LIMIT ?",
+                    (job_id, last_seq, _RESULT_PAGE_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, item_id, status, result, error, attempts in rows:
+                record: Dict[str, Any] = {"id": item_id, "status": status, "attempts": attempts}
+                if status == "done":
+                    record.update(json.loads(result))
+                else:
+                    record["error"] = error
+                yield record
+            last_seq = rows[-1][0]
+
+    def delete_job(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _finish_item(self, job_id: str, seq: int, status: str, result: Optional[str], error: Optional[str]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND seq = ?",
+                (status, result, error, now, job_id, seq)
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    @staticmethod
+    def _job_record(row: tuple, counts: Dict[str, int]) -> Dict[str, Any]:
+        job_id, status, options, total, created_at, updated_at, started_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "options": json.loads(options),
+            "total": total,
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "completed": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "started_at": started_at,
+            "finished_at": finished_at
+        }
+
+
+class RateLimiter:
+    """処理開始の間隔を 1 / rate_per_second 秒以上に保つ（0以下の場合は制限しない）"""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.interval <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ChatJobManager:
+    """ジョブを投入順に処理するバックグラウンドワーカー"""
+
+    def __init__(
+        self,
+        store: ChatJobStore,
+        concurrency: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.store = store
+        self.concurrency = concurrency or settings.chat_job_concurrency
+        self.rate_limiter = RateLimiter(
+            rate_per_second if rate_per_second is not None else settings.chat_job_rate_per_second
+        )
+        self.max_retries = max_retries if max_retries is not None else settings.chat_job_max_retries
+        # ジョブ専用の上流APIの枠（対話的な利用の分を残すため OpenRouter の上限未満にする）
+        self.upstream_limiter = AdaptiveLimiter(
+            "chat_jobs",
+            min(settings.chat_job_max_upstream_concurrency, max(settings.openrouter_max_concurrency - 1, 1)),
+            max_queue=self.concurrency,
+            max_wait_ms=_UPSTREAM_SLOT_MAX_WAIT_MS
+        )
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._current_job: Optional[str] = None
+        self._cancelled: set = set()
+
+        # 発生状況
+        self.items_processed = 0
+        self.items_failed = 0
+        self.retries = 0
+
+    async def startup(self, resume: Optional[bool] = None):
+        """ワーカーを起動し、前回終了時に未完了だったジョブを続きから再開する"""
+        if self._dispatcher is not None:
+            return
+        resume = settings.chat_jobs_resume_on_startup if resume is None else resume
+        self._queue = asyncio.Queue()
+        for job_id in await self._call(self.store.job_ids_with_status, JOB_ACTIVE_STATUSES):
+            await self._call(self.store.reset_items, job_id, ("running",))
+            if resume:
+                await self._call(self.store.set_job_status, job_id, "queued")
+                self._queue.put_nowait(job_id)
+            else:
+                await self._call(self.store.set_job_status, job_id, "interrupted")
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        """ワーカーを停止（処理中の会話は未処理に戻し、ジョブは次回起動時に再開する）"""
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        self._queue = None
+
+    async def submit(self, items: List[Dict[str, Any]], options: Dict[str, Any]) -> str:
+        """会話のリストをジョブとして登録し、ジョブIDを返す"""
+        job_id = await self._call(self.store.create_job, items, options)
+        self._enqueue(job_id)
+        railway_logger.log_system_event(
+            "chat_job_submitted", f"Chat job submitted: {len(items)} conversations",
+            job_id=job_id, total=len(items)
+        )
+        return job_id
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブをキャンセル（処理中の会話は完了まで待ち、未処理の会話は pending のまま残す）"""
+        job = await self._call(self.store.get_job, job_id)
+        if job is None:
+            return None
+        if job["status"] in JOB_ACTIVE_STATUSES:
+            self._cancelled.add(job_id)
+            await self._call(self.store.set_job_status, job_id, "cancelled")
+            railway_logger.log_system_event("chat_job_cancelled", "Chat job cancelled", job_id=job_id)
+        return await self._call(self.store.get_job, job_id)
+
+    async def resume(self, job_id: str, retry_failed: bool = False) -> Optional[Dict[str, Any]]:
+        """キャンセル・中断・完了したジョブの未処理の会話（retry_failed=True の場合は失敗した会話も）を再開"""
+        job = await self._call(self.store.get_job, job_id)
+        if job is None:
+            return None
+        if job["status"] in JOB_ACTIVE_STATUSES:
+            return job
+        if retry_failed:
+            await self._call(self.store.reset_items, job_id, ("failed",))
+        self._cancelled.discard(job_id)
+        if self._current_job != job_id:
+            # キャンセル後の処理中の会話が残っている場合は、そのワーカーが続きを処理する
+            await self._call(self.store.reset_items, job_id, ("running",))
+        await self._call(self.store.set_job_status, job_id, "queued")
+        self._enqueue(job_id)
+        railway_logger.log_system_event("chat_job_resumed", "Chat job resumed", job_id=job_id)
+        return await self._call(self.store.get_job, job_id)
+
+    async def delete(self, job_id: str) -> bool:
+        """ジョブと結果を削除（処理中のジョブはキャンセルしてから削除する）"""
+        job = await self._call(self.store.get_job, job_id)
+        if job is None:
+            return False
+        if job["status"] in JOB_ACTIVE_STATUSES:
+            self._cancelled.add(job_id)
+        await self._call(self.store.delete_job, job_id)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "rate_per_second": 1.0 / self.rate_limiter.interval if self.rate_limiter.interval else None,
+            "upstream": self.upstream_limiter.get_stats(),
+            "running": self._dispatcher is not None,
+            "current_job": self._current_job,
+            "queued_jobs": self._queue.qsize() if self._queue else 0,
+            "items_processed": self.items_processed,
+            "items_failed": self.items_failed,
+            "retries": self.retries
+        }
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態と進捗（存在しない場合はNone）"""
+        return await self._call(self.store.get_job, job_id)
+
+    async def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """新しい順にジョブを返す"""
+        return await self._call(self.store.list_jobs, limit)
+
+    @staticmethod
+    async def _call(method, *args):
+        """SQLiteの読み書きをスレッドで実行（ディスクの待ちでイベントループを止めない）"""
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    def _enqueue(self, job_id: str):
+        # ワーカー未起動の場合は queued のまま保存され、起動時に再開される
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+
+    async def _dispatch(self):
+        while True:
+            job_id = await self._queue.get()
+            job = await self._call(self.store.get_job, job_id)
+            if job is None or job["status"] != "queued" or job_id in self._cancelled:
+                continue
+            self._current_job = job_id
+            try:
+                await self._run_job(job_id, job["options"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                railway_logger.log_error(
+                    error_type="chat_job_error",
+                    error_message=f"Chat job failed: {str(e)}",
+                    error_details={"job_id": job_id}
+                )
+            finally:
+                self._current_job = None
+
+    async def _run_job(self, job_id: str, options: Dict[str, Any]):
+        await self._call(self.store.set_job_status, job_id, "running")
+        railway_logger.log_system_event("chat_job_started", "Chat job started", job_id=job_id)
+        start_time = time.time()
+
+        await asyncio.gather(*[self._worker(job_id, options) for _ in range(self.concurrency)])
+
+        if job_id in self._cancelled:
+            self._cancelled.discard(job_id)
+            return
+        job = await self._call(self.store.get_job, job_id)
+        if job is None:
+            return
+        await self._call(self.store.set_job_status, job_id, "completed")
+        railway_logger.log_system_event(
+            "chat_job_completed", "Chat job completed",
+            job_id=job_id, completed=job["completed"], failed=job["failed"],
+            total_time_ms=(time.time() - start_time) * 1000
+        )
+
+    async def _worker(self, job_id: str, options: Dict[str, Any]):
+        """ジョブの未処理の会話がなくなる（またはキャンセルされる）まで1件ずつ処理"""
+        while job_id not in self._cancelled:
+            item = await self._call(self.store.claim_next_item, job_id)
+            if item is None:
+                return
+            try:
+                await self._process_item(job_id, item, options)
+            except asyncio.CancelledError:
+                # 停止中は待たずに戻す（キャンセル後の await は再度中断されうるため）
+                self.store.release_item(job_id, item["seq"])
+                raise
+
+    async def _process_item(self, job_id: str, item: Dict[str, Any], options: Dict[str, Any]):
+        # 遅延インポート（OpenRouter未設定の環境でもジョブの参照・結果取得はできるようにする）
+        from .rag import rag_service
+
+        item_input = item["input"]
+        messages = [Message(**message) for message in item_input["messages"]]
+        max_context_docs = item_input.get("max_context_docs") or options.get("max_context_docs", 3)
+
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            if job_id in self._cancelled:
+                await self._call(self.store.release_item, job_id, item["seq"])
+                return
+            try:
+                async with self.upstream_limiter.acquire() as slot:
+                    try:
+                        rag_result = await rag_service.chat_with_rag(
+                            messages=messages,
+                            max_context_docs=max_context_docs,
+                            rerank=options.get("rerank"),
+                            use_cache=options.get("use_cache", True)
+                        )
+                    except UpstreamOverloaded:
+                        # 対話的な利用と合わせて上流APIが混んでいるので、ジョブの枠を下げる
+                        slot.record_status(503)
+                        raise
+                break
+            except ValueError as e:
+                # 会話の内容の誤り（ユーザーメッセージなし等）は再試行しない
+                await self._fail(job_id, item["seq"], str(e))
+                return
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    await self._fail(job_id, item["seq"], str(e))
+                    return
+                attempt += 1
+                self.retries += 1
+                # 上流APIの過負荷（UpstreamOverloaded）の場合は Retry-After の目安まで待つ
+                await asyncio.sleep(max(min(2 ** attempt, 30), getattr(e, "retry_after", 0)))
+
+        # キャンセル後に完了した会話も、生成済みの回答を捨てずに保存する
+        await self._call(self.store.complete_item, job_id, item["seq"], {
+            "user_query": rag_result["user_query"],
+            "ai_response": rag_result["ai_response"],
+            "context_documents": rag_result["context_documents"],
+            "total_context_docs": rag_result["total_context_docs"],
+            "cached": rag_result["cached"]
+        })
+        self.items_processed += 1
+
+    async def _fail(self, job_id: str, seq: int, error: str):
+        await self._call(self.store.fail_item, job_id, seq, error)
+        self.items_processed += 1
+        self.items_failed += 1
+
+
+# シングルトンインスタンス
+chat_job_manager = ChatJobManager(ChatJobStore(settings.chat_jobs_path))
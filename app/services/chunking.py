@@ -0,0 +1,153 @@
+"""
+長い条文の項・号単位への分割（チャンク化）と親条文ストア
+
+条文全体を1ベクトルにすると、長い条文ほど埋め込みが薄まり、検索で当たった際にも
+プロンプトを大きく消費する。chunk_min_article_tokens 以上の条文は 条 → 項 → 号 の
+構造に沿って分割し、項（chunk_max_tokens を超える項は号）ごとに1ベクトルとする
+- チャンクIDは「<条文ID>#p<項>」「<条文ID>#p<項>i<号>」
+- メタデータに親条文のID（ParentID）と項番号・号番号を持つ
+- 号のチャンクには柱書（号より前の本文）を付け、単独でも意味が通るようにする
+- 分割した条文の全文は ParentStore に保存し、検索時に親条文へ展開できるようにする
+
+ファイル構成:
+    articles.jsonl  親条文のID・本文・メタデータ
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import settings
+from app.utils.legal_text import split_article
+from app.utils.tokens import count_tokens
+
+
+CHUNK_ID_SEPARATOR = "#"
+
+
+def make_chunk_id(parent_id: str, paragraph: int, item: Optional[int] = None) -> str:
+    suffix = f"p{paragraph}" + (f"i{item}" if item else "")
+    return f"{parent_id}{CHUNK_ID_SEPARATOR}{suffix}"
+
+
+def parent_id_of(doc_id: str) -> str:
+    """チャンクIDから親条文のIDを取得（チャンクでない場合はそのまま）"""
+    return doc_id.split(CHUNK_ID_SEPARATOR, 1)[0]
+
+
+def chunk_label(paragraph: int, item: Optional[int] = None) -> str:
+    return f"第{paragraph}項" + (f"第{item}号" if item else "")
+
+
+def chunk_article(
+    doc_id: str,
+    document: str,
+    metadata: Dict[str, Any],
+    min_article_tokens: Optional[int] = None,
+    max_chunk_tokens: Optional[int] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """条文を項・号単位のチャンクに分割
+
+    {"id", "document", "embed_text", "metadata"} のリストを返す。
+    短い条文・分割できない条文（1項のみで号もない）はNone
+    """
+    min_article_tokens = min_article_tokens or settings.chunk_min_article_tokens
+    max_chunk_tokens = max_chunk_tokens or settings.chunk_max_tokens
+    if count_tokens(document) < min_article_tokens:
+        return None
+    paragraphs = split_article(document)
+    if len(paragraphs) == 1 and not paragraphs[0]["items"]:
+        return None
+
+    heading = f"{metadata.get('LawTitle', '')} {metadata.get('ArticleTitle', '')}".strip()
+    chunks: List[Dict[str, Any]] = []
+
+    def add_chunk(text: str, paragraph: int, item: Optional[int] = None):
+        chunk_metadata = {
+            **metadata,
+            "ParentID": doc_id,
+            "ParagraphNum": paragraph,
+            "ItemNum": item or 0
+        }
+        chunks.append({
+            "id": make_chunk_id(doc_id, paragraph, item),
+            "document": text,
+            "embed_text": f"{heading} {chunk_label(paragraph, item)}\n{text}",
+            "metadata": chunk_metadata
+        })
+
+    for paragraph in paragraphs:
+        items = paragraph["items"]
+        full_text = "\n".join([paragraph["lead"]] + [text for _, text in items]).strip()
+        if not items or count_tokens(full_text) <= max_chunk_tokens:
+            add_chunk(full_text, paragraph["paragraph"])
+            continue
+        for num, text in items:
+            add_chunk(f"{paragraph['lead']}\n{text}".strip(), paragraph["paragraph"], num)
+    return chunks
+
+
+class ParentStore:
+    """チャンク化した条文の全文（親条文）を保持"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._articles: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._dirty = False
+
+        articles_path = self.path / "articles.jsonl"
+        if articles_path.exists():
+            with open(articles_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._articles[record["id"]] = (record["document"], record["metadata"])
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def __contains__(self, article_id: str) -> bool:
+        return article_id in self._articles
+
+    def get(self, article_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(本文, メタデータ) を返す（存在しない場合はNone）"""
+        return self._articles.get(article_id)
+
+    def iter_articles(self):
+        """(条文ID, 本文, メタデータ) を順に返す"""
+        for article_id, (document, metadata) in list(self._articles.items()):
+            yield article_id, document, metadata
+
+    def put(self, article_id: str, document: str, metadata: Dict[str, Any]):
+        with self._lock:
+            if self._articles.get(article_id) != (document, metadata):
+                self._articles[article_id] = (document, metadata)
+                self._dirty = True
+
+    def delete(self, article_ids: List[str]):
+        with self._lock:
+            for article_id in article_ids:
+                if self._articles.pop(article_id, None) is not None:
+                    self._dirty = True
+
+    def save(self):
+        """変更がある場合のみファイルを書き直す"""
+        if not self._dirty:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            tmp_path = self.path / "articles.jsonl.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for article_id, (document, metadata) in self._articles.items():
+                    f.write(json.dumps(
+                        {"id": article_id, "document": document, "metadata": metadata},
+                        ensure_ascii=False
+                    ) + "\n")
+            os.replace(tmp_path, self.path / "articles.jsonl")
+            self._dirty = False
+
+
+# シングルトンインスタンス
+parent_store = ParentStore(settings.parent_store_path)
@@ -0,0 +1,181 @@
+"""
+条文の直接参照（引用）インデックス
+
+「民法第90条」「会社法第三百五十五条」のように条文が明示されたクエリを、
+埋め込み・ベクター検索を行わずに (法令名 / 法令ID, 条番号) の辞書引きで解決する
+- 索引は投入済みの文書（BM25インデックスの文書ストア）のメタデータから構築
+- 法令名が省略された引用（「第415条」）は、クエリ中で直前に出現した法令名で補う
+- 項・号単位に分割した条文は、親条文の全文を1件として索引する
+"""
+
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from config import settings
+from app.utils.legal_text import CITATION_PATTERN, kanji_to_int, make_article_key, parse_article_key
+from .lexical_index import LexicalIndex, lexical_index
+from .chunking import ParentStore, parent_store
+from .metadata_filter import matches_filters
+
+
+_RESIDUAL_PATTERN = re.compile(r"[\s、。,.?？!！「」『』()（）]+")
+_LAW_ID_PATTERN = re.compile(r"([0-9]{3}[A-Z]{2}[0-9]{10})\s*$")
+
+
+@dataclass(frozen=True)
+class Citation:
+    law: str
+    article_key: str
+    start: int
+    end: int
+
+
+class CitationIndex:
+    def __init__(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]] = ()):
+        self._lock = threading.Lock()
+        self._articles: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._law_titles: set = set()
+        self._max_title_length = 0
+
+        # 直接参照の発生状況
+        self.lookups = 0
+        self.hits = 0
+        self.skipped_vector_search = 0
+
+        self.add_documents(documents)
+
+    def add_documents(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """(文書ID, 本文, メタデータ) を索引に追加"""
+        for doc_id, document, metadata in documents:
+            article_key = parse_article_key(metadata.get("ArticleTitle", ""))
+            if article_key is None and metadata.get("ArticleNum"):
+                article_key = make_article_key(int(metadata["ArticleNum"]))
+            if article_key is None:
+                continue
+
+            entry = {
+                "id": doc_id,
+                "document": document,
+                "similarity_score": 1.0,  # 明示的に引用された条文
+                "metadata": metadata,
+                "match": "citation"
+            }
+            law_title = unicodedata.normalize("NFKC", metadata.get("LawTitle", ""))
+            with self._lock:
+                for law in (law_title, metadata.get("LawID", "")):
+                    if law:
+                        self._articles.setdefault((law, article_key), []).append(entry)
+                if law_title:
+                    self._law_titles.add(law_title)
+                    self._max_title_length = max(self._max_title_length, len(law_title))
+
+    def _find_law_before(self, text: str, position: int) -> Tuple[Optional[str], int]:
+        """引用の直前にある最長の法令名（または法令ID）とその開始位置を探す"""
+        prefix = text[:position].rstrip()
+        for length in range(min(self._max_title_length, len(prefix)), 0, -1):
+            candidate = prefix[-length:]
+            if candidate in self._law_titles:
+                return candidate, len(prefix) - length
+        law_id = _LAW_ID_PATTERN.search(prefix)
+        if law_id:
+            return law_id.group(1), law_id.start(1)
+        return None, position
+
+    def parse_citations(self, query: str) -> List[Citation]:
+        """クエリから条文の引用を抽出"""
+        text = unicodedata.normalize("NFKC", query)
+        citations = []
+        current_law = None
+        for match in CITATION_PATTERN.finditer(text):
+            law, start = self._find_law_before(text, match.start())
+            if law is None:
+                law = current_law
+            if law is None:
+                continue
+            current_law = law
+            article_num = kanji_to_int(match.group(1))
+            if not article_num:
+                continue
+            branch = kanji_to_int(match.group(2)) if match.group(2) else None
+            citations.append(Citation(
+                law=law,
+                article_key=make_article_key(article_num, branch),
+                start=start,
+                end=match.end()
+            ))
+        return citations
+
+    def lookup(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """引用された条文を返す（filtersに合わない条文は除く）
+
+        戻り値は (条文のリスト, クエリが引用だけで構成されているか)。
+        後者がTrueの場合はベクター検索を省略してよい
+        """
+        self.lookups += 1
+        citations = self.parse_citations(query)
+        if not citations:
+            return [], False
+
+        results = []
+        seen = set()
+        for citation in citations:
+            for entry in self._articles.get((citation.law, citation.article_key), []):
+                if entry["id"] not in seen and matches_filters(entry["metadata"], filters):
+                    seen.add(entry["id"])
+                    results.append({**entry})
+        if not results:
+            return [], False
+        self.hits += 1
+
+        # 引用部分を除いた残りが短ければ（「とは」「について」程度）引用のみのクエリとみなす
+        text = unicodedata.normalize("NFKC", query)
+        residual = text
+        for citation in sorted(citations, key=lambda c: c.start, reverse=True):
+            residual = residual[:citation.start] + residual[citation.end:]
+        residual = _RESIDUAL_PATTERN.sub("", residual)
+        citation_only = (
+            len(residual) <= settings.citation_skip_max_residual_chars
+            and len(results) >= len(citations)
+        )
+        return results, citation_only
+
+    def record_skip(self):
+        self.skipped_vector_search += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "indexed_keys": len(self._articles),
+            "law_titles": len(self._law_titles),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+            "skipped_vector_search": self.skipped_vector_search
+        }
+
+
+def article_documents(lexical: LexicalIndex, parents: ParentStore) -> Iterable[Tuple[str, str, Dict[str, Any]]]:
+    """BM25インデックスの文書を条文単位で返す（チャンクは親条文にまとめる）"""
+    seen_parents = set()
+    for doc_id, document, metadata in lexical.iter_documents():
+        parent_id = metadata.get("ParentID")
+        parent = parents.get(parent_id) if parent_id else None
+        if parent is None:
+            yield doc_id, document, metadata
+        elif parent_id not in seen_parents:
+            seen_parents.add(parent_id)
+            yield parent_id, parent[0], parent[1]
+
+
+# シングルトンインスタンス（投入済み文書のメタデータから構築）
+citation_index: Optional[CitationIndex] = (
+    CitationIndex(article_documents(lexical_index, parent_store))
+    if settings.citation_fast_path_enabled and lexical_index is not None
+    else None
+)
@@ -0,0 +1,222 @@
+"""
+上流API（OpenRouter / OpenAI / Pinecone）ごとの適応的な同時実行数の制限と負荷遮断
+
+アクセス集中時に上流APIへ無制限に同時リクエストを送ると 429 や遅延が起き、全リクエストが遅くなる。
+上流APIごとに同時実行数の上限を AIMD（加算増加・乗算減少）で調整し、上限を超えた呼び出しは待たせる
+- 過負荷の兆候（429 / 503 / 504・タイムアウト）があれば上限を upstream_backoff_ratio 倍に下げる
+  （同時に失敗した呼び出しで何度も下げないよう、平均レイテンシの間は再度下げない）
+- 成功するたびに上限を 1/上限 ずつ戻す（上限を使い切っている間のみ。最大は各上流APIの設定値）
+- 待ち行列が upstream_queue_max_size 件を超える場合・upstream_queue_max_wait_ms 以上待った場合は
+  UpstreamOverloaded を送出する（APIは 503 と Retry-After を返す）
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import httpx
+
+from config import settings
+from app.utils.railway_logger import railway_logger
+
+
+# 上流APIの過負荷を表すHTTPステータス
+OVERLOAD_STATUS_CODES = (429, 503, 504)
+# 平均レイテンシの平滑化係数
+_LATENCY_ALPHA = 0.2
+_MAX_RETRY_AFTER_SECONDS = 60
+
+
+class UpstreamOverloaded(Exception):
+    """上流APIの待ち行列が溢れた（または待ち時間が上限を超えた）"""
+
+    def __init__(self, upstream: str, retry_after: int, reason: str):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(f"{upstream} is overloaded ({reason}). Retry after {retry_after}s")
+
+
+def is_overload_error(error: Optional[BaseException]) -> bool:
+    """例外（ラップされた元の例外を含む）が上流APIの過負荷を表すかどうか"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException)):
+            return True
+        status = getattr(error, "status_code", None) or getattr(error, "status", None)
+        if status in OVERLOAD_STATUS_CODES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class LimiterSlot:
+    """acquire で得た実行枠（レスポンスのステータスで過負荷を通知する）"""
+
+    def __init__(self):
+        self.overloaded = False
+
+    def record_status(self, status_code: int):
+        if status_code in OVERLOAD_STATUS_CODES:
+            self.overloaded = True
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        min_limit: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        backoff_ratio: Optional[float] = None,
+        adaptive: Optional[bool] = None
+    ):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = min(self.max_limit, max(1, min_limit or settings.upstream_min_concurrency))
+        self.max_queue = max_queue if max_queue is not None else settings.upstream_queue_max_size
+        self.max_wait_seconds = (max_wait_ms if max_wait_ms is not None else settings.upstream_queue_max_wait_ms) / 1000
+        self.backoff_ratio = backoff_ratio or settings.upstream_backoff_ratio
+        self.adaptive = settings.adaptive_concurrency_enabled if adaptive is None else adaptive
+
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self._avg_latency: Optional[float] = None
+        self._avg_queue_wait = 0.0
+
+        # 発生状況
+        self.accepted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.overloads = 0
+        self.limit_decreases = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[LimiterSlot]:
+        """実行枠を確保（空きがなければ待つ）。ブロック内の結果で上限を調整する"""
+        await self._enter()
+        slot = LimiterSlot()
+        start_time = time.monotonic()
+        try:
+            yield slot
+        except Exception as e:
+            # キャンセル・ストリームの中断（BaseException）は上限の調整に使わない
+            self._record(start_time, slot.overloaded or is_overload_error(e))
+            raise
+        else:
+            self._record(start_time, slot.overloaded)
+        finally:
+            self._release()
+
+    def reject_if_full(self):
+        """待ち行列が溢れている場合は待たずに UpstreamOverloaded を送出（ストリーミング開始前の確認用）"""
+        if self.in_flight >= self.capacity and len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise UpstreamOverloaded(self.name, self._retry_after(), "queue full")
+
+    async def _enter(self):
+        if self.in_flight < self.capacity and not self._waiters:
+            self.in_flight += 1
+            self.accepted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise UpstreamOverloaded(self.name, self._retry_after(), "queue full")
+
+        self.queued += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start_time = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._give_up(future)
+            self.rejected_timeout += 1
+            raise UpstreamOverloaded(self.name, self._retry_after(), "queue wait timeout") from None
+        except asyncio.CancelledError:
+            self._give_up(future)
+            raise
+        self.accepted += 1
+        wait = time.monotonic() - start_time
+        self._avg_queue_wait += _LATENCY_ALPHA * (wait - self._avg_queue_wait)
+
+    def _give_up(self, future: asyncio.Future):
+        if future in self._waiters:
+            self._waiters.remove(future)
+        elif future.done() and not future.cancelled():
+            # 枠を受け取った直後にキャンセル・タイムアウトした場合は次の待機者に譲る
+            self._release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._grant()
+
+    def _grant(self):
+        """空いた枠を待機中の呼び出しへ順に渡す"""
+        while self._waiters and self.in_flight < self.capacity:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _record(self, start_time: float, overloaded: bool):
+        now = time.monotonic()
+        latency = now - start_time
+        self._avg_latency = latency if self._avg_latency is None else (
+            self._avg_latency + _LATENCY_ALPHA * (latency - self._avg_latency)
+        )
+        if not self.adaptive:
+            return
+        if overloaded:
+            self.overloads += 1
+            # 同じ過負荷で同時に失敗した呼び出しごとに下げないよう、平均レイテンシの間は下げない
+            if now - self._last_decrease >= self._avg_latency:
+                previous = self.capacity
+                self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                self._last_decrease = now
+                self.limit_decreases += 1
+                railway_logger.log_system_event(
+                    "upstream_limit_decreased", f"Concurrency limit for {self.name} decreased",
+                    upstream=self.name, previous_limit=previous, limit=self.capacity
+                )
+        elif self.in_flight >= self.capacity and self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._grant()
+
+    def _retry_after(self) -> int:
+        """待ち行列が捌けるまでの目安（秒）"""
+        latency = self._avg_latency if self._avg_latency is not None else 1.0
+        seconds = latency * (len(self._waiters) + 1) / self.capacity
+        return min(_MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(seconds)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "adaptive": self.adaptive,
+            "limit": self.capacity,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "max_queue": self.max_queue,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "accepted": self.accepted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "overloads": self.overloads,
+            "limit_decreases": self.limit_decreases,
+            "avg_latency_ms": self._avg_latency * 1000 if self._avg_latency is not None else None,
+            "avg_queue_wait_ms": self._avg_queue_wait * 1000
+        }
@@ -0,0 +1,263 @@
+"""
+プロンプトのトークン予算管理
+
+ChatService がLLMに送るメッセージ（システムプロンプト + 関連条文 + 会話履歴）を
+prompt_token_budget 以内に収める
+- 会話履歴は最新のユーザーメッセージ以降を必ず残し、それより前は新しい順に history_token_budget まで残す。
+  収まらない古いターンはユーザーの質問を抜き出した短い要約に置き換える。
+  最新のユーザーメッセージ自体が長く関連条文の予算（1条文分）が残らない場合は、それ以前の履歴を除いて切り詰める
+- 関連条文は重複（同一ID・本文が他の条文に含まれるもの）を除き、検索順に残りの予算へ詰める。
+  1条文は context_max_doc_tokens まで、入り切らない条文は切り詰めるか除外する。
+  切り詰めはプロンプト内だけで、クライアントには元の本文を返す（切り詰めた条文のIDは統計に記録）
+- 予算を適用しない場合と比べて削減したトークン数を統計として返す
+- 会話履歴の整理（prepare_history）は関連条文に依存しないため、検索と並行して実行できる
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+from config import settings
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+
+# メッセージごとの書式オーバーヘッド（role等）の概算
+_MESSAGE_OVERHEAD_TOKENS = 4
+_TRUNCATED_MARK = "…（以下省略）"
+_SUMMARY_HEADER = "これまでの会話の要約（古いやり取りは省略しています）:"
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@dataclass
+class PackedPrompt:
+    messages: List[Dict[str, str]]
+    documents: List[Dict[str, Any]]  # プロンプトに含めた条文（切り詰め後）
+    stats: Dict[str, Any] = field(default_factory=dict)
+    # クライアントに返す条文（documents と同じ条文の切り詰め前の本文）
+    source_documents: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class PreparedHistory:
+    messages: List[Dict[str, str]]  # 予算内に残す履歴（要約を含む）
+    tokens: int                     # messages のトークン数
+    original_tokens: int            # 整理前の履歴のトークン数
+    dropped: int = 0
+    summarized: bool = False
+    truncated: bool = False         # 最新のユーザーメッセージを切り詰めたか
+
+
+def _message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def _normalize_text(text: str) -> str:
+    return _WHITESPACE_PATTERN.sub("", unicodedata.normalize("NFKC", text))
+
+
+def deduplicate_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一IDの条文と、本文が他の条文に含まれる条文（項・号と条全体など）を除く
+
+    重複した場合は内容の多い方を、先に出現した方の順位に残す
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_texts: List[str] = []
+    seen_ids = set()
+    for doc in documents:
+        doc_id = doc.get("id")
+        if doc_id and doc_id in seen_ids:
+            continue
+        text = _normalize_text(doc.get("document", ""))
+        covered = False
+        for i, kept_text in enumerate(kept_texts):
+            if text and text in kept_text:
+                covered = True
+                break
+            if kept_text and kept_text in text:
+                # 既存の条文を包含する場合は置き換える
+                kept[i], kept_texts[i] = doc, text
+                covered = True
+                break
+        if doc_id:
+            seen_ids.add(doc_id)
+        if not covered:
+            kept.append(doc)
+            kept_texts.append(text)
+    return kept
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        prompt_token_budget: Optional[int] = None,
+        history_token_budget: Optional[int] = None,
+        history_summary_tokens: Optional[int] = None,
+        max_doc_tokens: Optional[int] = None,
+        min_doc_tokens: Optional[int] = None
+    ):
+        self.prompt_token_budget = prompt_token_budget or settings.prompt_token_budget
+        self.history_token_budget = history_token_budget or settings.history_token_budget
+        self.history_summary_tokens = history_summary_tokens or settings.history_summary_tokens
+        self.max_doc_tokens = max_doc_tokens or settings.context_max_doc_tokens
+        self.min_doc_tokens = min_doc_tokens or settings.context_min_doc_tokens
+
+    def _split_history(
+        self,
+        history: List[Dict[str, str]]
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """(予算内で残す履歴, 省略する古い履歴) に分ける"""
+        last_user = max((i for i, m in enumerate(history) if m["role"] == "user"), default=len(history))
+        current, earlier = history[last_user:], history[:last_user]
+
+        kept: List[Dict[str, str]] = []
+        used = 0
+        for message in reversed(earlier):
+            tokens = count_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS
+            if used + tokens > self.history_token_budget:
+                break
+            kept.insert(0, message)
+            used += tokens
+        dropped = earlier[:len(earlier) - len(kept)]
+        return kept + current, dropped
+
+    def _summarize(self, dropped: List[Dict[str, str]]) -> Optional[str]:
+        """省略するターンのユーザー質問を新しい順に要約予算まで抜き出す"""
+        questions = [m["content"] for m in dropped if m["role"] == "user"]
+        if not questions:
+            return None
+        lines: List[str] = []
+        used = count_tokens(_SUMMARY_HEADER)
+        per_question = max(self.history_summary_tokens // 4, 16)
+        for question in reversed(questions):
+            line = "- " + truncate_to_tokens(_WHITESPACE_PATTERN.sub(" ", question).strip(), per_question)
+            tokens = count_tokens(line)
+            if used + tokens > self.history_summary_tokens:
+                break
+            lines.insert(0, line)
+            used += tokens
+        if not lines:
+            return None
+        return _SUMMARY_HEADER + "\n" + "\n".join(lines)
+
+    def prepare_history(self, messages: List[Dict[str, str]]) -> PreparedHistory:
+        """会話履歴を予算内に収める（収まらない古いターンは要約に置き換える）"""
+        history, dropped = self._split_history(messages)
+        summary = self._summarize(dropped)
+        if summary:
+            history = [{"role": "system", "content": summary}] + history
+        return PreparedHistory(
+            messages=history,
+            tokens=_message_tokens(history),
+            original_tokens=_message_tokens(messages),
+            dropped=len(dropped),
+            summarized=summary is not None
+        )
+
+    def _fit_history(self, history: PreparedHistory, limit: int) -> PreparedHistory:
+        """履歴が limit トークンを超える場合は最新のユーザーメッセージ以降だけを残し、
+        それでも超える場合は最新のユーザーメッセージを切り詰める
+        """
+        messages = history.messages
+        last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=0)
+        earlier, messages = messages[:last_user], messages[last_user:]
+        # 要約も除くため、要約したターンは除いたターンとして数える
+        dropped = history.dropped + len(earlier) - (1 if history.summarized else 0)
+
+        truncated = False
+        overflow = _message_tokens(messages) - limit
+        if overflow > 0 and messages:
+            content = messages[0]["content"]
+            content_budget = max(count_tokens(content) - overflow - count_tokens(_TRUNCATED_MARK), 0)
+            messages = [
+                {**messages[0], "content": truncate_to_tokens(content, content_budget) + _TRUNCATED_MARK}
+            ] + messages[1:]
+            truncated = True
+        return PreparedHistory(
+            messages=messages,
+            tokens=_message_tokens(messages),
+            original_tokens=history.original_tokens,
+            dropped=dropped,
+            summarized=False,
+            truncated=truncated
+        )
+
+    def pack(
+        self,
+        system_template: str,
+        messages: List[Dict[str, str]],
+        documents: List[Dict[str, Any]],
+        format_context: Callable[[List[Dict[str, Any]]], str],
+        history: Optional[PreparedHistory] = None
+    ) -> PackedPrompt:
+        """予算内に収めたメッセージを作成
+
+        system_template は {context_text} を含むシステムプロンプト、
+        format_context は条文リストをプロンプト用の文字列に整形する関数、
+        history は prepare_history で整理済みの履歴（Noneの場合はここで整理する）。
+        関連条文には少なくとも1条文分（context_max_doc_tokens、予算の半分まで）を確保する
+        """
+        if history is None:
+            history = self.prepare_history(messages)
+
+        # 予算を適用しない場合のトークン数（削減量の算出用）
+        unpacked_tokens = _message_tokens(
+            [{"role": "system", "content": system_template.format(context_text=format_context(documents))}]
+        ) + history.original_tokens
+
+        system_tokens = _message_tokens([{"role": "system", "content": system_template.format(context_text="")}])
+        document_reserve = min(self.max_doc_tokens, self.prompt_token_budget // 2)
+        history_limit = self.prompt_token_budget - system_tokens - document_reserve
+        if history.tokens > history_limit:
+            history = self._fit_history(history, history_limit)
+        remaining = max(self.prompt_token_budget - system_tokens - history.tokens, 0)
+
+        unique_documents = deduplicate_documents(documents)
+        packed_documents: List[Dict[str, Any]] = []
+        source_documents: List[Dict[str, Any]] = []
+        truncated_ids: List[Any] = []
+        for doc in unique_documents:
+            # 見出し（法令名・条番号）の分も含めて数える
+            entry_tokens = count_tokens(format_context([doc]))
+            content = doc.get("document", "")
+            allowed = min(self.max_doc_tokens, remaining)
+            if entry_tokens > allowed:
+                content_budget = allowed - (entry_tokens - count_tokens(content)) - count_tokens(_TRUNCATED_MARK)
+                if content_budget < self.min_doc_tokens:
+                    # 入り切らない条文は除外し、後続の短い条文を試す
+                    continue
+                packed_doc = {**doc, "document": truncate_to_tokens(content, content_budget) + _TRUNCATED_MARK}
+                entry_tokens = count_tokens(format_context([packed_doc]))
+                truncated_ids.append(doc.get("id"))
+            else:
+                packed_doc = doc
+            packed_documents.append(packed_doc)
+            source_documents.append(doc)
+            remaining -= entry_tokens
+
+        system_message = {
+            "role": "system",
+            "content": system_template.format(context_text=format_context(packed_documents))
+        }
+        packed_messages = [system_message] + history.messages
+        prompt_tokens = _message_tokens([system_message]) + history.tokens
+
+        return PackedPrompt(
+            messages=packed_messages,
+            documents=packed_documents,
+            source_documents=source_documents,
+            stats={
+                "budget": self.prompt_token_budget,
+                "prompt_tokens": prompt_tokens,
+                "unpacked_tokens": unpacked_tokens,
+                "tokens_saved": max(unpacked_tokens - prompt_tokens, 0),
+                "documents_in": len(documents),
+                "documents_packed": len(packed_documents),
+                "duplicates_removed": len(documents) - len(unique_documents),
+                "documents_truncated": len(truncated_ids),
+                "truncated_ids": truncated_ids,
+                "history_turns_dropped": history.dropped,
+                "history_summarized": history.summarized,
+                "current_turn_truncated": history.truncated
+            }
+        )
@@ -0,0 +1,103 @@
+"""
+埋め込みリクエストのマイクロバッチ化
+
+同時に届いた単一テキストの埋め込み要求を短い時間窓（embedding_batch_window_ms）か
+件数（embedding_batch_max_size）に達するまで集め、1回のバッチAPI呼び出しにまとめて
+各呼び出し元へ結果を返す
+- 同じバッチ内の同一テキストは1件だけ問い合わせる
+- 呼び出し元がキャンセルされても、同じテキストを待つ他の呼び出し元には影響しない
+- API呼び出しが失敗した場合は、そのバッチの全呼び出し元に例外を返す
+  （embed_batch は入力と同数のベクトルを返すか、例外を送出する）
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Set
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float,
+        max_batch_size: int
+    ):
+        self.embed_batch = embed_batch
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        # 集めている最中のバッチ（テキスト → 結果を受け取るFuture）
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        # 発生状況
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.texts_sent = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """テキストの埋め込みを取得（他の同時要求とまとめて問い合わせる）"""
+        self.requests += 1
+        future = self._pending.get(text)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[text] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window_seconds, self._flush)
+        # 呼び出し元のキャンセルが共有のFutureに波及しないようにする
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        """集めたバッチを送信"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, asyncio.Future]):
+        texts = list(batch)
+        self.batches += 1
+        self.texts_sent += len(texts)
+        try:
+            vectors = await self.embed_batch(texts)
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        for text, vector in zip(texts, vectors):
+            future = batch[text]
+            if not future.done():
+                future.set_result(vector)
+
+    @staticmethod
+    def _fail(batch: Dict[str, asyncio.Future], error: Exception):
+        for future in batch.values():
+            if not future.done():
+                future.set_exception(error)
+                # 呼び出し元が全員キャンセルされた場合も例外を回収しておく
+                future.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_seconds * 1000,
+            "max_batch_size": self.max_batch_size,
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "texts_sent": self.texts_sent,
+            "avg_batch_size": self.texts_sent / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,291 @@
+"""
+クエリ埋め込みキャッシュ
+
+正規化したクエリ文字列をキーに埋め込みベクトルを保持し、同一・ほぼ同一の
+質問に対するOpenAI APIの呼び出しを省略する
+- memory: プロセス内のLRU+TTLキャッシュ
+- sqlite: ローカルファイルに永続化（再起動後もキャッシュを維持）
+  ファイルI/Oでイベントループを止めないよう、読み書きはスレッドプールで実行する
+"""
+
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from config import settings
+
+
+# 末尾・文中で意味を持たない記号（NFKC正規化後の文字で指定）
+_PUNCTUATION_PATTERN = re.compile(r"[?!.,、。・「」『』()\[\]{}\"'`~〜]+")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# 最終アクセス時刻の更新をまとめて書き込む間隔・件数
+_ACCESS_FLUSH_INTERVAL_SECONDS = 5.0
+_ACCESS_FLUSH_MAX_PENDING = 256
+
+
+def normalize_query(text: str) -> str:
+    """キャッシュキー用にクエリを正規化（NFKC・空白/句読点の畳み込み・小文字化）"""
+    normalized = unicodedata.normalize("NFKC", text)
+    normalized = _PUNCTUATION_PATTERN.sub(" ", normalized)
+    normalized = _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+    return normalized.lower()
+
+
+def _pack_vector(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack_vector(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class MemoryCacheBackend:
+    """プロセス内LRU+TTLキャッシュ"""
+    
+    # 読み書きがブロックしないため、イベントループ上でそのまま実行する
+    blocking = False
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (作成時刻, ベクトル)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, vector = entry
+            if self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+    
+    def set(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = (time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def size(self) -> int:
+        return len(self._entries)
+    
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend:
+    """SQLiteファイルに永続化するLRU+TTLキャッシュ
+    
+    - ヒット時の最終アクセス時刻はメモリに溜め、一定間隔・一定件数ごとにまとめて書き込む
+    - 件数は COUNT(*) を毎回数えず、挿入・削除に合わせて更新する
+    """
+    
+    blocking = True
+    
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._lock = threading.Lock()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # key -> 未書き込みの最終アクセス時刻
+        self._pending_access: Dict[str, float] = {}
+        self._last_flush = time.time()
+    
+    def get(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            blob, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._delete(key)
+                return None
+            self._pending_access[key] = now
+            if (len(self._pending_access) >= _ACCESS_FLUSH_MAX_PENDING
+                    or now - self._last_flush >= _ACCESS_FLUSH_INTERVAL_SECONDS):
+                self._flush_access()
+        return _unpack_vector(blob)
+    
+    def set(self, key: str, vector: List[float]):
+        now = time.time()
+        blob = _pack_vector(vector)
+        with self._lock:
+            self._pending_access.pop(key, None)
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO embeddings (key, vector, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, blob, now, now)
+            ).rowcount
+            if inserted:
+                self._count += 1
+            else:
+                self._conn.execute(
+                    "UPDATE embeddings SET vector = ?, created_at = ?, last_access = ? WHERE key = ?",
+                    (blob, now, now, key)
+                )
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                # 古い順に削除するため、溜めているアクセス時刻を先に反映する
+                self._flush_access()
+                self._count -= self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+    
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._pending_access.clear()
+            self._count = 0
+    
+    def size(self) -> int:
+        return self._count
+    
+    def close(self):
+        """溜めている最終アクセス時刻を書き込んで接続を閉じる"""
+        with self._lock:
+            self._flush_access()
+            self._conn.close()
+    
+    def _delete(self, key: str):
+        self._pending_access.pop(key, None)
+        self._count -= self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,)).rowcount
+    
+    def _flush_access(self):
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+        self._last_flush = time.time()
+
+
+class EmbeddingCache:
+    """正規化クエリをキーとした埋め込みキャッシュ（ヒット/ミス数を集計）"""
+    
+    def __init__(self, backend, model: str):
+        self.backend = backend
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+    
+    def _key(self, text: str) -> str:
+        # モデルが変わった場合に古いベクトルを返さないようモデル名もキーに含める
+        digest = hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+        return f"{self.model}:{digest}"
+    
+    def get(self, text: str) -> Optional[List[float]]:
+        vector = self.backend.get(self._key(text))
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+    
+    def set(self, text: str, vector: List[float]):
+        self.backend.set(self._key(text), vector)
+    
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return [self.get(text) for text in texts]
+    
+    def set_many(self, items: List[tuple]):
+        for text, vector in items:
+            self.set(text, vector)
+    
+    async def async_get(self, text: str) -> Optional[List[float]]:
+        return (await self.async_get_many([text]))[0]
+    
+    async def async_set(self, text: str, vector: List[float]):
+        await self.async_set_many([(text, vector)])
+    
+    async def async_get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """キャッシュを参照（ファイルI/Oを伴うバックエンドはスレッドプールで実行）"""
+        if not self.backend.blocking:
+            return self.get_many(texts)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_many, texts)
+    
+    async def async_set_many(self, items: List[tuple]):
+        """(テキスト, ベクトル) の組を保存（ファイルI/Oを伴うバックエンドはスレッドプールで実行）"""
+        if not self.backend.blocking:
+            self.set_many(items)
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.set_many, items)
+    
+    def clear(self):
+        self.backend.clear()
+    
+    def close(self):
+        self.backend.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を取得"""
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "max_entries": self.backend.max_entries,
+            "ttl_seconds": self.backend.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+def create_embedding_cache(model: str) -> Optional[EmbeddingCache]:
+    """設定に応じて埋め込みキャッシュを作成（無効の場合はNone）"""
+    backend_name = settings.embedding_cache_backend.lower()
+    if backend_name in ("", "none", "disabled"):
+        return None
+    
+    if backend_name == "memory":
+        backend = MemoryCacheBackend(
+            max_entries=settings.embedding_cache_max_entries,
+            ttl_seconds=settings.embedding_cache_ttl_seconds
+        )
+    elif backend_name == "sqlite":
+        backend = SQLiteCacheBackend(
+            path=settings.embedding_cache_path,
+            max_entries=settings.embedding_cache_max_entries,
+            ttl_seconds=settings.embedding_cache_ttl_seconds
+        )
+    else:
+        raise ValueError(f"Unknown embedding cache backend: {settings.embedding_cache_backend}")
+    
+    return EmbeddingCache(backend, model)
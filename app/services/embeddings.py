@@ -1,6 +1,9 @@
-from openai import OpenAI
-from typing import List
+from openai import AsyncOpenAI
+from typing import List, Optional
 from config import settings
+from .embedding_cache import create_embedding_cache
+from .embedding_batcher import EmbeddingBatcher
+from .concurrency_limiter import AdaptiveLimiter, UpstreamOverloaded
 
 
 class EmbeddingsService:
@@ -9,38 +12,98 @@ class EmbeddingsService:
             print("⚠️ WARNING: OpenAI API key is not set. Embeddings service will not work.")
             self.client = None
         else:
-            self.client = OpenAI(api_key=settings.openai_api_key)
+            # 非同期クライアントを使用し、イベントループをブロックしない
+            self.client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                timeout=settings.embedding_timeout
+            )
         
-        self.model = "text-embedding-3-large"
+        self.model = settings.embedding_model
+        # 同時に発行する埋め込みリクエスト数の上限（過負荷に応じて調整）
+        self.limiter = AdaptiveLimiter("openai", settings.embedding_max_concurrency)
+        # 正規化クエリをキーとした埋め込みキャッシュ
+        self.cache = create_embedding_cache(self.model)
+        # 同時に届いた単一テキストの要求を1回のバッチ呼び出しにまとめる（無効の場合はNone）
+        self.batcher = None
+        if settings.embedding_batching_enabled:
+            self.batcher = EmbeddingBatcher(
+                self._create_embeddings,
+                window_ms=settings.embedding_batch_window_ms,
+                max_batch_size=settings.embedding_batch_max_size
+            )
+    
+    async def _create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """埋め込みAPIを呼び出す（入力順の埋め込みを返す。入力と数が合わない応答は例外とする）"""
+        async with self.limiter.acquire():
+            response = await self.client.embeddings.create(
+                input=texts,
+                model=self.model
+            )
+        vectors = [data.embedding for data in response.data]
+        if len(vectors) != len(texts):
+            raise Exception(f"Embedding API returned {len(vectors)} embeddings for {len(texts)} inputs")
+        return vectors
     
     async def get_embedding(self, text: str) -> List[float]:
         """単一テキストの埋め込みを取得"""
+        if self.cache:
+            cached = await self.cache.async_get(text)
+            if cached is not None:
+                return cached
+        
         if not self.client:
             raise Exception("OpenAI API key is not configured. Cannot generate embeddings.")
         
         try:
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.model
-            )
-            return response.data[0].embedding
+            if self.batcher is not None:
+                embedding = await self.batcher.embed(text)
+            else:
+                embedding = (await self._create_embeddings([text]))[0]
+        except UpstreamOverloaded:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to get embedding: {str(e)}")
+            raise Exception(f"Failed to get embedding: {str(e)}") from e
+        
+        if self.cache:
+            await self.cache.async_set(text, embedding)
+        return embedding
     
-    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """複数テキストの埋め込みを一括取得"""
+    async def get_embeddings(self, texts: List[str], use_cache: bool = False) -> List[List[float]]:
+        """複数テキストの埋め込みを一括取得
+        
+        use_cache=True の場合はキャッシュ済みのテキストを除いて問い合わせる（クエリ用）
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if use_cache and self.cache:
+            results = await self.cache.async_get_many(texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if not missing:
+            return results
+        
         if not self.client:
             raise Exception("OpenAI API key is not configured. Cannot generate embeddings.")
         
         try:
-            response = self.client.embeddings.create(
-                input=texts,
-                model=self.model
-            )
-            return [data.embedding for data in response.data]
+            vectors = await self._create_embeddings([texts[i] for i in missing])
+        except UpstreamOverloaded:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to get embeddings: {str(e)}")
+            raise Exception(f"Failed to get embeddings: {str(e)}") from e
+        
+        for i, vector in zip(missing, vectors):
+            results[i] = vector
+        if use_cache and self.cache:
+            await self.cache.async_set_many([(texts[i], results[i]) for i in missing])
+        return results
+    
+    async def close(self):
+        """HTTPコネクションとキャッシュを解放"""
+        if self.cache:
+            self.cache.close()
+        if self.client:
+            await self.client.close()
 
 
 # シングルトンインスタンス
-embeddings_service = EmbeddingsService()
\ No newline at end of file
+embeddings_service = EmbeddingsService()
@@ -0,0 +1,557 @@
+"""
+法令データの一括投入パイプライン
+
+- JSON配列 / JSONL を逐次読み込み（ファイル全体をメモリに載せない）
+- トークン数と件数の上限に収まる埋め込みバッチを作成し、複数バッチを並行して埋め込み
+- レート制限・一時的なエラーは指数バックオフで再試行（Retry-Afterヘッダーを尊重）
+- 約100件ずつベクターストアにupsert（vector_store_namespace_field 指定時はメタデータの値ごとのnamespaceへ）
+- 文書IDごとの内容ハッシュをマニフェストに追記し、中断後の再開と差分投入に使う
+  （新規・変更された文書のみ埋め込み、prune指定時は入力から消えた文書を削除）
+- マニフェストへの記録はチェックポイントでBM25インデックス・親条文ストアを保存した後に行う
+  （中断しても、マニフェストに記録済みの文書は必ず保存済みのインデックスに含まれる）
+- chunking 有効時は長い条文を項・号単位のチャンクに分割して投入し、全文を親条文ストアに保存
+  （チャンク構成が変わった条文は、不要になったチャンク・条文全体のベクトルを削除）
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+import openai
+
+from config import settings
+from app.utils.legal_text import parse_article_number
+from app.utils.railway_logger import railway_logger
+from app.utils.tokens import count_tokens, truncate_to_tokens
+from .chunking import chunk_article, parent_id_of
+from .concurrency_limiter import UpstreamOverloaded
+from .result_cache import index_revision
+
+
+_READ_CHUNK_SIZE = 1 << 16
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    UpstreamOverloaded
+)
+
+
+@dataclass
+class IngestDocument:
+    id: str
+    document: str       # 検索結果として返す本文
+    embed_text: str     # 埋め込み対象のテキスト
+    metadata: Dict[str, Any]
+    tokens: int = 0
+    content_hash: str = ""
+    namespace: str = ""
+    previous_namespace: Optional[str] = None  # 前回と異なるnamespaceに入っている場合の移動元
+
+
+@dataclass
+class IngestStats:
+    started_at: float = field(default_factory=time.time)
+    documents: int = 0
+    new: int = 0
+    changed: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retries: int = 0
+    failed_batches: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "documents": self.documents,
+            "new": self.new,
+            "changed": self.changed,
+            "skipped": self.skipped,
+            "deleted": self.deleted,
+            "tokens": self.tokens,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed_batches": self.failed_batches,
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_second": round(self.documents / elapsed, 2),
+            "tokens_per_second": round(self.tokens / elapsed, 1)
+        }
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """JSON配列またはJSONLファイルからレコードを1件ずつ読み込む"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+
+        # JSON配列をチャンク単位で読みながら要素ごとにデコードする
+        decoder = json.JSONDecoder()
+        buffer = ""
+        started = False
+        while True:
+            chunk = f.read(_READ_CHUNK_SIZE)
+            buffer += chunk
+            while True:
+                buffer = buffer.lstrip()
+                if not started:
+                    if not buffer:
+                        break
+                    if buffer[0] != "[":
+                        raise ValueError(f"Expected a JSON array or .jsonl file: {path}")
+                    buffer = buffer[1:]
+                    started = True
+                    continue
+                if buffer.startswith(","):
+                    buffer = buffer[1:]
+                    continue
+                if buffer.startswith("]") or not buffer:
+                    break
+                try:
+                    record, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise
+                    break  # 要素が途中で切れているので続きを読む
+                yield record
+                buffer = buffer[end:]
+            if not chunk:
+                return
+
+
+def normalize_record(item: Dict[str, Any]) -> IngestDocument:
+    """e-Gov形式（LawTitle / ArticleNum 等）とサンプル形式（law_name / article 等）を共通形式に変換"""
+    if "LawTitle" in item or "LawID" in item:
+        document = item.get("original_text") or item.get("text") or item.get("document", "")
+        metadata = {k: v for k, v in item.items() if k not in ("original_text", "text", "document", "id")}
+        law_title = item.get("LawTitle", "")
+        article_title = item.get("ArticleTitle", "")
+        if not metadata.get("ArticleNum"):
+            metadata["ArticleNum"] = parse_article_number(article_title)
+        doc_id = item.get("id") or f"{item.get('LawID', '')}_{metadata['ArticleNum'] or article_title}"
+        embed_text = f"{law_title} {article_title}\n{document}"
+    else:
+        document = item.get("content", "")
+        law_title = item.get("law_name", "")
+        article = item.get("article", "")
+        title = item.get("title", "")
+        metadata = {
+            "LawTitle": law_title,
+            "ArticleTitle": article,
+            "ArticleNum": parse_article_number(article),
+            "category": item.get("category", ""),
+            "title": title
+        }
+        doc_id = item["id"]
+        embed_text = f"{law_title} {article} {title}: {document}"
+
+    return IngestDocument(id=str(doc_id), document=document, embed_text=embed_text, metadata=metadata)
+
+
+def compute_content_hash(doc: IngestDocument) -> str:
+    """埋め込み対象・本文・メタデータ（revisionID / updateDate を含む）のハッシュ"""
+    payload = json.dumps(
+        {"embed_text": doc.embed_text, "document": doc.document, "metadata": doc.metadata},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """文書IDごとの内容ハッシュと投入先namespaceを追記型JSONLファイルに記録"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path else None
+        self.hashes: Dict[str, str] = {}
+        self.namespaces: Dict[str, str] = {}  # デフォルト以外のnamespaceに入っている文書のみ
+        self.chunks: Dict[str, Set[str]] = {}  # 親条文ID → 投入済みチャンクID
+        if self.path and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry.get("deleted"):
+                        self._remove(entry["id"])
+                    else:
+                        self._add(entry["id"], entry["hash"], entry.get("namespace", ""))
+
+    def get_hash(self, doc_id: str) -> Optional[str]:
+        return self.hashes.get(doc_id)
+
+    def get_namespace(self, doc_id: str) -> str:
+        return self.namespaces.get(doc_id, "")
+
+    def ids_for_source(self, doc_id: str) -> Set[str]:
+        """入力レコード（条文）から投入済みの文書ID（条文全体・チャンク）"""
+        ids = set(self.chunks.get(doc_id, ()))
+        if doc_id in self.hashes:
+            ids.add(doc_id)
+        return ids
+
+    def _add(self, doc_id: str, content_hash: str, namespace: str):
+        self.hashes[doc_id] = content_hash
+        if namespace:
+            self.namespaces[doc_id] = namespace
+        else:
+            self.namespaces.pop(doc_id, None)
+        parent_id = parent_id_of(doc_id)
+        if parent_id != doc_id:
+            self.chunks.setdefault(parent_id, set()).add(doc_id)
+
+    def _remove(self, doc_id: str):
+        self.hashes.pop(doc_id, None)
+        self.namespaces.pop(doc_id, None)
+        parent_id = parent_id_of(doc_id)
+        if parent_id != doc_id and parent_id in self.chunks:
+            self.chunks[parent_id].discard(doc_id)
+            if not self.chunks[parent_id]:
+                del self.chunks[parent_id]
+
+    def _entry(self, doc_id: str, content_hash: str) -> Dict[str, Any]:
+        entry = {"id": doc_id, "hash": content_hash}
+        if doc_id in self.namespaces:
+            entry["namespace"] = self.namespaces[doc_id]
+        return entry
+
+    def _append(self, entries: List[Dict[str, Any]]):
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+
+    def mark_done(self, docs: List[IngestDocument]):
+        for doc in docs:
+            self._add(doc.id, doc.content_hash, doc.namespace)
+        self._append([self._entry(doc.id, doc.content_hash) for doc in docs])
+
+    def mark_deleted(self, doc_ids: List[str]):
+        for doc_id in doc_ids:
+            self._remove(doc_id)
+        self._append([{"id": doc_id, "deleted": True} for doc_id in doc_ids])
+
+    def compact(self):
+        """現在の状態だけを残してファイルを書き直す"""
+        if not self.path:
+            return
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc_id, content_hash in self.hashes.items():
+                f.write(json.dumps(self._entry(doc_id, content_hash), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        embeddings_service,
+        vector_store,
+        manifest_path: Optional[str] = None,
+        lexical_index=None,
+        concurrency: Optional[int] = None,
+        batch_max_items: Optional[int] = None,
+        batch_max_tokens: Optional[int] = None,
+        upsert_batch_size: Optional[int] = None,
+        namespace_field: Optional[str] = None,
+        chunking: Optional[bool] = None,
+        parent_store=None,
+        progress_interval: float = 10.0,
+        checkpoint_interval: Optional[float] = None
+    ):
+        self.embeddings_service = embeddings_service
+        self.vector_store = vector_store
+        self.manifest = IngestManifest(manifest_path)
+        # BM25インデックス（ハイブリッド検索用、Noneの場合は更新しない）
+        self.lexical_index = lexical_index
+        self.concurrency = concurrency or settings.ingest_concurrency
+        self.batch_max_items = batch_max_items or settings.ingest_batch_max_items
+        self.batch_max_tokens = batch_max_tokens or settings.ingest_batch_max_tokens
+        self.upsert_batch_size = upsert_batch_size or settings.ingest_upsert_batch_size
+        # 投入先namespaceを決めるメタデータ項目（空の場合はデフォルトnamespace）
+        self.namespace_field = (
+            settings.vector_store_namespace_field if namespace_field is None else namespace_field
+        )
+        # 長い条文を項・号単位に分割するか（分割した条文の全文は parent_store に保存）
+        self.chunking = settings.chunking_enabled if chunking is None else chunking
+        self.parent_store = parent_store
+        self.progress_interval = progress_interval
+        self.checkpoint_interval = (
+            settings.ingest_checkpoint_interval_seconds if checkpoint_interval is None else checkpoint_interval
+        )
+        self.stats = IngestStats()
+        self._last_progress = time.time()
+        self._last_checkpoint = time.time()
+        # 次のチェックポイントでマニフェストに記録する操作（("done", 文書) / ("deleted", 文書ID)）
+        self._pending: List[Tuple[str, list]] = []
+        self._seen_ids: Set[str] = set()
+        self._seen_sources: Set[str] = set()
+        # チャンク構成の変更で不要になった文書（namespace → 文書ID）
+        self._stale: Dict[str, List[str]] = {}
+
+    def _expand(self, doc: IngestDocument) -> List[IngestDocument]:
+        """条文を投入単位（チャンクまたは条文全体）に展開し、不要になった投入済み文書を記録"""
+        chunks = chunk_article(doc.id, doc.document, doc.metadata) if self.chunking else None
+        if chunks is None:
+            docs = [doc]
+        else:
+            docs = [
+                IngestDocument(
+                    id=chunk["id"],
+                    document=chunk["document"],
+                    embed_text=chunk["embed_text"],
+                    metadata=chunk["metadata"]
+                )
+                for chunk in chunks
+            ]
+            if self.parent_store is not None:
+                self.parent_store.put(doc.id, doc.document, doc.metadata)
+        
+        self._seen_sources.add(doc.id)
+        current_ids = {d.id for d in docs}
+        for stale_id in self.manifest.ids_for_source(doc.id) - current_ids:
+            self._stale.setdefault(self.manifest.get_namespace(stale_id), []).append(stale_id)
+        if chunks is None and self.parent_store is not None and doc.id in self.parent_store:
+            # 分割しなくなった条文
+            self.parent_store.delete([doc.id])
+        return docs
+
+    def iter_batches(self, records: Iterator[Dict[str, Any]]) -> Iterator[List[IngestDocument]]:
+        """件数・トークン数の上限に収まるバッチに分割（内容が変わっていない文書は除外）"""
+        batch: List[IngestDocument] = []
+        batch_tokens = 0
+        for item in records:
+            for doc in self._expand(normalize_record(item)):
+                self._seen_ids.add(doc.id)
+                doc.embed_text = truncate_to_tokens(doc.embed_text, settings.ingest_max_input_tokens)
+                doc.content_hash = compute_content_hash(doc)
+                if self.namespace_field:
+                    doc.namespace = str(doc.metadata.get(self.namespace_field) or "")
+
+                previous_hash = self.manifest.get_hash(doc.id)
+                previous_namespace = self.manifest.get_namespace(doc.id)
+                if previous_hash == doc.content_hash and previous_namespace == doc.namespace:
+                    self.stats.skipped += 1
+                    continue
+                if previous_hash is not None and previous_namespace != doc.namespace:
+                    doc.previous_namespace = previous_namespace
+                if previous_hash is None:
+                    self.stats.new += 1
+                else:
+                    self.stats.changed += 1
+
+                doc.tokens = count_tokens(doc.embed_text)
+                if batch and (
+                    len(batch) >= self.batch_max_items
+                    or batch_tokens + doc.tokens > self.batch_max_tokens
+                ):
+                    yield batch
+                    batch, batch_tokens = [], 0
+                batch.append(doc)
+                batch_tokens += doc.tokens
+        if batch:
+            yield batch
+
+    async def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        """レート制限・一時的なエラーを指数バックオフで再試行"""
+        for attempt in range(settings.ingest_max_retries + 1):
+            try:
+                return await self.embeddings_service.get_embeddings(texts)
+            except Exception as e:
+                cause = e.__cause__ or e
+                if not isinstance(cause, _RETRYABLE_ERRORS) or attempt == settings.ingest_max_retries:
+                    raise
+                delay = min(60.0, (2 ** attempt) + random.random())
+                response = getattr(cause, "response", None)
+                retry_after = (
+                    response.headers.get("retry-after") if response is not None
+                    else getattr(cause, "retry_after", None)
+                )
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                self.stats.retries += 1
+                print(f"⏳ {type(cause).__name__}: retrying in {delay:.1f}s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
+
+    async def _process_batch(self, batch: List[IngestDocument]):
+        embeddings = await self._embed_with_retry([doc.embed_text for doc in batch])
+
+        # namespaceが変わった文書は移動元から削除
+        moved: Dict[str, List[str]] = {}
+        for doc in batch:
+            if doc.previous_namespace is not None:
+                moved.setdefault(doc.previous_namespace, []).append(doc.id)
+        for namespace, doc_ids in moved.items():
+            await self.vector_store.async_delete_documents(doc_ids, namespace=namespace)
+
+        by_namespace: Dict[str, List[int]] = {}
+        for i, doc in enumerate(batch):
+            by_namespace.setdefault(doc.namespace, []).append(i)
+        for namespace, indices in by_namespace.items():
+            for start in range(0, len(indices), self.upsert_batch_size):
+                chunk_indices = indices[start:start + self.upsert_batch_size]
+                chunk = [batch[i] for i in chunk_indices]
+                await self._upsert_chunk(chunk, [embeddings[i] for i in chunk_indices], namespace)
+
+        self.stats.batches += 1
+        self.stats.documents += len(batch)
+        self.stats.tokens += sum(doc.tokens for doc in batch)
+        self._report_progress()
+
+    async def _upsert_chunk(
+        self,
+        chunk: List[IngestDocument],
+        embeddings: List[List[float]],
+        namespace: str
+    ):
+        await self.vector_store.async_add_documents(
+            documents=[doc.document for doc in chunk],
+            metadatas=[doc.metadata for doc in chunk],
+            ids=[doc.id for doc in chunk],
+            embeddings=embeddings,
+            namespace=namespace
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.upsert(
+                ids=[doc.id for doc in chunk],
+                documents=[doc.document for doc in chunk],
+                metadatas=[doc.metadata for doc in chunk]
+            )
+        self._pending.append(("done", chunk))
+        self._checkpoint()
+
+    def _checkpoint(self, force: bool = False):
+        """BM25インデックス・親条文ストアを保存してから、それまでに投入・削除した文書をマニフェストに記録
+        
+        保存は全件の書き直しになるため checkpoint_interval 秒ごとに行う。保存前に中断した文書は
+        マニフェストに記録されないので、再開時にもう一度投入される
+        """
+        if not self._pending:
+            return
+        if (
+            not force
+            and (self.lexical_index is not None or self.parent_store is not None)
+            and time.time() - self._last_checkpoint < self.checkpoint_interval
+        ):
+            return
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+        if self.parent_store is not None:
+            self.parent_store.save()
+        if self.lexical_index is not None or self.parent_store is not None:
+            # 検索サーバーに保存したインデックスを読み直させる
+            index_revision.bump()
+        pending, self._pending = self._pending, []
+        for action, items in pending:
+            if action == "done":
+                self.manifest.mark_done(items)
+            else:
+                self.manifest.mark_deleted(items)
+        self._last_checkpoint = time.time()
+
+    def _report_progress(self, force: bool = False):
+        if not force and time.time() - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = time.time()
+        summary = self.stats.summary()
+        print(
+            f"📦 {summary['documents']} docs ({summary['skipped']} unchanged), "
+            f"{summary['docs_per_second']} docs/s, {summary['tokens_per_second']} tokens/s, "
+            f"{summary['retries']} retries"
+        )
+
+    async def _delete(self, removed: Dict[str, List[str]]):
+        """namespaceごとに文書を削除し、マニフェストに記録"""
+        for namespace, doc_ids in removed.items():
+            for start in range(0, len(doc_ids), self.upsert_batch_size):
+                chunk = doc_ids[start:start + self.upsert_batch_size]
+                await self.vector_store.async_delete_documents(chunk, namespace=namespace)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete(chunk)
+                self._pending.append(("deleted", chunk))
+                self._checkpoint()
+                self.stats.deleted += len(chunk)
+
+    async def _prune(self):
+        """マニフェストにあり今回の入力に含まれない文書を削除"""
+        removed: Dict[str, List[str]] = {}
+        for doc_id in self.manifest.hashes:
+            if doc_id not in self._seen_ids:
+                removed.setdefault(self.manifest.get_namespace(doc_id), []).append(doc_id)
+        await self._delete(removed)
+        if self.parent_store is not None:
+            self.parent_store.delete([
+                article_id for article_id, _, _ in self.parent_store.iter_articles()
+                if article_id not in self._seen_sources
+            ])
+
+    async def run(self, path: str, prune: bool = False) -> Dict[str, Any]:
+        """ファイルを投入し、統計情報を返す
+        
+        prune=True の場合、入力を全件スナップショットとみなし、消えた文書を削除する
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        errors: List[Exception] = []
+
+        async def worker():
+            while True:
+                batch = await queue.get()
+                try:
+                    if batch is None:
+                        return
+                    await self._process_batch(batch)
+                except Exception as e:
+                    self.stats.failed_batches += 1
+                    errors.append(e)
+                    railway_logger.log_error(
+                        error_type="ingest_batch_failed",
+                        error_message=str(e),
+                        error_details={"batch_size": len(batch), "first_id": batch[0].id}
+                    )
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        for batch in self.iter_batches(iter_records(path)):
+            await queue.put(batch)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        self._checkpoint(force=True)
+
+        # 失敗したバッチがある場合は削除を行わない（入力を読み切れていない・置き換え先が未投入の可能性があるため）
+        if not errors:
+            await self._delete(self._stale)
+            if prune:
+                await self._prune()
+        self._checkpoint(force=True)
+        self.manifest.compact()
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+        if self.parent_store is not None:
+            self.parent_store.save()
+
+        self._report_progress(force=True)
+        summary = self.stats.summary()
+        railway_logger.log_system_event("ingest_complete", "Data ingestion completed", **summary)
+        if errors:
+            raise Exception(
+                f"{len(errors)} batches failed; re-run to resume from the manifest. First error: {errors[0]}"
+            )
+        return summary
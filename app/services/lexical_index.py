@@ -0,0 +1,265 @@
+"""
+日本語向けの語彙（BM25）インデックス
+
+条文番号や法律用語（「民法第415条」「公序良俗」など）の完全一致に強い検索を
+ベクター検索と組み合わせるためのローカルインデックス
+- トークン化: NFKC正規化後、日本語の連続部分は文字bigram、英数字は単語単位
+- 転置リストは語彙ごとの (文書番号, 出現回数) を連結したnumpy配列として保持
+- 投入時に文書を追加・削除し、save() で転置リストを作り直して保存する
+
+ファイル構成:
+    docs.jsonl     文書ID・本文・メタデータ（文書番号順）
+    vocab.json     語彙 → 語彙番号
+    postings.npz   offsets / doc_ids / term_freqs / doc_lengths
+"""
+
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from .metadata_filter import MetadataBitmapIndex
+
+
+_TOKEN_PATTERN = re.compile(
+    r"[0-9a-z]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff々〆ヶ]+"
+)
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """日本語は文字bigram、英数字は単語単位でトークン化"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        run = match.group()
+        if run[0].isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        # 文書ストア（投入時に更新し、save() で転置リストに反映）
+        self._docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._dirty = False
+
+        # 検索用の転置リスト
+        self._doc_ids: List[str] = []
+        self._vocab: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings_docs = np.zeros(0, dtype=np.int32)
+        self._postings_tfs = np.zeros(0, dtype=np.uint16)
+        self._doc_lengths = np.zeros(0, dtype=np.int32)
+        self._avg_doc_length = 0.0
+        self._length_norm = np.zeros(0, dtype=np.float32)
+        self._filter_index = MetadataBitmapIndex()
+
+        self._load()
+
+    @property
+    def document_count(self) -> int:
+        return len(self._doc_ids)
+
+    def _load(self):
+        docs_path = self.path / "docs.jsonl"
+        if not docs_path.exists():
+            return
+        with open(docs_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self._docs[record["id"]] = (record["document"], record["metadata"])
+
+        postings_path = self.path / "postings.npz"
+        vocab_path = self.path / "vocab.json"
+        if postings_path.exists() and vocab_path.exists():
+            self._vocab = json.loads(vocab_path.read_text(encoding="utf-8"))
+            arrays = np.load(postings_path)
+            self._set_postings(
+                list(self._docs.keys()),
+                arrays["offsets"], arrays["doc_ids"], arrays["term_freqs"], arrays["doc_lengths"]
+            )
+        else:
+            self.build()
+
+    def iter_documents(self):
+        """(文書ID, 本文, メタデータ) を順に返す"""
+        for doc_id, (document, metadata) in list(self._docs.items()):
+            yield doc_id, document, metadata
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]):
+        """文書を追加・更新（検索に反映するには build() / save() を呼ぶ）"""
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._docs[doc_id] = (document, metadata)
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        """文書を削除（検索に反映するには build() / save() を呼ぶ）"""
+        with self._lock:
+            for doc_id in ids:
+                self._docs.pop(doc_id, None)
+            self._dirty = True
+
+    @staticmethod
+    def _index_text(document: str, metadata: Dict[str, Any]) -> str:
+        return f"{metadata.get('LawTitle', '')} {metadata.get('ArticleTitle', '')} {document}"
+
+    def build(self):
+        """文書ストアから転置リストを作り直す"""
+        with self._lock:
+            doc_ids = list(self._docs.keys())
+            vocab: Dict[str, int] = {}
+            term_postings: List[List[Tuple[int, int]]] = []
+            doc_lengths = np.zeros(len(doc_ids), dtype=np.int32)
+
+            for doc_index, doc_id in enumerate(doc_ids):
+                document, metadata = self._docs[doc_id]
+                tokens = tokenize(self._index_text(document, metadata))
+                doc_lengths[doc_index] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    term_id = vocab.get(term)
+                    if term_id is None:
+                        term_id = vocab[term] = len(term_postings)
+                        term_postings.append([])
+                    term_postings[term_id].append((doc_index, tf))
+
+            offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(postings) for postings in term_postings])
+            postings_docs = np.empty(offsets[-1], dtype=np.int32)
+            postings_tfs = np.empty(offsets[-1], dtype=np.uint16)
+            for term_id, postings in enumerate(term_postings):
+                start, end = offsets[term_id], offsets[term_id + 1]
+                postings_docs[start:end] = [doc_index for doc_index, _ in postings]
+                postings_tfs[start:end] = [min(tf, 65535) for _, tf in postings]
+
+            self._vocab = vocab
+            self._set_postings(doc_ids, offsets, postings_docs, postings_tfs, doc_lengths)
+            self._dirty = False
+
+    def _set_postings(self, doc_ids, offsets, postings_docs, postings_tfs, doc_lengths):
+        self._doc_ids = doc_ids
+        self._offsets = offsets
+        self._postings_docs = postings_docs
+        self._postings_tfs = postings_tfs
+        self._doc_lengths = doc_lengths
+        self._avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        # BM25の文書長正規化項は検索ごとに変わらないので事前計算する
+        self._length_norm = (
+            _BM25_K1 * (1 - _BM25_B + _BM25_B * doc_lengths / max(self._avg_doc_length, 1e-9))
+        ).astype(np.float32)
+        filter_index = MetadataBitmapIndex()
+        filter_index.set_rows(range(len(doc_ids)), (self._docs[doc_id][1] for doc_id in doc_ids))
+        self._filter_index = filter_index
+
+    def save(self):
+        """転置リストを作り直してファイルに保存"""
+        if self._dirty:
+            self.build()
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            tmp_docs = self.path / "docs.jsonl.tmp"
+            with open(tmp_docs, "w", encoding="utf-8") as f:
+                for doc_id in self._doc_ids:
+                    document, metadata = self._docs[doc_id]
+                    f.write(json.dumps(
+                        {"id": doc_id, "document": document, "metadata": metadata},
+                        ensure_ascii=False
+                    ) + "\n")
+            (self.path / "vocab.json.tmp").write_text(
+                json.dumps(self._vocab, ensure_ascii=False), encoding="utf-8"
+            )
+            np.savez(
+                self.path / "postings.tmp.npz",
+                offsets=self._offsets,
+                doc_ids=self._postings_docs,
+                term_freqs=self._postings_tfs,
+                doc_lengths=self._doc_lengths
+            )
+            os.replace(tmp_docs, self.path / "docs.jsonl")
+            os.replace(self.path / "vocab.json.tmp", self.path / "vocab.json")
+            os.replace(self.path / "postings.tmp.npz", self.path / "postings.npz")
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """BM25で検索し、スコア順の {id, document, metadata, bm25_score} を返す
+        
+        filtersは metadata_filter.normalize_filters で正規化済みの条件
+        """
+        doc_count = len(self._doc_ids)
+        if doc_count == 0:
+            return []
+
+        term_ids = [self._vocab[term] for term in set(tokenize(query)) if term in self._vocab]
+        if not term_ids:
+            return []
+
+        scores = np.zeros(doc_count, dtype=np.float32)
+        length_norm = self._length_norm
+        for term_id in term_ids:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs = self._postings_docs[start:end]
+            tfs = self._postings_tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tfs * (_BM25_K1 + 1) / (tfs + length_norm[docs])
+
+        if filters:
+            scores[~self._filter_index.mask(filters, doc_count)] = 0
+        matched = np.flatnonzero(scores)
+        if len(matched) > n_results:
+            top = matched[np.argpartition(-scores[matched], n_results)[:n_results]]
+        else:
+            top = matched
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for doc_index in top:
+            doc_id = self._doc_ids[doc_index]
+            document, metadata = self._docs.get(doc_id, ("", {}))
+            results.append({
+                "id": doc_id,
+                "document": document,
+                "metadata": metadata,
+                "bm25_score": float(scores[doc_index])
+            })
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._doc_ids),
+            "vocabulary": len(self._vocab),
+            "postings": int(self._offsets[-1]),
+            "postings_bytes": int(self._postings_docs.nbytes + self._postings_tfs.nbytes + self._offsets.nbytes)
+        }
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """複数の順位リストをReciprocal Rank Fusionで統合（ID → 統合スコア）"""
+    fused: Dict[str, float] = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return fused
+
+
+# シングルトンインスタンス
+lexical_index: Optional[LexicalIndex] = (
+    LexicalIndex(settings.lexical_index_path) if settings.lexical_index_enabled else None
+)
@@ -0,0 +1,724 @@
+"""
+ローカル（プロセス内）ベクターストア
+
+Pineconeを使わずに同一プロセス内でベクター検索を行うバックエンド
+- ベクトルは正規化済みfloat32行列としてメモリマップファイルに保存
+- 件数が少ない間は全件のコサイン類似度を計算（厳密検索）
+- local_ivf_threshold 件以上になるとIVF（k-means粗量子化）インデックスで候補を絞り込む
+- local_scan_dtype を float16 / int8 にすると、量子化（必要に応じて先頭次元に切り詰めた
+  Matryoshka表現）の走査用行列で候補を選び、上位候補だけをfloat32で再スコアリングする
+- メタデータフィルタは行ごとのビットマップで事前に絞り込み、条件に合う行だけを走査する
+- デフォルト以外のnamespaceは namespaces/<namespace>/ 以下の独立したインデックスとして保持する
+
+ファイル構成:
+    manifest.json     次元数・件数・容量・走査用行列の設定
+    vectors.f32       float32行列（capacity x dimension、np.memmap）
+    scan.bin          走査用の量子化行列（capacity x scan_dimensions、float16 / int8）
+    scan_scales.f32   int8量子化の行ごとのスケール
+    records.jsonl     行番号ごとのID・文書・メタデータ（追記型ログ）
+    ivf_centroids.npy IVFの重心（IVF構築後のみ）
+    ivf_assign.npy    各行の所属リスト番号（IVF構築後のみ）
+    namespaces/       namespaceごとのインデックス（同じ構成、ディレクトリ名はURLエンコード）
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from config import settings
+from .base_vector_store import BaseVectorStore
+from .concurrency_limiter import AdaptiveLimiter
+from .metadata_filter import MetadataBitmapIndex
+
+
+_INITIAL_CAPACITY = 1024
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_SIZE = 100000
+_SCAN_BLOCK_ROWS = 4096
+_SCAN_DTYPES = {"float16": np.float16, "int8": np.int8}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """スコア上位k件のインデックスを降順で返す"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def _mask_deleted(scores: np.ndarray, rows: Optional[np.ndarray], live: np.ndarray, count: int):
+    """削除済み（またはフィルタ対象外）の行のスコアを -inf にする（rowsがNoneの場合は先頭count行）"""
+    mask = live[:count] if rows is None else live[rows]
+    if not mask.all():
+        scores[~mask] = -np.inf
+
+
+def _grow_memmap(
+    path: Path,
+    old: Optional[np.ndarray],
+    dtype,
+    shape: tuple,
+    count: int
+) -> np.ndarray:
+    """メモリマップファイルを新しい形状で作り直し、先頭count行をコピーする"""
+    tmp_path = path.with_suffix(".tmp")
+    new = np.memmap(tmp_path, dtype=dtype, mode="w+", shape=shape)
+    if old is not None and count:
+        new[:count] = old[:count]
+    new.flush()
+    del new
+    # 置き換え後も検索中の古いマップはそのまま有効
+    os.replace(tmp_path, path)
+    return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+
+def quantize_for_scan(matrix: np.ndarray, dtype: str, dimensions: int):
+    """正規化済みベクトルを走査用に変換（先頭次元への切り詰め + 量子化）
+    
+    戻り値は (量子化行列, int8の場合は行ごとのスケール / それ以外はNone)
+    """
+    truncated = _normalize_rows(matrix[:, :dimensions])
+    if dtype == "float16":
+        return truncated.astype(np.float16), None
+    scales = np.abs(truncated).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(truncated / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class LocalVectorStore(BaseVectorStore):
+    upstream_name = "local_vector_store"
+    
+    def __init__(
+        self,
+        path: str,
+        scan_dtype: Optional[str] = None,
+        scan_dimensions: Optional[int] = None,
+        rescore_factor: Optional[int] = None,
+        ivf_threshold: Optional[int] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limiter: Optional[AdaptiveLimiter] = None
+    ):
+        super().__init__(executor=executor, limiter=limiter)
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_name = str(self.path)
+
+        self._lock = threading.RLock()
+        self.dimension = int(settings.dimension)
+        self._count = 0
+        self._capacity = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)  # 削除済みの行はFalse
+        self._filter_index = MetadataBitmapIndex()
+        self._partitions: Dict[str, "LocalVectorStore"] = {}
+
+        # IVFインデックス
+        self._centroids: Optional[np.ndarray] = None
+        self._assign: Optional[np.ndarray] = None
+        self._ivf_lists: List[np.ndarray] = []
+        self._ivf_built_count = 0
+        # IVF構築中に追加・更新された行（構築完了時に新しい重心へ割り当て直す。構築中以外はNone）
+        self._ivf_pending_rows: Optional[List[int]] = None
+        self._build_lock = threading.Lock()
+        self.ivf_threshold = ivf_threshold if ivf_threshold is not None else settings.local_ivf_threshold
+
+        # 量子化された走査用行列（float32の場合は使用しない）
+        self.scan_dtype = (scan_dtype or settings.local_scan_dtype).lower()
+        if self.scan_dtype != "float32" and self.scan_dtype not in _SCAN_DTYPES:
+            raise ValueError(f"Unsupported scan dtype: {self.scan_dtype}")
+        self._scan_dimensions_setting = (
+            scan_dimensions if scan_dimensions is not None else settings.local_scan_dimensions
+        )
+        self.rescore_factor = rescore_factor or settings.local_rescore_factor
+        self._scan: Optional[np.ndarray] = None
+        self._scan_scales: Optional[np.ndarray] = None
+
+        self._load()
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.path / "manifest.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def _records_path(self) -> Path:
+        return self.path / "records.jsonl"
+
+    @property
+    def _scan_path(self) -> Path:
+        return self.path / "scan.bin"
+
+    @property
+    def _scan_scales_path(self) -> Path:
+        return self.path / "scan_scales.f32"
+
+    @property
+    def _namespaces_path(self) -> Path:
+        return self.path / "namespaces"
+
+    @property
+    def scan_enabled(self) -> bool:
+        return self.scan_dtype != "float32"
+
+    @property
+    def scan_dimensions(self) -> int:
+        """走査用行列の次元数（0または次元数以上の場合は切り詰めない）"""
+        dims = self._scan_dimensions_setting
+        return dims if 0 < dims < self.dimension else self.dimension
+
+    def _load(self):
+        """既存のインデックスを読み込む"""
+        if not self._manifest_path.exists():
+            return
+
+        manifest = json.loads(self._manifest_path.read_text(encoding="utf-8"))
+        self.dimension = manifest["dimension"]
+        self._count = manifest["count"]
+        self._capacity = manifest["capacity"]
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+",
+            shape=(self._capacity, self.dimension)
+        )
+
+        self._ids = [""] * self._count
+        self._documents = [""] * self._count
+        self._metadatas = [{} for _ in range(self._count)]
+        if self._records_path.exists():
+            with open(self._records_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    row = record["row"]
+                    if row >= self._count:
+                        continue
+                    self._ids[row] = record["id"]
+                    self._documents[row] = record["document"]
+                    self._metadatas[row] = record["metadata"]
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids) if doc_id}
+        self._live = np.array([bool(doc_id) for doc_id in self._ids], dtype=bool)
+        self._filter_index.set_rows(range(self._count), self._metadatas)
+
+        if self.scan_enabled:
+            scan_config = manifest.get("scan", {})
+            if (
+                scan_config.get("dtype") == self.scan_dtype
+                and scan_config.get("dimensions") == self.scan_dimensions
+                and self._scan_path.exists()
+            ):
+                self._open_scan()
+            else:
+                # 設定が変わった場合はfloat32行列から作り直す
+                self._rebuild_scan()
+
+        centroids_path = self.path / "ivf_centroids.npy"
+        assign_path = self.path / "ivf_assign.npy"
+        if centroids_path.exists() and assign_path.exists():
+            self._centroids = np.load(centroids_path)
+            assign = np.load(assign_path)
+            self._ivf_built_count = len(assign)
+            # IVF構築後に追加された行を割り当てる
+            if len(assign) < self._count:
+                extra = self._assign_to_centroids(np.asarray(self._vectors[len(assign):self._count]))
+                assign = np.concatenate([assign, extra])
+            self._set_assignments(assign)
+
+    def _write_manifest(self):
+        manifest = {
+            "dimension": self.dimension,
+            "count": self._count,
+            "capacity": self._capacity
+        }
+        if self.scan_enabled:
+            manifest["scan"] = {"dtype": self.scan_dtype, "dimensions": self.scan_dimensions}
+        tmp_path = self._manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp_path, self._manifest_path)
+
+    def _ensure_capacity(self, required: int):
+        """必要に応じてメモリマップファイルを拡張"""
+        if required <= self._capacity:
+            return
+
+        new_capacity = max(_INITIAL_CAPACITY, self._capacity)
+        while new_capacity < required:
+            new_capacity *= 2
+
+        self._vectors = _grow_memmap(
+            self._vectors_path, self._vectors, np.float32,
+            (new_capacity, self.dimension), self._count
+        )
+        if self.scan_enabled:
+            self._scan = _grow_memmap(
+                self._scan_path, self._scan, _SCAN_DTYPES[self.scan_dtype],
+                (new_capacity, self.scan_dimensions), self._count
+            )
+            if self.scan_dtype == "int8":
+                self._scan_scales = _grow_memmap(
+                    self._scan_scales_path, self._scan_scales, np.float32,
+                    (new_capacity,), self._count
+                )
+        self._capacity = new_capacity
+
+    def _open_scan(self):
+        self._scan = np.memmap(
+            self._scan_path, dtype=_SCAN_DTYPES[self.scan_dtype], mode="r+",
+            shape=(self._capacity, self.scan_dimensions)
+        )
+        if self.scan_dtype == "int8":
+            self._scan_scales = np.memmap(
+                self._scan_scales_path, dtype=np.float32, mode="r+",
+                shape=(self._capacity,)
+            )
+
+    def _rebuild_scan(self):
+        """float32行列から走査用行列を作り直す"""
+        self._scan = None
+        self._scan_scales = None
+        for path in (self._scan_path, self._scan_scales_path):
+            if path.exists():
+                path.unlink()
+        self._scan = _grow_memmap(
+            self._scan_path, None, _SCAN_DTYPES[self.scan_dtype],
+            (self._capacity, self.scan_dimensions), 0
+        )
+        if self.scan_dtype == "int8":
+            self._scan_scales = _grow_memmap(
+                self._scan_scales_path, None, np.float32, (self._capacity,), 0
+            )
+        for start in range(0, self._count, _SCAN_BLOCK_ROWS):
+            end = min(start + _SCAN_BLOCK_ROWS, self._count)
+            self._write_scan_rows(np.arange(start, end), np.asarray(self._vectors[start:end]))
+        self._write_manifest()
+
+    def _write_scan_rows(self, rows, matrix: np.ndarray):
+        quantized, scales = quantize_for_scan(matrix, self.scan_dtype, self.scan_dimensions)
+        self._scan[rows] = quantized
+        self._scan.flush()
+        if scales is not None:
+            self._scan_scales[rows] = scales
+            self._scan_scales.flush()
+
+    def _partition(self, namespace: str, create: bool = False) -> Optional["LocalVectorStore"]:
+        """namespaceのインデックスを返す（デフォルトnamespaceは自身、存在しない場合はNone）"""
+        if not namespace:
+            return self
+        with self._lock:
+            store = self._partitions.get(namespace)
+            if store is None:
+                path = self._namespaces_path / quote(namespace, safe="")
+                if not create and not path.exists():
+                    return None
+                # 検索は親の async_search から実行されるため、スレッドプールと同時実行数の制限は親と共有する
+                store = LocalVectorStore(
+                    str(path),
+                    scan_dtype=self.scan_dtype,
+                    scan_dimensions=self._scan_dimensions_setting,
+                    rescore_factor=self.rescore_factor,
+                    ivf_threshold=self.ivf_threshold,
+                    executor=self._executor,
+                    limiter=self.limiter
+                )
+                self._partitions[namespace] = store
+            return store
+
+    def list_namespaces(self) -> List[str]:
+        """文書が入っているnamespaceの一覧"""
+        namespaces = [""] if self._live.any() else []
+        if self._namespaces_path.exists():
+            for path in sorted(self._namespaces_path.iterdir()):
+                namespace = unquote(path.name)
+                if path.is_dir() and self._partition(namespace)._live.any():
+                    namespaces.append(namespace)
+        return namespaces or [""]
+
+    def add_documents(
+        self,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: List[List[float]],
+        namespace: str = ""
+    ):
+        """文書をベクターストアに追加（既存IDは上書き）"""
+        if namespace:
+            self._partition(namespace, create=True).add_documents(documents, metadatas, ids, embeddings)
+            self._notify_updated()
+            return True
+        try:
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            if matrix.ndim != 2 or matrix.shape[1] != self.dimension:
+                if self._count == 0 and matrix.ndim == 2:
+                    # 空のインデックスは最初に追加されたベクトルの次元に合わせる
+                    self.dimension = matrix.shape[1]
+                    self._capacity = 0
+                    self._vectors = None
+                    self._scan = None
+                    self._scan_scales = None
+                else:
+                    raise ValueError(
+                        f"Embedding dimension mismatch: expected {self.dimension}, got {matrix.shape}"
+                    )
+            matrix = _normalize_rows(matrix)
+
+            with self._lock:
+                rows = []
+                new_ids: Dict[str, int] = {}
+                next_row = self._count
+                for doc_id in ids:
+                    row = self._id_to_row.get(doc_id, new_ids.get(doc_id))
+                    if row is None:
+                        row = next_row
+                        new_ids[doc_id] = row
+                        next_row += 1
+                    rows.append(row)
+
+                # 拡張に失敗した場合に存在しない行を指すIDが残らないよう、先に容量を確保する
+                self._ensure_capacity(next_row)
+                self._id_to_row.update(new_ids)
+                self._vectors[rows] = matrix
+                self._vectors.flush()
+                if self.scan_enabled:
+                    self._write_scan_rows(rows, matrix)
+
+                new_rows = next_row - self._count
+                self._ids.extend([""] * new_rows)
+                self._documents.extend([""] * new_rows)
+                self._metadatas.extend([{} for _ in range(new_rows)])
+                live = np.concatenate([self._live, np.zeros(new_rows, dtype=bool)])
+                live[rows] = True
+                self._live = live
+
+                with open(self._records_path, "a", encoding="utf-8") as f:
+                    for row, doc_id, document, metadata in zip(rows, ids, documents, metadatas):
+                        self._ids[row] = doc_id
+                        self._documents[row] = document
+                        self._metadatas[row] = metadata
+                        f.write(json.dumps(
+                            {"row": row, "id": doc_id, "document": document, "metadata": metadata},
+                            ensure_ascii=False
+                        ) + "\n")
+
+                self._filter_index.set_rows(rows, metadatas)
+                old_count = self._count
+                self._count = next_row
+                self._write_manifest()
+                if self._ivf_pending_rows is not None:
+                    self._ivf_pending_rows.extend(rows)
+                rebuild = self._update_ivf(rows, matrix, old_count)
+
+            if rebuild:
+                # k-meansは時間がかかるため、ロックを解放してから構築する（構築中なら任せる）
+                self.build_index(wait=False)
+            self._notify_updated()
+            return True
+        except Exception as e:
+            raise Exception(f"Failed to add documents: {str(e)}")
+
+    def delete_documents(self, ids: List[str], namespace: str = ""):
+        """文書を削除（行は再利用せず、検索対象から除外する）"""
+        if namespace:
+            store = self._partition(namespace)
+            if store is not None:
+                store.delete_documents(ids)
+                self._notify_updated()
+            return True
+        try:
+            with self._lock:
+                rows = [self._id_to_row.pop(doc_id) for doc_id in ids if doc_id in self._id_to_row]
+                if not rows:
+                    return True
+                live = self._live.copy()
+                live[rows] = False
+                self._live = live
+                self._filter_index.clear_rows(rows)
+                with open(self._records_path, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        self._ids[row] = ""
+                        self._documents[row] = ""
+                        self._metadatas[row] = {}
+                        f.write(json.dumps({"row": row, "id": "", "document": "", "metadata": {}}) + "\n")
+
+            self._notify_updated()
+            return True
+        except Exception as e:
+            raise Exception(f"Failed to delete documents: {str(e)}")
+
+    def build_index(self, wait: bool = True):
+        """IVFインデックスを構築（k-means粗量子化）
+        
+        k-meansはストアのロックを持たずにその時点の行で実行し、構築中に追加・更新された行を
+        新しい重心へ割り当ててから差し替える。wait=False の場合、構築中であれば何もしない
+        """
+        if not self._build_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                count = self._count
+                if count == 0:
+                    return
+                vectors = np.asarray(self._vectors[:count])
+                self._ivf_pending_rows = []
+
+            try:
+                nlist = min(settings.local_ivf_nlist, count)
+                rng = np.random.default_rng(0)
+                sample_size = min(count, _KMEANS_SAMPLE_SIZE)
+                sample = vectors[rng.choice(count, size=sample_size, replace=False)]
+                centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+                for _ in range(_KMEANS_ITERATIONS):
+                    labels = np.argmax(sample @ centroids.T, axis=1)
+                    for c in range(nlist):
+                        members = sample[labels == c]
+                        if len(members):
+                            centroids[c] = members.mean(axis=0)
+                    centroids = _normalize_rows(centroids)
+                centroids = centroids.astype(np.float32)
+                assign = self._assign_to_centroids(vectors, centroids)
+            except BaseException:
+                with self._lock:
+                    self._ivf_pending_rows = None
+                raise
+
+            with self._lock:
+                pending = self._ivf_pending_rows
+                self._ivf_pending_rows = None
+                if self._count > count:
+                    extra = np.asarray(self._vectors[count:self._count])
+                    assign = np.concatenate([assign, self._assign_to_centroids(extra, centroids)])
+                updated = np.unique([row for row in pending if row < count])
+                if len(updated):
+                    assign[updated] = self._assign_to_centroids(
+                        np.asarray(self._vectors[updated]), centroids
+                    )
+                self._centroids = centroids
+                self._set_assignments(assign)
+                self._ivf_built_count = len(assign)
+
+                np.save(self.path / "ivf_centroids.npy", self._centroids)
+                np.save(self.path / "ivf_assign.npy", assign)
+        finally:
+            self._build_lock.release()
+
+    def _assign_to_centroids(self, vectors: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        if centroids is None:
+            centroids = self._centroids
+        assign = np.empty(len(vectors), dtype=np.int32)
+        # 大きな行列積を避けるため分割して割り当て
+        for start in range(0, len(vectors), 8192):
+            block = vectors[start:start + 8192]
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def _set_assignments(self, assign: np.ndarray):
+        self._assign = assign
+        order = np.argsort(assign, kind="stable")
+        boundaries = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+        self._ivf_lists = [
+            order[boundaries[c]:boundaries[c + 1]] for c in range(len(self._centroids))
+        ]
+
+    def _update_ivf(self, rows: List[int], matrix: np.ndarray, old_count: int) -> bool:
+        """追加・更新された行を現在のIVFに反映し、再構築が必要かどうかを返す
+        
+        （未構築で件数が閾値に達した場合・構築時から件数が大きく増えた場合に再構築する）
+        """
+        if self._count < self.ivf_threshold:
+            return False
+        if self._centroids is not None:
+            assign = np.concatenate([
+                self._assign,
+                np.zeros(self._count - old_count, dtype=np.int32)
+            ])
+            assign[rows] = self._assign_to_centroids(matrix)
+            self._set_assignments(assign)
+        return self._centroids is None or self._count > self._ivf_built_count * 1.5
+
+    def _candidate_rows(self, query: np.ndarray, count: int, ivf: tuple) -> Optional[np.ndarray]:
+        """IVFで探索対象の行を絞り込む（IVF未使用時はNone = 全件）
+        
+        ivf はロック内で取得した (重心, 各リストの行) の組（構築中の差し替えと食い違わないようにする）
+        """
+        centroids, lists = ivf
+        if count < self.ivf_threshold or centroids is None:
+            return None
+        centroid_scores = centroids @ query
+        probes = _top_k(centroid_scores, settings.local_ivf_nprobe)
+        candidates = np.concatenate([lists[c] for c in probes])
+        return candidates[candidates < count]
+
+    def _scan_scores(self, query: np.ndarray, rows: Optional[np.ndarray], count: int) -> np.ndarray:
+        """走査用行列で近似スコアを計算（rowsがNoneの場合は全件）"""
+        scan_query = query[:self.scan_dimensions]
+        norm = np.linalg.norm(scan_query)
+        if norm > 0:
+            scan_query = scan_query / norm
+
+        total = count if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        # float32への一括変換（巨大な一時配列）を避けるため、ブロック単位で
+        # einsumに型変換を任せて内積を計算する（int8ではBLAS経由より高速）
+        for start in range(0, total, _SCAN_BLOCK_ROWS):
+            end = min(start + _SCAN_BLOCK_ROWS, total)
+            block_rows = slice(start, end) if rows is None else rows[start:end]
+            block_scores = np.einsum("ij,j->i", self._scan[block_rows], scan_query)
+            if self._scan_scales is not None:
+                block_scores *= self._scan_scales[block_rows]
+            scores[start:end] = block_scores
+        return scores
+
+    def _scan_and_rescore(
+        self,
+        query: np.ndarray,
+        count: int,
+        candidates: Optional[np.ndarray],
+        n_results: int,
+        vectors: np.ndarray,
+        live: np.ndarray
+    ):
+        """量子化行列で候補を選び、上位候補のみfloat32で厳密に再スコアリング"""
+        approx = self._scan_scores(query, candidates, count)
+        _mask_deleted(approx, candidates, live, count)
+        shortlist = _top_k(approx, n_results * self.rescore_factor)
+        rows = shortlist if candidates is None else candidates[shortlist]
+        rows = np.sort(rows)  # メモリマップの読み出しを連続させる
+
+        exact = np.asarray(vectors[rows]) @ query
+        _mask_deleted(exact, rows, live, count)
+        order = _top_k(exact, n_results)
+        return rows[order], exact[order]
+
+    def _filtered_candidates(
+        self,
+        query: np.ndarray,
+        count: int,
+        allowed: np.ndarray,
+        ivf: tuple
+    ) -> np.ndarray:
+        """フィルタに合う行から探索対象を決める
+        
+        条件に合う行がIVFの閾値より少なければその行だけを厳密に走査し、
+        多ければIVFの候補のうち条件に合う行を走査する
+        """
+        filtered_rows = np.flatnonzero(allowed[:count])
+        if len(filtered_rows) < self.ivf_threshold:
+            return filtered_rows
+        candidates = self._candidate_rows(query, count, ivf)
+        if candidates is None:
+            return filtered_rows
+        return candidates[allowed[candidates]]
+
+    def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ) -> Dict[str, Any]:
+        """類似文書を検索（filtersは metadata_filter.normalize_filters で正規化済みの条件）"""
+        if namespace:
+            store = self._partition(namespace)
+            if store is None:
+                return {"documents": [[]], "metadatas": [[]], "distances": [[]], "ids": [[]]}
+            return store.search(query_embedding, n_results, filters)
+        try:
+            # 検索中に追加が行われても一貫した状態を参照する
+            with self._lock:
+                count = self._count
+                vectors = self._vectors
+                ids = self._ids
+                documents = self._documents
+                metadatas = self._metadatas
+                live = self._live
+                ivf = (self._centroids, self._ivf_lists)
+
+            empty = {"documents": [[]], "metadatas": [[]], "distances": [[]], "ids": [[]]}
+            if count == 0:
+                return empty
+
+            query = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+
+            if filters:
+                # 削除済みの行と条件に合わない行をまとめて除外するビットマップ
+                live = live[:count] & self._filter_index.mask(filters, count)
+                candidates = self._filtered_candidates(query, count, live, ivf)
+                if len(candidates) == 0:
+                    return empty
+            else:
+                candidates = self._candidate_rows(query, count, ivf)
+            if self.scan_enabled:
+                top_rows, top_scores = self._scan_and_rescore(
+                    query, count, candidates, n_results, vectors, live
+                )
+            elif candidates is None:
+                scores = np.asarray(vectors[:count]) @ query
+                _mask_deleted(scores, None, live, count)
+                top_rows = _top_k(scores, n_results)
+                top_scores = scores[top_rows]
+            else:
+                scores = np.asarray(vectors[candidates]) @ query
+                _mask_deleted(scores, candidates, live, count)
+                order = _top_k(scores, n_results)
+                top_rows = candidates[order]
+                top_scores = scores[order]
+
+            # 有効な件数がn_resultsより少ない場合は削除済みの行が混ざるので除く
+            keep = np.isfinite(top_scores)
+            top_rows, top_scores = top_rows[keep], top_scores[keep]
+
+            return {
+                "documents": [[documents[row] for row in top_rows]],
+                "metadatas": [[
+                    {k: v for k, v in metadatas[row].items() if k not in ("document", "original_text")}
+                    for row in top_rows
+                ]],
+                "distances": [[float(1 - score) for score in top_scores]],
+                "ids": [[ids[row] for row in top_rows]]
+            }
+        except Exception as e:
+            raise Exception(f"Failed to search documents: {str(e)}")
+
+    def get_collection_info(self) -> Dict[str, Any]:
+        """インデックス情報を取得"""
+        namespace_counts = {
+            namespace: int(self._partition(namespace)._live.sum())
+            for namespace in self.list_namespaces() if namespace
+        }
+        return {
+            "index_name": self.index_name,
+            "document_count": int(self._live.sum()) + sum(namespace_counts.values()),
+            "namespaces": namespace_counts,
+            "dimension": self.dimension,
+            "backend": "local",
+            "index_type": "ivf" if self._centroids is not None and self._count >= self.ivf_threshold else "flat",
+            "scan_dtype": self.scan_dtype,
+            "scan_dimensions": self.scan_dimensions
+        }
+
+    def close(self):
+        """スレッドプールを終了（namespaceごとのインデックスも含む）"""
+        for store in list(self._partitions.values()):
+            store.close()
+        super().close()
@@ -0,0 +1,194 @@
+"""
+メタデータフィルタ
+
+検索APIのフィルタ（法令ID・法令名・法令種別・更新日の範囲）を共通形式に正規化し、
+各バックエンドの絞り込みに変換する
+- Pinecone: メタデータフィルタ（更新日は数値フィールド updateDateNum で範囲指定）
+- ローカルインデックス / BM25: 値ごとのコード配列から作るビットマップ（条件ごとにキャッシュ）
+
+正規化後の形式:
+    {"LawID": [...], "LawTitle": [...], "LawType": [...], "updateDate": {"gte": 20200101, "lte": 20231231}}
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+
+import numpy as np
+
+from app.utils.dates import parse_date
+
+
+FILTER_FIELDS = ("LawID", "LawTitle", "LawType")
+# 検索APIのフィールド名 → メタデータのフィールド名
+_REQUEST_FIELDS = {"law_id": "LawID", "law_title": "LawTitle", "law_type": "LawType"}
+# Pineconeで範囲指定するための数値化した更新日
+PINECONE_DATE_FIELD = "updateDateNum"
+
+_MASK_CACHE_SIZE = 32
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """検索APIのフィルタを正規化（条件がない場合はNone）
+
+    キーは law_id / law_title / law_type（文字列または文字列のリスト）と
+    update_date_from / update_date_to。メタデータのフィールド名（LawID 等）も受け付ける
+    """
+    if not filters:
+        return None
+
+    normalized: Dict[str, Any] = {}
+    for key, value in filters.items():
+        if value is None or value == [] or value == "":
+            continue
+        field = _REQUEST_FIELDS.get(key, key)
+        if field in FILTER_FIELDS:
+            values = [value] if isinstance(value, str) else list(value)
+            normalized[field] = sorted({str(v) for v in values})
+        elif key in ("update_date_from", "update_date_to"):
+            date = parse_date(value)
+            if date is None:
+                raise ValueError(f"Invalid date for {key}: {value}")
+            bound = "gte" if key == "update_date_from" else "lte"
+            normalized.setdefault("updateDate", {})[bound] = date
+        elif key == "updateDate" and isinstance(value, dict):
+            normalized["updateDate"] = {bound: int(v) for bound, v in value.items() if v is not None}
+        else:
+            raise ValueError(f"Unsupported filter: {key}")
+
+    return normalized or None
+
+
+def to_pinecone_filter(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """正規化済みフィルタをPineconeのメタデータフィルタに変換"""
+    if not filters:
+        return None
+
+    clauses = []
+    for field in FILTER_FIELDS:
+        if filters.get(field):
+            clauses.append({field: {"$in": filters[field]}})
+    date_range = filters.get("updateDate")
+    if date_range:
+        # updateDateNum のない（この項目の追加前に投入した）ベクトルは、ローカルと同じく更新日不明として除外される
+        clauses.append({PINECONE_DATE_FIELD: {f"${bound}": value for bound, value in date_range.items()}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """1件のメタデータがフィルタを満たすか"""
+    if not filters:
+        return True
+    for field in FILTER_FIELDS:
+        if filters.get(field) and str(metadata.get(field, "")) not in filters[field]:
+            return False
+    date_range = filters.get("updateDate")
+    if date_range:
+        date = parse_date(metadata.get("updateDate"))
+        if date is None:
+            return False
+        if "gte" in date_range and date < date_range["gte"]:
+            return False
+        if "lte" in date_range and date > date_range["lte"]:
+            return False
+    return True
+
+
+class MetadataBitmapIndex:
+    """行番号ごとのフィルタ対象メタデータを保持し、条件に合う行のビットマップを返す
+
+    法令ID・法令名・法令種別は値ごとのコード（int32）、更新日は YYYYMMDD（0 = 不明）の配列で持つ。
+    ビットマップは (条件, 行数) ごとにキャッシュし、行の追加・削除時に破棄する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value_codes: Dict[str, Dict[str, int]] = {field: {} for field in FILTER_FIELDS}
+        self._codes: Dict[str, np.ndarray] = {
+            field: np.full(0, -1, dtype=np.int32) for field in FILTER_FIELDS
+        }
+        self._dates = np.zeros(0, dtype=np.int32)
+        self._mask_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def _grow(self, size: int):
+        """配列を拡張（検索中の参照を壊さないよう新しい配列に置き換える）"""
+        current = len(self._dates)
+        if size <= current:
+            return
+        new_size = max(size, current * 2)
+        for field in FILTER_FIELDS:
+            codes = np.full(new_size, -1, dtype=np.int32)
+            codes[:current] = self._codes[field]
+            self._codes[field] = codes
+        dates = np.zeros(new_size, dtype=np.int32)
+        dates[:current] = self._dates
+        self._dates = dates
+
+    def set_rows(self, rows: Iterable[int], metadatas: Iterable[Dict[str, Any]]):
+        """行のメタデータを登録・更新"""
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock:
+            self._grow(max(rows) + 1)
+            for row, metadata in zip(rows, metadatas):
+                for field in FILTER_FIELDS:
+                    value = metadata.get(field)
+                    if value in (None, ""):
+                        self._codes[field][row] = -1
+                        continue
+                    value_codes = self._value_codes[field]
+                    code = value_codes.setdefault(str(value), len(value_codes))
+                    self._codes[field][row] = code
+                self._dates[row] = parse_date(metadata.get("updateDate")) or 0
+            self._mask_cache.clear()
+
+    def clear_rows(self, rows: Iterable[int]):
+        """行をどの条件にも一致しない状態にする"""
+        with self._lock:
+            for row in rows:
+                if row < len(self._dates):
+                    for field in FILTER_FIELDS:
+                        self._codes[field][row] = -1
+                    self._dates[row] = 0
+            self._mask_cache.clear()
+
+    def mask(self, filters: Dict[str, Any], size: int) -> np.ndarray:
+        """条件を満たす先頭size行のビットマップ（bool配列）"""
+        key = json.dumps([filters, size], sort_keys=True)
+        with self._lock:
+            cached = self._mask_cache.get(key)
+            if cached is not None:
+                self._mask_cache.move_to_end(key)
+                return cached
+            codes = {field: self._codes[field] for field in FILTER_FIELDS}
+            value_codes = {field: dict(self._value_codes[field]) for field in FILTER_FIELDS}
+            dates = self._dates
+
+        mask = np.zeros(size, dtype=bool)
+        known = min(size, len(dates))
+        allowed = np.ones(known, dtype=bool)
+        for field in FILTER_FIELDS:
+            values: List[str] = filters.get(field) or []
+            if values:
+                wanted = [value_codes[field][v] for v in values if v in value_codes[field]]
+                allowed &= np.isin(codes[field][:known], wanted)
+        date_range = filters.get("updateDate")
+        if date_range:
+            row_dates = dates[:known]
+            allowed &= row_dates > 0
+            if "gte" in date_range:
+                allowed &= row_dates >= date_range["gte"]
+            if "lte" in date_range:
+                allowed &= row_dates <= date_range["lte"]
+        mask[:known] = allowed
+
+        with self._lock:
+            self._mask_cache[key] = mask
+            while len(self._mask_cache) > _MASK_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+        return mask
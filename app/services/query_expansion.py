@@ -0,0 +1,125 @@
+"""
+クエリ拡張（multi-query / HyDE）
+
+曖昧な質問で関連条文を取りこぼさないよう、クエリの言い換えを複数作って並行検索し、
+RRFで統合するための言い換えを生成する
+- rules: 口語表現を法令用語に置き換えた言い換えと、質問表現（「〜ですか」「〜について教えて」等）を除いた言い換え
+- hyde: LLMで生成した、回答となる条文の想定文（Hypothetical Document Embeddings）
+"""
+
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+from config import settings
+
+
+QUERY_EXPANSION_STRATEGIES = ("rules", "hyde", "rules+hyde")
+
+# 口語表現 → 条文で使われる用語（長い表現から順に置き換える）
+_LEGAL_TERMS = {
+    "クビになる": "解雇される",
+    "クビ": "解雇",
+    "首になる": "解雇される",
+    "辞めさせられる": "解雇される",
+    "会社を辞める": "退職する",
+    "残業代": "割増賃金",
+    "残業": "時間外労働",
+    "給料": "賃金",
+    "給与": "賃金",
+    "弁償": "損害賠償",
+    "借金": "債務",
+    "お金を返す": "弁済する",
+    "約束": "契約",
+    "大家": "賃貸人",
+    "貸主": "賃貸人",
+    "借主": "賃借人",
+    "家賃": "賃料",
+    "遺言書": "遺言",
+    "取り消し": "取消し",
+    "だまされ": "詐欺により",
+    "脅され": "強迫により",
+}
+_TERM_PATTERN = re.compile("|".join(re.escape(term) for term in sorted(_LEGAL_TERMS, key=len, reverse=True)))
+_QUESTION_SUFFIX = re.compile(
+    r"(について|に関して|に関する)?"
+    r"(教えてください|教えて下さい|教えて|知りたいです|知りたい|ですか|でしょうか|とは|って何|は何)"
+    r"[?？。!！\s]*$"
+)
+
+HYDE_PROMPT = """次の質問への回答の根拠となる日本の法令の条文を想定し、条文の文体で1〜3文で書いてください。
+法令名・条番号・説明は不要です。条文の本文だけを出力してください。
+
+質問: {query}"""
+
+
+def rule_based_variants(query: str, max_variants: int) -> List[str]:
+    """用語の置き換え・質問表現の除去による言い換え（元のクエリは含まない）"""
+    query = unicodedata.normalize("NFKC", query).strip()
+    stripped = _QUESTION_SUFFIX.sub("", query).strip()
+    candidates = [_TERM_PATTERN.sub(lambda m: _LEGAL_TERMS[m.group()], stripped), stripped]
+    variants: List[str] = []
+    for candidate in candidates:
+        if candidate and candidate != query and candidate not in variants:
+            variants.append(candidate)
+    return variants[:max_variants]
+
+
+class QueryExpander:
+    def __init__(self, strategy: Optional[str] = None, max_variants: Optional[int] = None):
+        self.strategy = (strategy or settings.multi_query_strategy).lower()
+        if self.strategy not in QUERY_EXPANSION_STRATEGIES:
+            raise ValueError(f"Unknown query expansion strategy: {self.strategy}")
+        self.max_variants = max_variants or settings.multi_query_max_variants
+
+        # 発生状況
+        self.expansions = 0
+        self.variants_generated = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def _hypothetical_document(self, query: str) -> Optional[str]:
+        """LLMで回答となる条文の想定文を生成"""
+        # OpenRouterを使わない環境（投入スクリプト等）で検索を読み込めるよう遅延インポートする
+        from .chat import chat_service
+
+        text = await chat_service.complete(
+            [{"role": "user", "content": HYDE_PROMPT.format(query=query)}],
+            max_tokens=settings.multi_query_hyde_max_tokens,
+            temperature=0.0,
+            model=settings.multi_query_hyde_model or None
+        )
+        return text.strip() or None
+
+    async def variants(self, query: str) -> List[str]:
+        """元のクエリ以外の検索クエリを返す"""
+        self.expansions += 1
+        variants: List[str] = []
+        if "hyde" in self.strategy:
+            document = await self._hypothetical_document(query)
+            if document:
+                variants.append(document)
+        if "rules" in self.strategy:
+            variants.extend(rule_based_variants(query, self.max_variants - len(variants)))
+        self.variants_generated += len(variants)
+        return variants
+
+    def record_timeout(self):
+        self.timeouts += 1
+
+    def record_error(self):
+        self.errors += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "max_variants": self.max_variants,
+            "expansions": self.expansions,
+            "variants_generated": self.variants_generated,
+            "timeouts": self.timeouts,
+            "errors": self.errors
+        }
+
+
+# シングルトンインスタンス
+query_expander = QueryExpander()
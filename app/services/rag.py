@@ -1,33 +1,140 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
+import asyncio
+import hashlib
+import json
 import time
+from config import settings
 from app.models.schemas import Message
 from app.utils.railway_logger import railway_logger
 from .search import search_service
 from .chat import chat_service
+from .context_packer import PackedPrompt
+from .reranker import reranker
+from .embedding_cache import normalize_query
+from .single_flight import SingleFlight
+
+
+# レスポンスに常に含める処理時間（debug有効時は段階ごとの内訳もすべて返す）
+_SUMMARY_TIMINGS = ("search_ms", "rerank_ms", "first_token_ms", "generation_ms", "total_ms")
+
+
+def _response_timings(timings: Dict[str, float]) -> Dict[str, float]:
+    if settings.debug:
+        return dict(timings)
+    return {key: value for key, value in timings.items() if key in _SUMMARY_TIMINGS}
+
+
+def _chat_flight_key(messages: List[Message], max_context_docs: int, rerank: Optional[bool]) -> str:
+    """実行中の同じ質問を共有するためのキー（会話の正規化は回答キャッシュと同じ）"""
+    payload = json.dumps(
+        {
+            "messages": [[message.role, normalize_query(message.content)] for message in messages],
+            "max_context_docs": max_context_docs,
+            "rerank": rerank
+        },
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 class RAGService:
     def __init__(self):
         self.search_service = search_service
         self.chat_service = chat_service
+        self.reranker = reranker
+        
+        # 同じ会話が同時に届いた場合は検索・回答生成を1回だけ実行して結果を共有
+        self.single_flight = SingleFlight("chat") if settings.single_flight_enabled else None
+        self.stream_single_flight = SingleFlight("chat_stream") if settings.single_flight_enabled else None
+    
+    async def _retrieve(
+        self,
+        user_query: str,
+        max_context_docs: int,
+        rerank: Optional[bool] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """関連条文を検索（再ランキング有効時は多めに取得して並べ替え）し、段階ごとの処理時間を返す"""
+        use_rerank = self.reranker is not None and rerank is not False
+        n_results = self.reranker.candidate_count(max_context_docs) if use_rerank else max_context_docs
+        
+        timings: Dict[str, float] = {}
+        start_time = time.time()
+        search_results = await self.search_service.search_documents(
+            query=user_query,
+            n_results=n_results,
+            timings=timings
+        )
+        timings["search_ms"] = (time.time() - start_time) * 1000
+        
+        if use_rerank:
+            search_results, timings["rerank_ms"] = await self.reranker.rerank(
+                user_query, search_results, max_context_docs
+            )
+        return search_results, timings
+    
+    async def _prepare(
+        self,
+        messages: List[Message],
+        user_query: str,
+        max_context_docs: int,
+        rerank: Optional[bool] = None
+    ) -> Tuple[List[Dict[str, Any]], PackedPrompt, Dict[str, float]]:
+        """関連条文の検索（→再ランキング）と会話履歴の整理を並行実行し、プロンプトを作成
+        
+        (検索結果, プロンプト, 段階ごとの処理時間) を返す
+        """
+        loop = asyncio.get_running_loop()
+        
+        async def prepare_history():
+            start_time = time.time()
+            # トークン数の計算はCPU処理のためイベントループ外で行う
+            history = await loop.run_in_executor(None, self.chat_service.prepare_history, messages)
+            return history, (time.time() - start_time) * 1000
+        
+        start_time = time.time()
+        (search_results, timings), (history, history_ms) = await asyncio.gather(
+            self._retrieve(user_query, max_context_docs, rerank),
+            prepare_history()
+        )
+        timings["history_ms"] = history_ms
+        timings["retrieval_ms"] = (time.time() - start_time) * 1000
+        
+        start_time = time.time()
+        prompt = self.chat_service.build_prompt(messages, search_results, history=history)
+        timings["prompt_ms"] = (time.time() - start_time) * 1000
+        return search_results, prompt, timings
     
     async def chat_with_rag(
         self, 
         messages: List[Message], 
-        max_context_docs: int = 3
+        max_context_docs: int = 3,
+        rerank: Optional[bool] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
-        """RAGパイプライン: 検索 → 回答生成"""
-        start_time = time.time()
+        """RAGパイプライン: 検索 →（再ランキング →）回答生成（検索中に会話履歴を並行して整理）
         
-        # 最新のユーザーメッセージを取得
-        user_query = ""
-        for message in reversed(messages):
-            if message.role == "user":
-                user_query = message.content
-                break
+        同じ会話の処理が実行中の場合は、その結果を共有する。
+        use_cache=False の場合は回答キャッシュ・実行中の処理の共有を使わずに生成する（生成結果も保存しない）
+        """
+        if not (use_cache and self.single_flight):
+            return await self._chat_with_rag(messages, max_context_docs, rerank, use_cache)
+        # ユーザーメッセージがない場合は共有する前に例外とする
+        self._extract_user_query(messages)
+        return await self.single_flight.do(
+            _chat_flight_key(messages, max_context_docs, rerank),
+            lambda: self._chat_with_rag(messages, max_context_docs, rerank, use_cache)
+        )
+    
+    async def _chat_with_rag(
+        self,
+        messages: List[Message],
+        max_context_docs: int,
+        rerank: Optional[bool],
+        use_cache: bool
+    ) -> Dict[str, Any]:
+        start_time = time.time()
         
-        if not user_query:
-            raise ValueError("No user message found in conversation history")
+        user_query = self._extract_user_query(messages)
         
         # RAGパイプライン開始ログ
         railway_logger.log_rag_pipeline(
@@ -35,41 +142,191 @@ class RAGService:
             user_query=user_query
         )
         
-        # 1. 関連条文を検索
-        search_results = await self.search_service.search_documents(
-            query=user_query,
-            n_results=max_context_docs
+        # 1. 関連条文の検索と会話履歴の整理を並行実行し、トークン予算内のプロンプトを作成
+        search_results, prompt, timings = await self._prepare(
+            messages, user_query, max_context_docs, rerank
         )
+        context_documents = prompt.source_documents
         
         # 検索完了ログ
         railway_logger.log_rag_pipeline(
             stage="search_complete",
             user_query=user_query,
-            context_docs_count=len(search_results)
+            context_docs_count=len(search_results),
+            timings=timings
         )
         
-        # 2. AI回答を生成
-        ai_response = await self.chat_service.generate_response(
-            messages=messages,
-            context_documents=search_results
-        )
+        # 2. AI回答を生成（同じ会話・同じ改訂の条文に対する回答がキャッシュにあれば再利用）
+        generation_start = time.time()
+        cache_key = self.chat_service.answer_cache_key(messages, prompt) if use_cache else None
+        cached = self.chat_service.get_cached_answer(cache_key)
+        if cached is not None:
+            ai_response = cached["content"]
+            railway_logger.log_system_event("answer_cache_hit", "Answer served from cache")
+        else:
+            ai_response = await self.chat_service.generate_response(
+                messages=messages,
+                context_documents=context_documents,
+                prompt=prompt,
+                cache_key=cache_key
+            )
+        timings["generation_ms"] = (time.time() - generation_start) * 1000
         
         # 生成完了ログ
         total_time_ms = (time.time() - start_time) * 1000
+        timings["total_ms"] = total_time_ms
         railway_logger.log_rag_pipeline(
             stage="complete",
             user_query=user_query,
-            context_docs_count=len(search_results),
-            total_time_ms=total_time_ms
+            context_docs_count=len(context_documents),
+            total_time_ms=total_time_ms,
+            timings=timings
         )
         
         # 3. 結果を構造化して返す
         return {
             "user_query": user_query,
             "ai_response": ai_response,
-            "context_documents": search_results,
-            "total_context_docs": len(search_results)
+            "context_documents": context_documents,
+            "total_context_docs": len(context_documents),
+            "timings": _response_timings(timings),
+            "context_packing": prompt.stats or None,
+            "cached": cached is not None
+        }
+    
+    async def stream_chat_with_rag(
+        self, 
+        messages: List[Message], 
+        max_context_docs: int = 3,
+        rerank: Optional[bool] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """RAGパイプライン（ストリーミング）: 検索 →（再ランキング →）回答生成（検索中に会話履歴を並行して整理）
+        
+        context → token（複数） → done の順でイベントを返す。
+        回答キャッシュにある場合は回答全体を1つの token として返す。
+        同じ会話のストリーミングが実行中の場合は、それまでのイベントを再送したうえで同じイベント列を共有する
+        """
+        if not (use_cache and self.stream_single_flight):
+            async for event in self._stream_chat_with_rag(messages, max_context_docs, rerank, use_cache):
+                yield event
+            return
+        # ユーザーメッセージがない場合は共有する前に例外とする
+        self._extract_user_query(messages)
+        async for event in self.stream_single_flight.stream(
+            _chat_flight_key(messages, max_context_docs, rerank),
+            lambda: self._stream_chat_with_rag(messages, max_context_docs, rerank, use_cache)
+        ):
+            yield event
+    
+    async def _stream_chat_with_rag(
+        self,
+        messages: List[Message],
+        max_context_docs: int,
+        rerank: Optional[bool],
+        use_cache: bool
+    ) -> AsyncIterator[Dict[str, Any]]:
+        start_time = time.time()
+        
+        user_query = self._extract_user_query(messages)
+        
+        railway_logger.log_rag_pipeline(
+            stage="start",
+            user_query=user_query
+        )
+        
+        # 1. 関連条文の検索と会話履歴の整理を並行実行し、生成開始前に条文をクライアントへ送る
+        search_results, prompt, timings = await self._prepare(
+            messages, user_query, max_context_docs, rerank
+        )
+        context_documents = prompt.source_documents
+        retrieval_time_ms = (time.time() - start_time) * 1000
+        
+        railway_logger.log_rag_pipeline(
+            stage="search_complete",
+            user_query=user_query,
+            context_docs_count=len(search_results),
+            timings=timings
+        )
+        
+        # プロンプトに含める条文（重複除去・予算適用後。切り詰め前の本文）をクライアントへ送る
+        yield {
+            "type": "context",
+            "user_query": user_query,
+            "context_documents": context_documents,
+            "total_context_docs": len(context_documents)
         }
+        
+        cache_key = self.chat_service.answer_cache_key(messages, prompt) if use_cache else None
+        cached = self.chat_service.get_cached_answer(cache_key)
+        if cached is not None:
+            railway_logger.log_system_event("answer_cache_hit", "Answer served from cache")
+            yield {"type": "token", "content": cached["content"]}
+            total_time_ms = (time.time() - start_time) * 1000
+            timings.update({"first_token_ms": total_time_ms, "generation_ms": 0.0, "total_ms": total_time_ms})
+            railway_logger.log_rag_pipeline(
+                stage="complete",
+                user_query=user_query,
+                context_docs_count=len(context_documents),
+                total_time_ms=total_time_ms,
+                timings=timings
+            )
+            yield {
+                "type": "done",
+                "model": cached["model"],
+                "usage": cached["usage"],
+                "timings": _response_timings(timings),
+                "context_packing": prompt.stats or None,
+                "cached": True
+            }
+            return
+        
+        # 2. AI回答をトークン単位で転送
+        async for event in self.chat_service.stream_response(
+            messages=messages,
+            context_documents=context_documents,
+            prompt=prompt,
+            cache_key=cache_key
+        ):
+            if event["type"] != "done":
+                yield event
+                continue
+            
+            total_time_ms = (time.time() - start_time) * 1000
+            timings.update({
+                "first_token_ms": retrieval_time_ms + event["first_token_ms"],
+                "generation_ms": event["response_time_ms"],
+                "total_ms": total_time_ms
+            })
+            railway_logger.log_rag_pipeline(
+                stage="complete",
+                user_query=user_query,
+                context_docs_count=len(context_documents),
+                total_time_ms=total_time_ms,
+                timings=timings
+            )
+            
+            yield {
+                "type": "done",
+                "model": event["model"],
+                "usage": event["usage"],
+                "timings": _response_timings(timings),
+                "context_packing": prompt.stats or None,
+                "cached": False
+            }
+    
+    def _extract_user_query(self, messages: List[Message]) -> str:
+        """最新のユーザーメッセージを取得"""
+        user_query = ""
+        for message in reversed(messages):
+            if message.role == "user":
+                user_query = message.content
+                break
+        
+        if not user_query:
+            raise ValueError("No user message found in conversation history")
+        
+        return user_query
 
 
 # シングルトンインスタンス
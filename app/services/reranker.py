@@ -0,0 +1,194 @@
+"""
+検索結果の再ランキング
+
+ベクター検索で多めに取得した候補（max_context_docs × rerank_overfetch_factor 件）を
+CPU上のスコアラーで並べ替え、上位だけを回答生成のコンテキストに使う
+- スコアラーは差し替え可能（lexical: 語彙の重なり / onnx: ONNXのcross-encoder / passthrough: 並べ替えなし）
+- 候補はバッチに分け、専用スレッドプールで並行してスコアリングする
+- 条文引用で解決した結果（match == "citation"）は常に先頭に残す
+"""
+
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from .lexical_index import tokenize
+
+
+def _rerank_text(result: Dict[str, Any]) -> str:
+    metadata = result.get("metadata", {})
+    return f"{metadata.get('LawTitle', '')} {metadata.get('ArticleTitle', '')}\n{result.get('document', '')}"
+
+
+class BaseScorer:
+    """(クエリ, 候補) の関連度を返すスコアラー（値が大きいほど関連が高い）"""
+
+    name = "base"
+
+    def score(self, query: str, results: List[Dict[str, Any]]) -> List[float]:
+        raise NotImplementedError
+
+
+class PassthroughScorer(BaseScorer):
+    """検索時の類似度をそのまま返す（再ランキング段のオーバーヘッド計測用）"""
+
+    name = "passthrough"
+
+    def score(self, query: str, results: List[Dict[str, Any]]) -> List[float]:
+        return [float(result.get("similarity_score", 0.0)) for result in results]
+
+
+class LexicalOverlapScorer(BaseScorer):
+    """クエリの語（文字bigram）が候補にどれだけ含まれるかと、検索時の類似度の加重和"""
+
+    name = "lexical"
+
+    def __init__(self, similarity_weight: float = 0.5):
+        self.similarity_weight = similarity_weight
+
+    def score(self, query: str, results: List[Dict[str, Any]]) -> List[float]:
+        query_terms = Counter(tokenize(query))
+        total = sum(query_terms.values())
+        scores = []
+        for result in results:
+            overlap = 0.0
+            if total:
+                doc_terms = Counter(tokenize(_rerank_text(result)))
+                overlap = sum(min(tf, doc_terms[term]) for term, tf in query_terms.items()) / total
+            similarity = float(result.get("similarity_score", 0.0))
+            scores.append((1 - self.similarity_weight) * overlap + self.similarity_weight * similarity)
+        return scores
+
+
+class ONNXCrossEncoderScorer(BaseScorer):
+    """ONNX形式のcross-encoderで (クエリ, 条文) の組をスコアリング
+
+    onnxruntime と tokenizers が必要（requirementsには含めていない）
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, tokenizer_path: str, max_length: int = 512):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "onnxruntime and tokenizers are required for the ONNX reranker "
+                "(pip install onnxruntime tokenizers)"
+            ) from e
+
+        options = onnxruntime.SessionOptions()
+        # 並列度はスレッドプール側で制御する
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+    def score(self, query: str, results: List[Dict[str, Any]]) -> List[float]:
+        encodings = self.tokenizer.encode_batch([(query, _rerank_text(result)) for result in results])
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        logits = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+        logits = np.asarray(logits)
+        if logits.ndim == 2:
+            # 2クラス出力の場合は「関連あり」のロジット
+            logits = logits[:, -1]
+        return logits.astype(float).tolist()
+
+
+def create_scorer(name: Optional[str] = None) -> BaseScorer:
+    """設定に応じたスコアラーを作成"""
+    name = (name or settings.rerank_scorer).lower()
+    if name == "lexical":
+        return LexicalOverlapScorer(similarity_weight=settings.rerank_similarity_weight)
+    if name == "passthrough":
+        return PassthroughScorer()
+    if name == "onnx":
+        if not settings.rerank_onnx_model_path or not settings.rerank_onnx_tokenizer_path:
+            raise ValueError("RERANK_ONNX_MODEL_PATH and RERANK_ONNX_TOKENIZER_PATH are required")
+        return ONNXCrossEncoderScorer(
+            settings.rerank_onnx_model_path,
+            settings.rerank_onnx_tokenizer_path,
+            max_length=settings.rerank_max_length
+        )
+    raise ValueError(f"Unknown rerank scorer: {name}")
+
+
+class Reranker:
+    def __init__(
+        self,
+        scorer: BaseScorer,
+        batch_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        overfetch_factor: Optional[int] = None
+    ):
+        self.scorer = scorer
+        self.batch_size = batch_size or settings.rerank_batch_size
+        self.overfetch_factor = overfetch_factor or settings.rerank_overfetch_factor
+        # スコアリングはCPU処理のためイベントループ外の専用スレッドプールで行う
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.rerank_max_workers,
+            thread_name_prefix="reranker"
+        )
+
+    def candidate_count(self, top_k: int) -> int:
+        """再ランキング前に取得する候補数"""
+        return top_k * self.overfetch_factor
+
+    async def rerank(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        top_k: int
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """候補を並べ替えて上位top_k件と処理時間（ms）を返す"""
+        start_time = time.time()
+        pinned = [result for result in results if result.get("match") == "citation"]
+        candidates = [result for result in results if result.get("match") != "citation"]
+
+        if candidates and len(pinned) < top_k:
+            loop = asyncio.get_running_loop()
+            batches = [
+                candidates[start:start + self.batch_size]
+                for start in range(0, len(candidates), self.batch_size)
+            ]
+            batch_scores = await asyncio.gather(*[
+                loop.run_in_executor(self._executor, self.scorer.score, query, batch)
+                for batch in batches
+            ])
+            scores = [score for batch in batch_scores for score in batch]
+            candidates = [
+                {**result, "rerank_score": score}
+                for score, result in sorted(
+                    zip(scores, candidates), key=lambda pair: pair[0], reverse=True
+                )
+            ]
+
+        return (pinned + candidates)[:top_k], (time.time() - start_time) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "scorer": self.scorer.name,
+            "overfetch_factor": self.overfetch_factor,
+            "batch_size": self.batch_size
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+# シングルトンインスタンス（無効の場合はNone）
+reranker: Optional[Reranker] = Reranker(create_scorer()) if settings.rerank_enabled else None
@@ -0,0 +1,189 @@
+"""
+検索結果キャッシュ
+
+(正規化クエリ, 件数, namespace, フィルタ) をキーに SearchService の整形済み結果を保持する
+- LRU+TTL、エントリ数とおおよそのメモリ使用量で上限を設ける
+- VectorStore への upsert 時に全件無効化する
+- 別プロセス（scripts/ingest_data.py 等）の更新は、ディスク上のインデックスリビジョンの変化で検知して無効化する
+- 値はJSON化できれば検索結果以外も保持できる（回答キャッシュ等）
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from config import settings
+from .embedding_cache import normalize_query
+
+
+# ディスク上のリビジョンを確認する間隔（ヒットのたびにファイルを読まないため）
+REVISION_CHECK_INTERVAL_SECONDS = 1.0
+
+
+def make_result_cache_key(
+    query: str,
+    n_results: int,
+    namespace: str = "",
+    filters: Optional[Dict[str, Any]] = None,
+    **options
+) -> str:
+    """検索条件からキャッシュキーを作成"""
+    payload = json.dumps(
+        {
+            "query": normalize_query(query),
+            "n_results": n_results,
+            "namespace": namespace,
+            "filters": filters or {},
+            "options": options
+        },
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexRevision:
+    """インデックスの更新をプロセス間で共有するリビジョンファイル
+    
+    文書を追加・削除したプロセスが bump で新しい値を書き込み、
+    キャッシュを持つプロセスは current の変化で更新を検知する
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+    
+    def bump(self):
+        """新しいリビジョンを書き込む（一時ファイルからの置き換えで読み手に途中の内容を見せない）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(uuid.uuid4().hex, encoding="utf-8")
+        os.replace(temp_path, self.path)
+    
+    def current(self) -> Optional[str]:
+        """現在のリビジョン（一度も更新されていない場合はNone）"""
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+
+class ResultCache:
+    """整形済み検索結果のLRU+TTLキャッシュ（メモリ使用量の上限付き）
+    
+    revision を指定した場合は、そのリビジョンが変わった時点で全エントリを無効化する
+    """
+    
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: float,
+        revision: Optional[IndexRevision] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # key -> (作成時刻, おおよそのバイト数, 値)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        # 無効化のたびに進む世代番号（検索中に無効化された結果を保存しないために使う）
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.revision = revision
+        self._revision_value = revision.current() if revision else None
+        self._revision_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        self._check_revision()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds > 0 and time.time() - entry[0] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 呼び出し側での変更がキャッシュに波及しないようコピーを返す
+            return copy.deepcopy(entry[2])
+    
+    def generation(self) -> int:
+        """現在の世代番号（検索開始前に取得して set に渡す）"""
+        return self._generation
+    
+    def set(self, key: str, results: Any, generation: Optional[int] = None):
+        """結果を保存（generation を指定した場合、その後に無効化されていれば保存しない）"""
+        size = len(json.dumps(results, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), size, copy.deepcopy(results))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+    
+    def invalidate(self):
+        """全エントリを無効化（ベクターストア更新時に呼び出す）"""
+        with self._lock:
+            self._clear()
+            if self.revision:
+                # 自プロセスの更新で書き込まれたリビジョンで再度無効化しないよう記録しておく
+                self._revision_value = self.revision.current()
+                self._revision_checked_at = time.monotonic()
+    
+    def _check_revision(self):
+        """別プロセスがインデックスを更新していれば全エントリを無効化"""
+        if self.revision is None or time.monotonic() - self._revision_checked_at < REVISION_CHECK_INTERVAL_SECONDS:
+            return
+        revision = self.revision.current()
+        with self._lock:
+            self._revision_checked_at = time.monotonic()
+            if revision != self._revision_value:
+                self._revision_value = revision
+                self._clear()
+    
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._generation += 1
+        self.invalidations += 1
+    
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を取得"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "approx_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
+# シングルトンインスタンス
+index_revision = IndexRevision(settings.index_revision_path)
@@ -1,39 +1,444 @@
-from typing import List, Dict, Any
+import asyncio
+import time
+from typing import List, Dict, Any, Optional
+from config import settings
 from .embeddings import embeddings_service
 from .vector_store import vector_store
+from .lexical_index import LexicalIndex, lexical_index, reciprocal_rank_fusion
+from .citation_index import CitationIndex, article_documents, citation_index
+from .chunking import ParentStore, parent_store
+from .query_expansion import query_expander
+from app.utils.railway_logger import railway_logger
+from .metadata_filter import normalize_filters
+from .result_cache import REVISION_CHECK_INTERVAL_SECONDS, ResultCache, index_revision, make_result_cache_key
+from .single_flight import SingleFlight
+from .concurrency_limiter import UpstreamOverloaded
+
+
+SEARCH_MODES = ("vector", "hybrid")
+# 埋め込みAPIの1リクエストあたりの入力数の上限
+_EMBEDDING_BATCH_LIMIT = 2048
+# 親条文へ展開する場合の取得件数の倍率（同じ条文のチャンクは1件にまとまるため）
+_EXPAND_OVERFETCH_FACTOR = 2
 
 
 class SearchService:
     def __init__(self):
         self.embeddings_service = embeddings_service
         self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.citation_index = citation_index
+        self.parent_store = parent_store
+        self.query_expander = query_expander
+        
+        # 整形済み検索結果のキャッシュ（文書追加時に無効化）
+        self.result_cache = None
+        if settings.search_cache_enabled:
+            self.result_cache = ResultCache(
+                max_entries=settings.search_cache_max_entries,
+                max_bytes=settings.search_cache_max_bytes,
+                ttl_seconds=settings.search_cache_ttl_seconds,
+                revision=index_revision
+            )
+            self.vector_store.add_invalidation_callback(self.result_cache.invalidate)
+        
+        # 同じ条件の検索が同時に届いた場合は1回だけ実行して結果を共有
+        self.single_flight = SingleFlight("search") if settings.single_flight_enabled else None
+        
+        # 投入スクリプト（別プロセス）が保存したBM25インデックス・親条文ストアはリビジョンの変化で読み直す
+        self._index_revision = index_revision.current()
+        self._index_checked_at = time.monotonic()
+        self._reloading_indexes = False
+    
+    async def _refresh_indexes(self):
+        """インデックスのリビジョンが変わっていれば、BM25インデックス・親条文ストア・引用インデックスを読み直す
+        
+        読み込みはスレッドで行い、完了するまでの検索は読み込み前のインデックスを使う
+        """
+        if self._reloading_indexes or time.monotonic() - self._index_checked_at < REVISION_CHECK_INTERVAL_SECONDS:
+            return
+        self._index_checked_at = time.monotonic()
+        revision = index_revision.current()
+        if revision == self._index_revision:
+            return
+        
+        self._reloading_indexes = True
+        try:
+            loop = asyncio.get_running_loop()
+            lexical, parents, citations = await loop.run_in_executor(None, self._load_indexes)
+        except Exception as e:
+            railway_logger.log_error(
+                error_type="index_reload_failed",
+                error_message=str(e),
+                error_details={"revision": revision}
+            )
+            return
+        finally:
+            self._reloading_indexes = False
+        
+        self.lexical_index, self.parent_store, self.citation_index = lexical, parents, citations
+        self._index_revision = revision
+        if self.result_cache:
+            self.result_cache.invalidate()
+        railway_logger.log_system_event(
+            "indexes_reloaded", "Search indexes reloaded",
+            revision=revision,
+            lexical_documents=lexical.document_count if lexical else 0,
+            parent_articles=len(parents)
+        )
+    
+    def _load_indexes(self):
+        """保存済みのファイルから (BM25インデックス, 親条文ストア, 引用インデックス) を作り直す"""
+        lexical = LexicalIndex(str(self.lexical_index.path)) if self.lexical_index is not None else None
+        parents = ParentStore(str(self.parent_store.path))
+        citations = None
+        if self.citation_index is not None and lexical is not None:
+            citations = CitationIndex(article_documents(lexical, parents))
+        return lexical, parents, citations
     
     async def search_documents(
-        self, 
-        query: str, 
-        n_results: int = 5
+        self,
+        query: str,
+        n_results: int = 5,
+        mode: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None,
+        expand_to_parent: Optional[bool] = None,
+        multi_query: Optional[bool] = None,
+        timings: Optional[Dict[str, float]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """クエリに基づいて関連文書を検索
+        
+        mode: "vector"（ベクター検索のみ） / "hybrid"（BM25とベクター検索をRRFで統合）。
+        未指定の場合は settings.search_mode
+        filters: law_id / law_title / law_type / update_date_from / update_date_to による絞り込み。
+        ベクターストア・BM25インデックスの検索時に適用する
+        namespaces: 検索するnamespace（未指定の場合は全namespaceを並行検索してマージ）
+        expand_to_parent: 項・号単位のチャンクを親条文の全文に置き換える（同じ条文のチャンクは1件にまとめ、
+        一致したチャンクの本文は matched_passage に残す）。未指定の場合は settings.chunk_expand_to_parent
+        multi_query: クエリの言い換え（settings.multi_query_strategy）も並行検索してRRFで統合する。
+        multi_query_timeout_ms 以内に終わらない場合は元のクエリの結果のみ返す。未指定の場合は settings.multi_query_enabled
+        timings: 指定した場合、段階ごとの処理時間（ms）を書き込む
+        （citation_lookup_ms / embedding_ms / vector_search_ms / lexical_search_ms / multi_query_ms）。
+        キャッシュから返した場合は search_cache_hit、実行中の同じ検索の結果を共有した場合は search_shared
+        query_embedding: 生成済みのクエリの埋め込み（一括検索用。指定した場合は埋め込みを生成しない）
+        """
+        if timings is None:
+            timings = {}
+        await self._refresh_indexes()
+        mode = (mode or settings.search_mode).lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        filters = normalize_filters(filters)
+        if namespaces is not None:
+            namespaces = sorted(set(namespaces))
+        if expand_to_parent is None:
+            expand_to_parent = settings.chunk_expand_to_parent
+        # チャンク化された条文がない場合は展開不要
+        expand_to_parent = expand_to_parent and len(self.parent_store) > 0
+        if multi_query is None:
+            multi_query = settings.multi_query_enabled
+        
+        # 結果のキャッシュ・実行中の検索の共有に使うキー
+        cache_key = make_result_cache_key(
+            query,
+            n_results,
+            namespace=",".join(namespaces) if namespaces is not None else "*",
+            filters=filters,
+            mode=mode,
+            expand_to_parent=expand_to_parent,
+            multi_query=multi_query
+        )
+        cache_generation = None
+        if self.result_cache:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                timings["search_cache_hit"] = 1.0
+                return cached
+            # 検索中にインデックスが更新された場合は古い結果を保存しない
+            cache_generation = self.result_cache.generation()
+        
+        def search():
+            return self._search(
+                cache_key, cache_generation, query, n_results, mode, filters, namespaces,
+                expand_to_parent, multi_query, timings, query_embedding
+            )
+        
+        if not self.single_flight:
+            return await search()
+        if self.single_flight.in_flight(cache_key):
+            timings["search_shared"] = 1.0
+        return await self.single_flight.do(cache_key, search)
+    
+    async def _search(
+        self,
+        cache_key: str,
+        cache_generation: Optional[int],
+        query: str,
+        n_results: int,
+        mode: str,
+        filters: Optional[Dict[str, Any]],
+        namespaces: Optional[List[str]],
+        expand_to_parent: bool,
+        multi_query: bool,
+        timings: Dict[str, float],
+        query_embedding: Optional[List[float]]
+    ) -> List[Dict[str, Any]]:
+        """検索を実行して結果をキャッシュに保存"""
+        n_fetch = n_results * _EXPAND_OVERFETCH_FACTOR if expand_to_parent else n_results
+        
+        # 条文が明示的に引用されている場合は辞書引きで解決
+        cited_results, citation_only = [], False
+        if self.citation_index:
+            start_time = time.time()
+            cited_results, citation_only = self.citation_index.lookup(query, filters)
+            timings["citation_lookup_ms"] = (time.time() - start_time) * 1000
+            cited_results = self._in_namespaces(cited_results, namespaces)
+            citation_only = citation_only and bool(cited_results)
+        
+        if citation_only:
+            # 引用のみのクエリは埋め込み・ベクター検索を省略
+            self.citation_index.record_skip()
+            formatted_results = cited_results[:n_fetch]
+        else:
+            if multi_query:
+                formatted_results = await self._multi_query_search(
+                    query, n_fetch, mode, filters, namespaces, timings, query_embedding
+                )
+            else:
+                formatted_results = await self._single_query_search(
+                    query, n_fetch, mode, filters, namespaces, timings, query_embedding
+                )
+            if cited_results:
+                formatted_results = self._merge_cited(cited_results, formatted_results, n_fetch)
+        
+        if expand_to_parent:
+            formatted_results = self._expand_to_parents(formatted_results)[:n_results]
+        
+        if self.result_cache:
+            self.result_cache.set(cache_key, formatted_results, cache_generation)
+        
+        return formatted_results
+    
+    async def search_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """複数クエリをまとめて検索
+        
+        requests は search_documents のキーワード引数（query / n_results / mode / filters / namespaces 等）。
+        全クエリの埋め込みを1回のバッチ呼び出しで生成し、各検索は search_batch_concurrency 件ずつ並行実行する。
+        結果は入力順に {"results": [...]} または {"error": "..."} を返す（失敗したクエリは他のクエリに影響しない）
+        """
+        embeddings = await self._batch_embeddings([request.get("query", "") for request in requests])
+        semaphore = asyncio.Semaphore(settings.search_batch_concurrency)
+        
+        async def run(request: Dict[str, Any], embedding: Optional[List[float]]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return {"results": await self.search_documents(**request, query_embedding=embedding)}
+                except Exception as e:
+                    return {"error": str(e)}
+        
+        return await asyncio.gather(*[
+            run(request, embedding) for request, embedding in zip(requests, embeddings)
+        ])
+    
+    async def _batch_embeddings(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """重複を除いたクエリの埋め込みをまとめて生成（失敗した場合は各検索で個別に生成するためNone）
+        
+        埋め込みAPIが過負荷で遮断された場合は、個別に問い合わせると負荷を増やすだけなので UpstreamOverloaded を送出する
+        """
+        unique_queries = [query for query in dict.fromkeys(queries) if query.strip()]
+        vectors: List[List[float]] = []
+        try:
+            for start in range(0, len(unique_queries), _EMBEDDING_BATCH_LIMIT):
+                vectors += await self.embeddings_service.get_embeddings(
+                    unique_queries[start:start + _EMBEDDING_BATCH_LIMIT], use_cache=True
+                )
+        except UpstreamOverloaded:
+            raise
+        except Exception as e:
+            railway_logger.log_error(
+                error_type="batch_embedding_failed",
+                error_message=str(e),
+                error_details={"queries": len(unique_queries)}
+            )
+            return [None] * len(queries)
+        by_query = dict(zip(unique_queries, vectors))
+        return [by_query.get(query) for query in queries]
+    
+    def _use_hybrid(self, mode: str) -> bool:
+        return mode == "hybrid" and bool(self.lexical_index) and self.lexical_index.document_count > 0
+    
+    async def _single_query_search(
+        self,
+        query: str,
+        n_results: int,
+        mode: str,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None,
+        timings: Optional[Dict[str, float]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        if self._use_hybrid(mode):
+            return await self._hybrid_search(query, n_results, filters, namespaces, timings, query_embedding)
+        return await self._vector_search(query, n_results, filters, namespaces, timings, query_embedding)
+    
+    async def _multi_query_search(
+        self,
+        query: str,
+        n_results: int,
+        mode: str,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None,
+        timings: Optional[Dict[str, float]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """元のクエリと言い換えクエリの検索を並行実行し、RRFで統合
+        
+        言い換えの生成・検索が multi_query_timeout_ms 以内に終わらない場合（または失敗した場合）は
+        元のクエリの結果のみ返す
+        """
+        if timings is None:
+            timings = {}
+        start_time = time.time()
+        variant_task = asyncio.create_task(
+            self._variant_rankings(query, n_results, mode, filters, namespaces)
+        )
+        try:
+            primary_results = await self._single_query_search(
+                query, n_results, mode, filters, namespaces, timings, query_embedding
+            )
+        except Exception:
+            variant_task.cancel()
+            raise
+        
+        remaining = settings.multi_query_timeout_ms / 1000 - (time.time() - start_time)
+        try:
+            variant_rankings = await asyncio.wait_for(variant_task, timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            self.query_expander.record_timeout()
+            timings["multi_query_timeout"] = 1.0
+            return primary_results
+        except Exception as e:
+            self.query_expander.record_error()
+            railway_logger.log_error(
+                error_type="multi_query_failed",
+                error_message=str(e),
+                error_details={"query_length": len(query)}
+            )
+            return primary_results
+        finally:
+            timings["multi_query_ms"] = (time.time() - start_time) * 1000
+        
+        timings["query_variants"] = float(len(variant_rankings))
+        if not variant_rankings:
+            return primary_results
+        return self._fuse_rankings([primary_results] + variant_rankings, n_results)
+    
+    async def _variant_rankings(
+        self,
+        query: str,
+        n_results: int,
+        mode: str,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """言い換えクエリをまとめて埋め込み（1回のAPI呼び出し）、各クエリの検索を並行実行"""
+        variants = await self.query_expander.variants(query)
+        if not variants:
+            return []
+        embeddings = await self.embeddings_service.get_embeddings(variants, use_cache=True)
+        
+        searches = [
+            self.vector_store.async_search_namespaces(
+                query_embedding=embedding,
+                n_results=n_results,
+                filters=filters,
+                namespaces=namespaces
+            )
+            for embedding in embeddings
+        ]
+        if self._use_hybrid(mode):
+            loop = asyncio.get_running_loop()
+            searches += [
+                loop.run_in_executor(None, self.lexical_index.search, variant, n_results, filters)
+                for variant in variants
+            ]
+        results = await asyncio.gather(*searches)
+        
+        rankings = [self._format_results(raw_results) for raw_results in results[:len(variants)]]
+        rankings += [
+            [self._format_lexical_result(result) for result in self._in_namespaces(lexical_results, namespaces)]
+            for lexical_results in results[len(variants):]
+        ]
+        return rankings
+    
+    def _fuse_rankings(
+        self,
+        rankings: List[List[Dict[str, Any]]],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """複数クエリの検索結果をRRFで統合（同じ文書は類似度の最も高い結果を残す）"""
+        fused = reciprocal_rank_fusion(
+            [[result["id"] for result in ranking if result.get("id")] for ranking in rankings],
+            k=settings.hybrid_rrf_k
+        )
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for ranking in rankings:
+            for result in ranking:
+                doc_id = result.get("id")
+                if not doc_id:
+                    continue
+                if doc_id not in by_id or result["similarity_score"] > by_id[doc_id]["similarity_score"]:
+                    by_id[doc_id] = result
+        
+        ranked_ids = sorted(fused, key=fused.get, reverse=True)[:n_results]
+        return [{**by_id[doc_id], "fusion_score": fused[doc_id]} for doc_id in ranked_ids]
+    
+    async def _vector_search(
+        self,
+        query: str,
+        n_results: int,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None,
+        timings: Optional[Dict[str, float]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
-        """クエリに基づいて関連文書を検索"""
+        """ベクター検索を実行し、整形済みの結果を返す"""
+        if timings is None:
+            timings = {}
         
-        # クエリの埋め込みを生成
-        query_embedding = await self.embeddings_service.get_embedding(query)
+        # クエリの埋め込みを生成（生成済みの場合は省略）
+        if query_embedding is None:
+            start_time = time.time()
+            query_embedding = await self.embeddings_service.get_embedding(query)
+            timings["embedding_ms"] = (time.time() - start_time) * 1000
         
-        # ベクター検索を実行
-        raw_results = self.vector_store.search(
+        # ベクター検索を実行（複数namespaceは並行検索してマージ）
+        start_time = time.time()
+        raw_results = await self.vector_store.async_search_namespaces(
             query_embedding=query_embedding,
-            n_results=n_results
+            n_results=n_results,
+            filters=filters,
+            namespaces=namespaces
         )
+        timings["vector_search_ms"] = (time.time() - start_time) * 1000
         
-        # 結果を整形
+        return self._format_results(raw_results)
+    
+    def _format_results(self, raw_results: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """ベクターストアの結果を整形"""
         formatted_results = []
         
         if raw_results["documents"] and len(raw_results["documents"]) > 0:
             documents = raw_results["documents"][0]
             metadatas = raw_results["metadatas"][0] if raw_results["metadatas"] else []
             distances = raw_results["distances"][0] if raw_results["distances"] else []
+            ids = raw_results["ids"][0] if raw_results.get("ids") else []
             
             for i, doc in enumerate(documents):
                 result = {
+                    "id": ids[i] if i < len(ids) else None,
                     "document": doc,
                     "similarity_score": 1 - distances[i] if i < len(distances) else 0,  # コサイン距離を類似度に変換
                     "metadata": metadatas[i] if i < len(metadatas) else {}
@@ -41,7 +446,122 @@ class SearchService:
                 formatted_results.append(result)
         
         return formatted_results
+    
+    def _format_lexical_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """BM25インデックスの結果を整形"""
+        return {
+            "id": result["id"],
+            "document": result["document"],
+            "similarity_score": 0.0,  # ベクター検索で見つからなかった文書
+            "metadata": result["metadata"],
+            "bm25_score": result["bm25_score"]
+        }
+    
+    def _in_namespaces(
+        self,
+        results: List[Dict[str, Any]],
+        namespaces: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        """ベクターストア以外（BM25・条文引用）の結果を指定namespaceの文書に絞る"""
+        field = settings.vector_store_namespace_field
+        if namespaces is None or not field:
+            return results
+        return [
+            result for result in results
+            if str(result["metadata"].get(field) or "") in namespaces
+        ]
+    
+    def _expand_to_parents(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """チャンクを親条文の全文に置き換え、同じ条文の結果は最上位の1件にまとめる"""
+        expanded = []
+        seen = set()
+        for result in results:
+            parent_id = result["metadata"].get("ParentID")
+            parent = self.parent_store.get(parent_id) if parent_id else None
+            if parent is None:
+                if result.get("id") not in seen:
+                    seen.add(result.get("id"))
+                    expanded.append(result)
+                continue
+            if parent_id in seen:
+                continue
+            seen.add(parent_id)
+            document, metadata = parent
+            expanded.append({
+                **result,
+                "id": parent_id,
+                "document": document,
+                "metadata": metadata,
+                "matched_passage": result["document"]
+            })
+        return expanded
+    
+    def _merge_cited(
+        self,
+        cited_results: List[Dict[str, Any]],
+        search_results: List[Dict[str, Any]],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """引用された条文を先頭に置き、残りを検索結果で埋める（重複は除く）"""
+        merged = list(cited_results[:n_results])
+        seen = {result["id"] for result in merged}
+        for result in search_results:
+            if len(merged) >= n_results:
+                break
+            if result.get("id") not in seen:
+                merged.append(result)
+                seen.add(result.get("id"))
+        return merged
+    
+    async def _hybrid_search(
+        self,
+        query: str,
+        n_results: int,
+        filters: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None,
+        timings: Optional[Dict[str, float]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """BM25とベクター検索（埋め込み生成を含む）を並行実行し、Reciprocal Rank Fusionで統合"""
+        if timings is None:
+            timings = {}
+        candidates = n_results * settings.hybrid_candidate_multiplier
+        loop = asyncio.get_running_loop()
+        
+        async def lexical_search() -> List[Dict[str, Any]]:
+            start_time = time.time()
+            results = await loop.run_in_executor(
+                None, self.lexical_index.search, query, candidates, filters
+            )
+            timings["lexical_search_ms"] = (time.time() - start_time) * 1000
+            return results
+        
+        vector_results, lexical_results = await asyncio.gather(
+            self._vector_search(query, candidates, filters, namespaces, timings, query_embedding),
+            lexical_search()
+        )
+        lexical_results = self._in_namespaces(lexical_results, namespaces)
+        
+        fused = reciprocal_rank_fusion(
+            [
+                [result["id"] for result in vector_results if result["id"]],
+                [result["id"] for result in lexical_results]
+            ],
+            k=settings.hybrid_rrf_k
+        )
+        
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for result in lexical_results:
+            by_id[result["id"]] = self._format_lexical_result(result)
+        for result in vector_results:
+            if not result["id"]:
+                continue
+            bm25_score = by_id.get(result["id"], {}).get("bm25_score", 0.0)
+            by_id[result["id"]] = {**result, "bm25_score": bm25_score}
+        
+        ranked_ids = sorted(fused, key=fused.get, reverse=True)[:n_results]
+        return [{**by_id[doc_id], "fusion_score": fused[doc_id]} for doc_id in ranked_ids]
 
 
 # シングルトンインスタンス
-search_service = SearchService()
\ No newline at end of file
+search_service = SearchService()
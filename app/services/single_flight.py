@@ -0,0 +1,138 @@
+"""
+同一リクエストの重複排除（single-flight）
+
+同じ質問が同時に複数届いた場合に、埋め込み・ベクター検索・回答生成を1回だけ実行し、
+実行中の結果を後から届いた呼び出し元にも返す（完了後の再利用はキャッシュの役割）
+- do: 結果を1つ返す処理（検索・回答生成）を共有する
+- stream: イベント列を返す処理（ストリーミング回答）を共有する。途中から参加した呼び出し元には
+  それまでのイベントを先頭から再送する
+- 最初の呼び出し元がキャンセル・切断されても、同じ処理を待つ他の呼び出し元には影響しない
+- 呼び出し元ごとの変更が他の呼び出し元に波及しないよう、結果・イベントはコピーして返す
+"""
+
+import asyncio
+import copy
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class _SharedStream:
+    """実行中のイベント列（参加者全員に同じイベントを配る）"""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Any):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+
+        # 発生状況
+        self.requests = 0
+        self.executions = 0
+        self.collapsed = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """key が同じ実行中の処理があれば、その結果を待って返す（なければ fn を実行）"""
+        self.requests += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.get_running_loop().create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.collapsed += 1
+        # 呼び出し元のキャンセルが共有の処理に波及しないようにする。
+        # 最初の呼び出し元も含め、他の呼び出し元がコピーする前に結果を変更しないようコピーを返す
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def in_flight(self, key: str) -> bool:
+        """key が同じ処理が実行中かどうか"""
+        return key in self._calls or key in self._streams
+
+    def _forget(self, key: str, task: asyncio.Task):
+        self._calls.pop(key, None)
+        # 呼び出し元が全員キャンセルされた場合も例外を回収しておく
+        if not task.cancelled():
+            task.exception()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """key が同じ実行中のイベント列があれば参加し、なければ factory のイベント列を開始する
+
+        全参加者が離脱した場合は、共有のイベント列の生成を中止する
+        """
+        self.requests += 1
+        shared = self._streams.get(key)
+        if shared is None:
+            self.executions += 1
+            shared = _SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.get_running_loop().create_task(self._produce(key, shared, factory))
+        else:
+            self.collapsed += 1
+
+        shared.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(shared.events):
+                    yield copy.deepcopy(shared.events[position])
+                    position += 1
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                await shared.wait()
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                # 中止するイベント列に、生成の終了前に届いた呼び出し元が参加しないよう先に外す
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+                shared.task.cancel()
+
+    async def _produce(self, key: str, shared: _SharedStream, factory: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for event in factory():
+                shared.publish(event)
+            shared.finish()
+        except asyncio.CancelledError:
+            shared.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            shared.finish(e)
+        finally:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._calls) + len(self._streams),
+            "collapse_ratio": self.collapsed / self.requests if self.requests else 0.0
+        }
@@ -1,14 +1,20 @@
-from pinecone import Pinecone
 from typing import List, Dict, Any, Optional
 import json
 import time
 from datetime import datetime
 from config import settings
 from app.utils.railway_logger import railway_logger
+from app.utils.dates import parse_date
+from .base_vector_store import BaseVectorStore
+from .metadata_filter import PINECONE_DATE_FIELD, to_pinecone_filter
 
 
-class VectorStore:
+class PineconeVectorStore(BaseVectorStore):
+    upstream_name = "pinecone"
+    
     def __init__(self):
+        from pinecone import Pinecone
+        
         # Pineconeクライアントを初期化
         if not settings.pinecone_api_key:
             raise ValueError("PINECONE_API_KEY is required")
@@ -23,21 +29,32 @@ class VectorStore:
             self.index = self.pc.Index(self.index_name)
         except Exception as e:
             raise Exception(f"Failed to connect to Pinecone index '{self.index_name}': {str(e)}")
+        
+        # namespace一覧のキャッシュ（describe_index_stats の呼び出しを抑える）
+        self._namespaces: Optional[List[str]] = None
+        self._namespaces_fetched_at = 0.0
+        
+        super().__init__()
     
     def add_documents(
         self, 
         documents: List[str], 
         metadatas: List[Dict[str, Any]], 
         ids: List[str],
-        embeddings: List[List[float]]
+        embeddings: List[List[float]],
+        namespace: str = ""
     ):
         """文書をベクターストアに追加"""
         try:
             # Pinecone upsert用のベクターデータを準備
             vectors = []
             for i, (doc_id, embedding, metadata) in enumerate(zip(ids, embeddings, metadatas)):
-                # メタデータに文書内容も追加
-                full_metadata = {**metadata, "document": documents[i]}
+                # メタデータに文書内容も追加（search は 'original_text' から本文を読む）
+                full_metadata = {**metadata, "original_text": documents[i]}
+                # 更新日の範囲フィルタ用に数値化した日付を持たせる（Pineconeの範囲指定は数値のみ）
+                update_date = parse_date(metadata.get("updateDate"))
+                if update_date is not None:
+                    full_metadata[PINECONE_DATE_FIELD] = update_date
                 vectors.append({
                     "id": doc_id,
                     "values": embedding,
@@ -45,15 +62,30 @@ class VectorStore:
                 })
             
             # Pineconeにupsert
-            self.index.upsert(vectors=vectors)
+            self.index.upsert(vectors=vectors, namespace=namespace)
+            if self._namespaces is not None and namespace not in self._namespaces:
+                self._namespaces = None
+            self._notify_updated()
             return True
         except Exception as e:
             raise Exception(f"Failed to add documents: {str(e)}")
     
+    def delete_documents(self, ids: List[str], namespace: str = ""):
+        """文書をベクターストアから削除"""
+        try:
+            if ids:
+                self.index.delete(ids=ids, namespace=namespace)
+                self._notify_updated()
+            return True
+        except Exception as e:
+            raise Exception(f"Failed to delete documents: {str(e)}")
+    
     def search(
         self, 
         query_embedding: List[float], 
-        n_results: int = 5
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
     ) -> Dict[str, Any]:
         """類似文書を検索"""
         try:
@@ -66,12 +98,17 @@ class VectorStore:
                 top_k=n_results
             )
             
-            # Pineconeで検索を実行
+            # Pineconeで検索を実行（フィルタはサーバー側で適用）
+            query_params = {}
+            pinecone_filter = to_pinecone_filter(filters)
+            if pinecone_filter:
+                query_params["filter"] = pinecone_filter
             pinecone_results = self.index.query(
                 vector=query_embedding,
                 top_k=n_results,
                 include_metadata=True,
-                namespace=""
+                namespace=namespace,
+                **query_params
             )
             
             # Pineconeレスポンスログ（Railway最適化）
@@ -95,21 +132,27 @@ class VectorStore:
             documents = []
             metadatas = []
             distances = []
+            ids = []
             
             for match in pinecone_results.matches:
                 # メタデータから文書内容を取得（'original_text'フィールドを使用）
                 if "original_text" in match.metadata:
                     documents.append(match.metadata["original_text"])
                     # Pineconeの元のメタデータをそのまま保持（original_textは除く）
-                    metadata = {k: v for k, v in match.metadata.items() if k != "original_text"}
+                    metadata = {
+                        k: v for k, v in match.metadata.items()
+                        if k not in ("original_text", PINECONE_DATE_FIELD)
+                    }
                     metadatas.append(metadata)
                     # Pineconeのスコアは類似度なので、距離に変換（1 - score）
                     distances.append(1 - match.score)
+                    ids.append(match.id)
             
             return {
                 "documents": [documents],
                 "metadatas": [metadatas], 
-                "distances": [distances]
+                "distances": [distances],
+                "ids": [ids]
             }
         except Exception as e:
             raise Exception(f"Failed to search documents: {str(e)}")
@@ -121,11 +164,40 @@ class VectorStore:
             return {
                 "index_name": self.index_name,
                 "document_count": stats.total_vector_count,
-                "dimension": stats.dimension
+                "dimension": stats.dimension,
+                "namespaces": {
+                    name: summary.vector_count for name, summary in (stats.namespaces or {}).items()
+                }
             }
         except Exception as e:
             raise Exception(f"Failed to get index info: {str(e)}")
+    
+    def list_namespaces(self) -> List[str]:
+        """文書が入っているnamespaceの一覧（一定時間キャッシュ）"""
+        if (
+            self._namespaces is not None
+            and time.time() - self._namespaces_fetched_at < settings.vector_store_namespace_cache_seconds
+        ):
+            return self._namespaces
+        try:
+            stats = self.index.describe_index_stats()
+            self._namespaces = sorted((stats.namespaces or {}).keys()) or [""]
+            self._namespaces_fetched_at = time.time()
+            return self._namespaces
+        except Exception as e:
+            raise Exception(f"Failed to list namespaces: {str(e)}")
+
+
+def create_vector_store() -> BaseVectorStore:
+    """設定に応じたベクターストアを作成"""
+    backend = settings.vector_store_backend.lower()
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    if backend == "local":
+        from .local_vector_store import LocalVectorStore
+        return LocalVectorStore(settings.local_vector_store_path)
+    raise ValueError(f"Unknown vector store backend: {settings.vector_store_backend}")
 
 
 # シングルトンインスタンス
-vector_store = VectorStore()
\ No newline at end of file
+vector_store = create_vector_store()
\ No newline at end of file
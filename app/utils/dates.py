@@ -0,0 +1,20 @@
+"""
+日付のユーティリティ（メタデータ・検索フィルタの更新日の解析）
+"""
+
+import re
+from typing import Any, Optional
+
+
+_DATE_PATTERN = re.compile(r"^\s*(\d{4})\D?(\d{1,2})\D?(\d{1,2})")
+
+
+def parse_date(value: Any) -> Optional[int]:
+    """日付（"2023-04-01" / "2023/04/01" / "20230401" / ISO形式）を YYYYMMDD の整数に変換"""
+    if value is None or value == "":
+        return None
+    match = _DATE_PATTERN.match(str(value))
+    if not match:
+        return None
+    year, month, day = (int(group) for group in match.groups())
+    return year * 10000 + month * 100 + day
@@ -0,0 +1,129 @@
+"""
+法令テキストのユーティリティ（漢数字・条番号の解析）
+"""
+
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+
+_KANJI_DIGITS = {
+    "〇": 0, "零": 0, "一": 1, "二": 2, "三": 3, "四": 4,
+    "五": 5, "六": 6, "七": 7, "八": 8, "九": 9
+}
+_KANJI_UNITS = {"十": 10, "百": 100, "千": 1000}
+_KANJI_LARGE_UNITS = {"万": 10000}
+
+_ARTICLE_PATTERN = re.compile(r"第?\s*([0-9〇零一二三四五六七八九十百千万]+)\s*条")
+
+
+def kanji_to_int(text: str) -> Optional[int]:
+    """漢数字（または算用数字）を整数に変換（変換できない場合はNone）"""
+    text = unicodedata.normalize("NFKC", text).strip()
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+    
+    total = 0
+    section = 0
+    digit = None
+    for ch in text:
+        if ch in _KANJI_DIGITS:
+            # 「二〇二五」のような位取り表記にも対応
+            digit = _KANJI_DIGITS[ch] if digit is None else digit * 10 + _KANJI_DIGITS[ch]
+        elif ch in _KANJI_UNITS:
+            section += (digit if digit is not None else 1) * _KANJI_UNITS[ch]
+            digit = None
+        elif ch in _KANJI_LARGE_UNITS:
+            section += digit or 0
+            total += (section or 1) * _KANJI_LARGE_UNITS[ch]
+            section = 0
+            digit = None
+        elif ch.isdigit():
+            digit = int(ch) if digit is None else digit * 10 + int(ch)
+        else:
+            return None
+    return total + section + (digit or 0)
+
+
+def parse_article_number(text: str) -> int:
+    """「第九十条」「第90条」などから条番号を取得（見つからない場合は0）"""
+    if not text:
+        return 0
+    match = _ARTICLE_PATTERN.search(unicodedata.normalize("NFKC", text))
+    if not match:
+        return 0
+    return kanji_to_int(match.group(1)) or 0
+
+
+_NUMERAL_CLASS = r"[0-9〇零一二三四五六七八九十百千万]+"
+CITATION_PATTERN = re.compile(
+    rf"第\s*({_NUMERAL_CLASS})\s*条(?:\s*の\s*({_NUMERAL_CLASS}))?"
+)
+
+
+def make_article_key(article_num: int, branch: Optional[int] = None) -> str:
+    """条番号（枝番号を含む）を索引用のキーに変換（例: 90 → "90"、第九十条の二 → "90_2"）"""
+    return f"{article_num}_{branch}" if branch else str(article_num)
+
+
+def parse_article_key(article_title: str) -> Optional[str]:
+    """条見出し（「第九十条の二」など）から索引用のキーを取得"""
+    match = CITATION_PATTERN.search(unicodedata.normalize("NFKC", article_title or ""))
+    if not match:
+        return None
+    article_num = kanji_to_int(match.group(1))
+    if not article_num:
+        return None
+    branch = kanji_to_int(match.group(2)) if match.group(2) else None
+    return make_article_key(article_num, branch)
+
+
+
+# 項番号（2項以降、行頭の「２　」）と号番号（行頭の「一　」）
+_PARAGRAPH_START = re.compile(r"^([0-9０-９]+)[ 　]+")
+_ITEM_START = re.compile(r"^([〇一二三四五六七八九十]+)[ 　]+")
+# 改行なしで連結された本文の項の区切り（「…。２　…」）
+_INLINE_PARAGRAPH = re.compile(r"(?<=。)[ 　]*(?=[２-９][０-９]*　)")
+
+
+def split_article(text: str) -> List[Dict[str, Any]]:
+    """条文を項・号の構造に分割
+
+    [{"paragraph": 項番号, "lead": 柱書（号より前の本文）, "items": [(号番号, 号の本文), ...]}, ...] を返す。
+    号の本文は号番号（「一　」）を含む。
+    項番号・号番号は連番の場合のみ区切りとみなす（本文中の数字を誤って区切らないため）
+    """
+    lines = _INLINE_PARAGRAPH.sub("\n", text or "").splitlines()
+    paragraphs: List[Dict[str, Any]] = [{"paragraph": 1, "lead": [], "items": []}]
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        current = paragraphs[-1]
+        match = _PARAGRAPH_START.match(line)
+        if match and kanji_to_int(match.group(1)) == current["paragraph"] + 1 and (
+            current["lead"] or current["items"]
+        ):
+            paragraphs.append({"paragraph": current["paragraph"] + 1, "lead": [line[match.end():]], "items": []})
+            continue
+        match = _ITEM_START.match(line)
+        if match and kanji_to_int(match.group(1)) == len(current["items"]) + 1:
+            current["items"].append([len(current["items"]) + 1, [line]])
+            continue
+        if current["items"]:
+            # 号に続く行（イ・ロ・ハ等の細分を含む）は直前の号に含める
+            current["items"][-1][1].append(line)
+        else:
+            current["lead"].append(line)
+
+    return [
+        {
+            "paragraph": p["paragraph"],
+            "lead": "\n".join(p["lead"]),
+            "items": [(num, "\n".join(item_lines)) for num, item_lines in p["items"]]
+        }
+        for p in paragraphs
+        if p["lead"] or p["items"]
+    ]
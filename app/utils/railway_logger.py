@@ -204,9 +204,10 @@ class RailwayLogger:
         user_query: str,
         context_docs_count: Optional[int] = None,
         total_time_ms: Optional[float] = None,
-        request_id: Optional[str] = None
+        request_id: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None
     ):
-        """RAGパイプライン処理ログ"""
+        """RAGパイプライン処理ログ（timingsは段階ごとの処理時間ms）"""
         metadata = {
             "stage": stage,
             "user_query_length": len(user_query),
@@ -220,6 +221,9 @@ class RailwayLogger:
         if total_time_ms is not None:
             metadata["total_time_ms"] = total_time_ms
         
+        if timings:
+            metadata["timings"] = timings
+        
         self._log_structured(
             LogLevel.INFO,
             LogCategory.RAG,
@@ -0,0 +1,46 @@
+"""
+トークン数の見積もり
+
+tiktoken がインストールされていれば正確に数え、なければ文字種ごとの
+近似値（日本語は1文字≒1トークン、ASCIIは4文字≒1トークン）を使う
+"""
+
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # 任意依存
+    tiktoken = None
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(encoding_name: str):
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """テキストのトークン数を数える（tiktokenがない場合は近似値）"""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_get_encoding(encoding_name).encode(text))
+    
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = "cl100k_base") -> str:
+    """テキストを指定トークン数以内に切り詰める"""
+    if count_tokens(text, encoding_name) <= max_tokens:
+        return text
+    if tiktoken is not None:
+        encoding = _get_encoding(encoding_name)
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    
+    # 近似の場合は1文字ずつ見積もって切り詰める
+    tokens = 0.0
+    for i, ch in enumerate(text):
+        tokens += 0.25 if ord(ch) < 128 else 1.0
+        if tokens > max_tokens:
+            return text[:i]
+    return text
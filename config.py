@@ -13,15 +13,140 @@ class Settings(BaseSettings):
     
     # OpenAI Configuration
     openai_api_key: Optional[str] = None
+    openai_base_url: Optional[str] = None  # ローカルのスタブ埋め込みサーバー等を指す場合に設定
+    embedding_model: str = "text-embedding-3-large"
+    embedding_max_concurrency: int = 8  # 同時実行数の上限（適応的な制限の最大値）
+    embedding_timeout: float = 30.0
+    embedding_batching_enabled: bool = True  # 同時に届いた単一テキストの要求をまとめて問い合わせる
+    embedding_batch_window_ms: float = 5.0  # 要求を集める時間窓
+    embedding_batch_max_size: int = 64  # この件数に達したら時間窓を待たずに送信
+    
+    # Embedding Cache Configuration
+    embedding_cache_backend: str = "memory"  # "memory" | "sqlite" | "none"
+    embedding_cache_path: str = "./data/cache/embeddings.sqlite3"
+    embedding_cache_max_entries: int = 10000
+    embedding_cache_ttl_seconds: float = 7 * 24 * 3600
     
     # OpenRouter Configuration (for ChatGPT-5)
     openrouter_api_key: Optional[str] = None
     openrouter_base_url: str = "https://openrouter.ai/api/v1"
     openrouter_model: str = "openai/gpt-5"
+    openrouter_timeout: float = 30.0
+    openrouter_http2: bool = False  # 有効にする場合は httpx[http2] が必要
+    openrouter_max_connections: int = 100
+    openrouter_max_keepalive_connections: int = 20
+    openrouter_keepalive_expiry: float = 30.0
+    openrouter_max_concurrency: int = 32  # 同時実行数の上限（適応的な制限の最大値。ストリーミングは生成完了まで枠を使う）
+    
+    # Vector Store Configuration
+    vector_store_backend: str = "pinecone"  # "pinecone" | "local"
+    local_vector_store_path: str = "./data/local_index"
+    local_ivf_threshold: int = 50000  # これ以上の件数でIVFインデックスを使用
+    local_ivf_nlist: int = 256
+    local_ivf_nprobe: int = 16
+    local_scan_dtype: str = "float32"  # "float32" | "float16" | "int8"（int8推奨。float16はメモリ削減のみで走査はfloat32より遅い）
+    local_scan_dimensions: int = 0  # 一次走査で使う先頭次元数（0 = 切り詰めない、例: 256 / 1024）
+    local_rescore_factor: int = 10  # 一次走査で残す候補数（n_results の倍数）
     
     # Pinecone Configuration
     pinecone_api_key: Optional[str] = None
     pinecone_index_name: str = "legal-documents"
+    vector_store_max_workers: int = 8  # Pinecone同期呼び出し用スレッドプールのサイズ
+    vector_store_max_concurrency: int = 8  # 同時実行数の上限（適応的な制限の最大値）
+    vector_store_namespace_field: str = ""  # 投入先namespaceを決めるメタデータ項目（例: LawType、空 = デフォルトnamespace）
+    vector_store_namespace_cache_seconds: float = 60.0  # Pineconeのnamespace一覧のキャッシュ期間
+    
+    # Lexical / Hybrid Search Configuration
+    lexical_index_enabled: bool = True
+    lexical_index_path: str = "./data/lexical_index"
+    search_mode: str = "vector"  # "vector" | "hybrid"（BM25とベクター検索をRRFで統合）
+    hybrid_rrf_k: int = 60
+    hybrid_candidate_multiplier: int = 3  # 各検索で取得する候補数（n_results の倍数）
+    
+    # Prompt Context Packing Configuration
+    context_packing_enabled: bool = True
+    prompt_token_budget: int = 6000  # システムプロンプト・関連条文・会話履歴の合計トークン数の上限
+    history_token_budget: int = 2000  # 最新のユーザーメッセージより前の会話履歴に使う上限
+    history_summary_tokens: int = 300  # 予算外の古い会話の要約に使う上限
+    context_max_doc_tokens: int = 1500  # 1条文あたりの上限
+    context_min_doc_tokens: int = 64  # 切り詰め後にこれ未満となる条文は含めない
+    
+    # Multi-Query / HyDE Retrieval Configuration
+    multi_query_enabled: bool = False
+    multi_query_strategy: str = "rules"  # "rules" | "hyde" | "rules+hyde"
+    multi_query_max_variants: int = 3  # 元のクエリ以外に検索するクエリ数
+    multi_query_timeout_ms: float = 1500  # 言い換えの検索がこれ以内に終わらない場合は元のクエリの結果のみ返す
+    multi_query_hyde_model: str = ""  # 空の場合は openrouter_model
+    multi_query_hyde_max_tokens: int = 200
+    
+    # Rerank Configuration
+    rerank_enabled: bool = False
+    rerank_scorer: str = "lexical"  # "lexical" | "onnx" | "passthrough"
+    rerank_overfetch_factor: int = 4  # 再ランキング前に取得する候補数（max_context_docs の倍数）
+    rerank_batch_size: int = 16
+    rerank_max_workers: int = 2
+    rerank_similarity_weight: float = 0.5  # lexical: 検索時の類似度の重み
+    rerank_onnx_model_path: Optional[str] = None
+    rerank_onnx_tokenizer_path: Optional[str] = None  # tokenizer.json
+    rerank_max_length: int = 512
+    
+    # Statute Chunking Configuration
+    chunking_enabled: bool = False  # 長い条文を項・号単位に分割して投入（変更後は再投入が必要）
+    chunk_min_article_tokens: int = 400  # これ以上のトークン数の条文を分割
+    chunk_max_tokens: int = 300  # これを超える項は号ごとに分割
+    parent_store_path: str = "./data/parent_articles"  # 分割した条文の全文
+    chunk_expand_to_parent: bool = False  # 検索結果のチャンクを親条文の全文に置き換える（デフォルト）
+    
+    # Citation Fast Path Configuration
+    citation_fast_path_enabled: bool = True
+    citation_skip_max_residual_chars: int = 12  # 引用以外の文字数がこれ以下ならベクター検索を省略
+    
+    # Batch Search Configuration
+    search_batch_max_queries: int = 500  # /search/batch の1リクエストあたりのクエリ数の上限
+    search_batch_concurrency: int = 16  # 並行して実行する検索数
+    
+    # Offline Chat Job Configuration
+    chat_jobs_path: str = "./data/jobs/chat_jobs.sqlite3"
+    chat_job_max_items: int = 10000  # 1ジョブあたりの会話数の上限
+    chat_job_concurrency: int = 4  # ジョブ内で並行して処理する会話数
+    chat_job_rate_per_second: float = 2.0  # 会話の処理開始の上限（0 = 制限なし）
+    chat_job_max_upstream_concurrency: int = 8  # ジョブが同時に使うOpenRouterの枠の上限（openrouter_max_concurrency 未満に制限し、過負荷時はさらに下げる）
+    chat_job_max_retries: int = 2  # 会話ごとの再試行回数
+    chat_jobs_resume_on_startup: bool = True  # 起動時に未完了のジョブを続きから再開する
+    
+    # Upstream Concurrency Limiting Configuration（OpenRouter / OpenAI / ベクターストアごと）
+    adaptive_concurrency_enabled: bool = True  # 過負荷（429・503・タイムアウト）に応じて同時実行数の上限を増減する
+    upstream_min_concurrency: int = 1
+    upstream_backoff_ratio: float = 0.7  # 過負荷時に上限に掛ける係数
+    upstream_queue_max_size: int = 64  # 空きを待つ呼び出しの上限（超えた場合は即座に503）
+    upstream_queue_max_wait_ms: float = 5000  # 空きを待つ時間の上限（超えた場合は503）
+    
+    # Request Deduplication Configuration（同じ検索・会話が同時に届いた場合に1回だけ実行して結果を共有）
+    single_flight_enabled: bool = True
+    
+    # Search Result Cache Configuration
+    search_cache_enabled: bool = True
+    search_cache_max_entries: int = 2000
+    search_cache_max_bytes: int = 64 * 1024 * 1024
+    search_cache_ttl_seconds: float = 3600
+    # 文書の追加・削除のたびに更新するリビジョンファイル（投入スクリプト等の別プロセスの更新でもキャッシュを無効化）
+    index_revision_path: str = "./data/cache/index_revision"
+    
+    # Answer Cache Configuration
+    answer_cache_enabled: bool = True
+    answer_cache_max_entries: int = 1000
+    answer_cache_max_bytes: int = 32 * 1024 * 1024
+    answer_cache_ttl_seconds: float = 6 * 3600
+    
+    # Ingestion Configuration
+    ingest_concurrency: int = 4  # 並行して処理する埋め込みバッチ数
+    ingest_batch_max_items: int = 256  # OpenAIの上限は1リクエスト2048件
+    ingest_batch_max_tokens: int = 100000  # OpenAIの上限は1リクエスト30万トークン
+    ingest_max_input_tokens: int = 8000  # 1入力あたりの上限（8191トークン）
+    ingest_upsert_batch_size: int = 100
+    ingest_max_retries: int = 6
+    # BM25インデックス等を保存してからマニフェストに記録する間隔（保存のたびに全件を書き直すため間隔を空ける）
+    ingest_checkpoint_interval_seconds: float = 30.0
     
     # Project Settings
     project_name: str = "legal-xml-vectorization"
@@ -1,17 +1,84 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from config import settings
+from app.services.concurrency_limiter import UpstreamOverloaded
 
 print("🚀 Starting Legal AI RAG API...")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時に共有リソースを初期化し、終了時に解放する"""
+    try:
+        from app.services.chat import chat_service
+        await chat_service.startup()
+        print("✅ OpenRouter HTTP client pool started")
+    except Exception as e:
+        print(f"⚠️ Failed to start OpenRouter HTTP client: {e}")
+    
+    try:
+        from app.services.chat_jobs import chat_job_manager
+        await chat_job_manager.startup()
+        print("✅ Chat job worker started")
+    except Exception as e:
+        print(f"⚠️ Failed to start chat job worker: {e}")
+    
+    yield
+    
+    try:
+        from app.services.chat_jobs import chat_job_manager
+        await chat_job_manager.shutdown()
+    except Exception as e:
+        print(f"⚠️ Failed to stop chat job worker: {e}")
+    
+    try:
+        from app.services.chat import chat_service
+        await chat_service.shutdown()
+    except Exception as e:
+        print(f"⚠️ Failed to close OpenRouter HTTP client: {e}")
+    
+    try:
+        from app.services.embeddings import embeddings_service
+        await embeddings_service.close()
+    except Exception as e:
+        print(f"⚠️ Failed to close embeddings client: {e}")
+    
+    try:
+        from app.services.vector_store import vector_store
+        vector_store.close()
+    except Exception as e:
+        print(f"⚠️ Failed to close vector store: {e}")
+    
+    try:
+        from app.services.reranker import reranker
+        if reranker is not None:
+            reranker.close()
+    except Exception as e:
+        print(f"⚠️ Failed to close reranker: {e}")
+
+
 app = FastAPI(
     title="Legal AI RAG API",
     description="API for Legal AI RAG System",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 print("✅ FastAPI app created successfully")
 
+
+@app.exception_handler(UpstreamOverloaded)
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloaded):
+    """上流APIの待ち行列が溢れた場合は待たずに503を返す"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "upstream": exc.upstream},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # 環境変数からCORS設定を取得
 allowed_origins = settings.get_allowed_origins()
 print(f"✅ CORS allowed origins: {allowed_origins}")
@@ -35,8 +102,9 @@ except Exception as e:
     print(f"⚠️ Failed to load debug router: {e}")
 
 try:
-    from app.routers import search, chat
+    from app.routers import search, chat, jobs
     app.include_router(search.router, prefix="/api/v1")
+    app.include_router(jobs.router, prefix="/api/v1")
     app.include_router(chat.router, prefix="/api/v1")
     print("✅ Main routers loaded successfully")
 except Exception as e:
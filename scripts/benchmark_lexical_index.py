@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+BM25インデックスのレイテンシ計測
+
+サンプル条文を組み合わせた合成コーパスで、インデックス構築時間と
+1クエリあたりのBM25検索・RRF統合にかかる時間を計測する
+
+使用方法:
+    python scripts/benchmark_lexical_index.py [--docs 100000] [--queries 500]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# モジュール読み込み時に作られるシングルトンが既存のインデックスを読まないようにする
+os.environ["LEXICAL_INDEX_ENABLED"] = "false"
+
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+
+LAW_TITLES = ["民法", "商法", "会社法", "刑法", "労働基準法", "借地借家法", "消費者契約法", "行政手続法"]
+
+
+def make_corpus(n_docs: int, seed: int = 0):
+    """サンプル条文の文を組み合わせた合成条文を生成"""
+    rng = random.Random(seed)
+    with open("data/sample_legal_texts.json", "r", encoding="utf-8") as f:
+        samples = json.load(f)
+    sentences = [s for item in samples for s in item["content"].split("。") if s]
+
+    for i in range(n_docs):
+        law_title = rng.choice(LAW_TITLES)
+        article_num = rng.randint(1, 1000)
+        body = "。".join(rng.sample(sentences, k=min(3, len(sentences)))) + "。"
+        yield (
+            f"doc_{i}",
+            body,
+            {"LawTitle": law_title, "ArticleTitle": f"第{article_num}条", "ArticleNum": article_num}
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25インデックスのレイテンシ計測")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=15)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [
+        f"{rng.choice(LAW_TITLES)}第{rng.randint(1, 1000)}条",
+        "公序良俗に反する契約は無効ですか",
+        "債務不履行による損害賠償",
+        "不法行為の故意又は過失",
+        "契約の成立と申込み",
+    ]
+    queries = [rng.choice(queries) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LexicalIndex(tmp_dir)
+        ids, documents, metadatas = zip(*make_corpus(args.docs))
+
+        start = time.perf_counter()
+        index.upsert(list(ids), list(documents), list(metadatas))
+        index.build()
+        build_seconds = time.perf_counter() - start
+
+        search_ms = []
+        fusion_ms = []
+        for query in queries:
+            start = time.perf_counter()
+            results = index.search(query, args.top_k)
+            search_ms.append((time.perf_counter() - start) * 1000)
+
+            # ベクター検索の結果を模した順位リストとの統合コスト
+            vector_ranked = [f"doc_{rng.randrange(args.docs)}" for _ in range(args.top_k)]
+            start = time.perf_counter()
+            fused = reciprocal_rank_fusion([vector_ranked, [r["id"] for r in results]])
+            sorted(fused, key=fused.get, reverse=True)
+            fusion_ms.append((time.perf_counter() - start) * 1000)
+
+        stats = index.get_stats()
+
+    print(f"📊 docs={args.docs} queries={args.queries} top_k={args.top_k}")
+    print(f"build: {build_seconds:.2f}s, vocabulary={stats['vocabulary']}, "
+          f"postings={stats['postings']} ({stats['postings_bytes'] / 1024 / 1024:.1f} MiB)")
+    print(f"BM25 search: p50={np.percentile(search_ms, 50):.2f}ms p95={np.percentile(search_ms, 95):.2f}ms")
+    print(f"RRF fusion:  p50={np.percentile(fusion_ms, 50):.3f}ms p95={np.percentile(fusion_ms, 95):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+ローカルベクターストアの量子化ベンチマーク
+
+float32の全件検索を正解として、走査用行列の型（float16 / int8）と
+Matryoshka切り詰め次元ごとに recall@k と検索レイテンシを比較する
+
+使用方法:
+    python scripts/benchmark_local_index.py [--docs 20000] [--dimension 3072] [--queries 200]
+
+合成データは text-embedding-3 系の埋め込みと同様に、先頭次元ほど分散が大きく
+なるよう生成している（先頭次元への切り詰めが意味を持つようにするため）。
+実データで測る場合は --vectors に (N, dim) の .npy ファイルを指定する
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# モジュール読み込み時に作られるシングルトンがPineconeに接続しないようにする
+os.environ["VECTOR_STORE_BACKEND"] = "local"
+os.environ["LOCAL_VECTOR_STORE_PATH"] = tempfile.mkdtemp(prefix="bench_local_index_")
+
+from app.services.local_vector_store import LocalVectorStore
+
+
+CONFIGS = [
+    ("float32", 0),
+    ("float16", 0),
+    ("int8", 0),
+    ("float16", 1024),
+    ("int8", 1024),
+    ("int8", 256),
+]
+
+
+def make_corpus(n_docs: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """先頭次元ほど分散が大きい合成ベクトルを生成"""
+    rng = np.random.default_rng(seed)
+    decay = 1.0 / np.sqrt(1.0 + np.arange(dimension) / 64.0)
+    vectors = rng.normal(size=(n_docs, dimension)).astype(np.float32) * decay
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, n_queries: int, noise: float, seed: int = 1) -> np.ndarray:
+    """コーパス中のベクトルにノイズを加えてクエリを作成"""
+    rng = np.random.default_rng(seed)
+    base = corpus[rng.choice(len(corpus), size=n_queries, replace=False)]
+    queries = base + rng.normal(scale=noise, size=base.shape).astype(np.float32) * np.abs(base).mean()
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def build_store(path: str, corpus: np.ndarray, scan_dtype: str, scan_dimensions: int) -> LocalVectorStore:
+    store = LocalVectorStore(
+        path,
+        scan_dtype=scan_dtype,
+        scan_dimensions=scan_dimensions,
+        ivf_threshold=len(corpus) + 1  # 量子化の効果だけを測るためIVFは使わない
+    )
+    batch = 1000
+    for start in range(0, len(corpus), batch):
+        end = min(start + batch, len(corpus))
+        store.add_documents(
+            documents=[""] * (end - start),
+            metadatas=[{} for _ in range(end - start)],
+            ids=[str(i) for i in range(start, end)],
+            embeddings=corpus[start:end]
+        )
+    return store
+
+
+def scan_bytes_per_vector(scan_dtype: str, dimensions: int) -> int:
+    if scan_dtype == "float32":
+        return dimensions * 4
+    if scan_dtype == "float16":
+        return dimensions * 2
+    return dimensions + 4  # int8 + 行ごとのスケール
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカルベクターストアの量子化ベンチマーク")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=1.0)
+    parser.add_argument("--vectors", help="(N, dim) の埋め込みを保存した .npy ファイル")
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = np.load(args.vectors).astype(np.float32)
+        corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    else:
+        corpus = make_corpus(args.docs, args.dimension)
+    queries = make_queries(corpus, args.queries, args.noise)
+    dimension = corpus.shape[1]
+
+    # 正解: float32全件検索
+    exact_scores = queries @ corpus.T
+    truth = [set(np.argsort(-row)[:args.top_k].tolist()) for row in exact_scores]
+
+    print(f"📊 docs={len(corpus)} dim={dimension} queries={len(queries)} top_k={args.top_k}")
+    print(f"{'scan':<10}{'dims':>6}{'bytes/vec':>11}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    print("-" * 55)
+
+    for scan_dtype, scan_dimensions in CONFIGS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = build_store(tmp_dir, corpus, scan_dtype, scan_dimensions)
+            latencies = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = store.search(query.tolist(), n_results=args.top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(expected & {int(doc_id) for doc_id in result["ids"][0]})
+            store.close()
+
+        dims = scan_dimensions or dimension
+        print(
+            f"{scan_dtype:<10}{dims:>6}{scan_bytes_per_vector(scan_dtype, dims):>11}"
+            f"{hits / (len(queries) * args.top_k):>10.4f}"
+            f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+再ランキング段の効果測定
+
+同じクエリ集合に対して「検索のみ（上位k件）」と「k×N件を取得して再ランキング」を実行し、
+正解文書の recall@k / MRR と段階ごとのレイテンシ（p50 / p95）を比較する。
+検索は設定済みのバックエンド（.env の VECTOR_STORE_BACKEND 等）に対して行う
+
+評価データはJSONL（1行1件）:
+    {"query": "他人に損害を与えた場合の責任は？", "relevant_ids": ["civil_code_709"]}
+
+使用方法:
+    python scripts/evaluate_rerank.py [--eval data/rerank_eval.jsonl] [--k 3] [--scorer lexical]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.embeddings import embeddings_service
+from app.services.search import search_service
+from app.services.reranker import Reranker, create_scorer
+
+
+# data/sample_legal_texts.json 向けの評価クエリ
+SAMPLE_EVAL_SET = [
+    {"query": "社会の秩序に反する契約は有効ですか", "relevant_ids": ["civil_code_90"]},
+    {"query": "約束どおりに履行しなかった場合の損害賠償", "relevant_ids": ["civil_code_415"]},
+    {"query": "故意又は過失で他人の権利を侵害した", "relevant_ids": ["civil_code_709"]},
+    {"query": "契約はいつ成立するのか", "relevant_ids": ["contract_law_1"]},
+    {"query": "契約に違反したときの効果", "relevant_ids": ["contract_law_15"]},
+    {"query": "株主にはどのような権利があるか", "relevant_ids": ["company_law_105"]},
+    {"query": "労働者を解雇するときの予告期間", "relevant_ids": ["labor_law_20"]},
+    {"query": "国民は法の下に平等か", "relevant_ids": ["constitution_14"]},
+]
+
+
+def load_eval_set(path):
+    if not path:
+        return SAMPLE_EVAL_SET
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score_ranking(ids, relevant_ids, k):
+    """(recall@k, 逆順位) を返す"""
+    relevant = set(relevant_ids)
+    top = ids[:k]
+    recall = len(relevant & set(top)) / len(relevant) if relevant else 0.0
+    reciprocal_rank = next((1.0 / (rank + 1) for rank, doc_id in enumerate(top) if doc_id in relevant), 0.0)
+    return recall, reciprocal_rank
+
+
+def percentiles(values):
+    return f"p50={np.percentile(values, 50):.1f}ms p95={np.percentile(values, 95):.1f}ms"
+
+
+async def evaluate(args):
+    eval_set = load_eval_set(args.eval)
+    reranker = Reranker(create_scorer(args.scorer), overfetch_factor=args.overfetch)
+
+    # 埋め込み生成の時間が片方だけに乗らないよう、先にクエリの埋め込みをキャッシュしておく
+    for item in eval_set:
+        await embeddings_service.get_embedding(item["query"])
+
+    baseline = {"recall": [], "mrr": [], "search_ms": []}
+    reranked = {"recall": [], "mrr": [], "search_ms": [], "rerank_ms": []}
+
+    for item in eval_set:
+        # 結果キャッシュの影響を避けるため、件数の異なる検索をそれぞれ実行する
+        start = time.perf_counter()
+        results = await search_service.search_documents(item["query"], n_results=args.k)
+        baseline["search_ms"].append((time.perf_counter() - start) * 1000)
+        recall, rr = score_ranking([r["id"] for r in results], item["relevant_ids"], args.k)
+        baseline["recall"].append(recall)
+        baseline["mrr"].append(rr)
+
+        start = time.perf_counter()
+        candidates = await search_service.search_documents(
+            item["query"], n_results=reranker.candidate_count(args.k)
+        )
+        reranked["search_ms"].append((time.perf_counter() - start) * 1000)
+        results, rerank_ms = await reranker.rerank(item["query"], candidates, args.k)
+        reranked["rerank_ms"].append(rerank_ms)
+        recall, rr = score_ranking([r["id"] for r in results], item["relevant_ids"], args.k)
+        reranked["recall"].append(recall)
+        reranked["mrr"].append(rr)
+
+    reranker.close()
+
+    print(f"📊 queries={len(eval_set)} k={args.k} scorer={args.scorer} overfetch={args.overfetch}")
+    print(
+        f"search only:  recall@{args.k}={np.mean(baseline['recall']):.3f} "
+        f"MRR={np.mean(baseline['mrr']):.3f}  search {percentiles(baseline['search_ms'])}"
+    )
+    print(
+        f"with rerank:  recall@{args.k}={np.mean(reranked['recall']):.3f} "
+        f"MRR={np.mean(reranked['mrr']):.3f}  search {percentiles(reranked['search_ms'])}, "
+        f"rerank {percentiles(reranked['rerank_ms'])}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="再ランキング段の効果測定")
+    parser.add_argument("--eval", default=None, help="評価データ（JSONL）。省略時はサンプルデータ用のクエリ")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--scorer", default="lexical", help="lexical / onnx / passthrough")
+    parser.add_argument("--overfetch", type=int, default=4)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(evaluate(parse_args()))
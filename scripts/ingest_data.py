@@ -1,4 +1,4 @@
-import json
+import argparse
 import asyncio
 import sys
 import os
@@ -8,63 +8,69 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.embeddings import embeddings_service
 from app.services.vector_store import vector_store
+from app.services.ingestion import IngestionPipeline
+from app.services.lexical_index import lexical_index
+from app.services.chunking import parent_store
 
 
-async def ingest_legal_data():
-    """サンプル法律データをChromaDBに投入"""
+async def ingest_legal_data(args):
+    """法律データをベクターストアに投入（新規・変更分のみ。中断した場合は同じコマンドで再開）"""
     
-    print("Loading sample legal data...")
+    print(f"Loading legal data from {args.input}...")
     
-    # サンプルデータを読み込み
-    with open("data/sample_legal_texts.json", "r", encoding="utf-8") as f:
-        legal_data = json.load(f)
-    
-    print(f"Loaded {len(legal_data)} legal documents")
-    
-    # 文書テキストを作成（検索用）
-    documents = []
-    metadatas = []
-    ids = []
-    
-    for item in legal_data:
-        # 検索対象となるテキストを結合
-        full_text = f"{item['law_name']} {item['article']} {item['title']}: {item['content']}"
-        documents.append(full_text)
-        
-        # メタデータ
-        metadatas.append({
-            "law_name": item["law_name"],
-            "article": item["article"],
-            "title": item["title"],
-            "category": item["category"]
-        })
-        
-        ids.append(item["id"])
-    
-    print("Generating embeddings...")
-    
-    # 埋め込みを生成（バッチ処理）
-    embeddings = await embeddings_service.get_embeddings(documents)
-    
-    print(f"Generated {len(embeddings)} embeddings")
-    
-    print("Storing in ChromaDB...")
-    
-    # ChromaDBに保存
-    vector_store.add_documents(
-        documents=documents,
-        metadatas=metadatas,
-        ids=ids,
-        embeddings=embeddings
+    pipeline = IngestionPipeline(
+        embeddings_service=embeddings_service,
+        vector_store=vector_store,
+        manifest_path=None if args.no_manifest else args.manifest,
+        lexical_index=None if args.no_lexical else lexical_index,
+        concurrency=args.concurrency,
+        batch_max_items=args.batch_items,
+        batch_max_tokens=args.batch_tokens,
+        upsert_batch_size=args.upsert_batch_size,
+        namespace_field=args.namespace_field,
+        chunking=args.chunking,
+        parent_store=parent_store
     )
     
+    summary = await pipeline.run(args.input, prune=args.prune)
+    
     print("✅ Data ingestion completed!")
+    print(
+        f"Documents: {summary['documents']} embedded "
+        f"(new {summary['new']}, changed {summary['changed']}, unchanged {summary['skipped']}, "
+        f"deleted {summary['deleted']})"
+    )
+    print(f"Throughput: {summary['docs_per_second']} docs/s, {summary['tokens_per_second']} tokens/s")
+    print(f"Elapsed: {summary['elapsed_seconds']}s, retries: {summary['retries']}")
     
-    # コレクション情報を表示
+    # インデックス情報を表示
     info = vector_store.get_collection_info()
-    print(f"Collection: {info['collection_name']}")
+    print(f"Index: {info['index_name']}")
     print(f"Total documents: {info['document_count']}")
+    if info.get("namespaces"):
+        print(f"Namespaces: {info['namespaces']}")
+    if len(parent_store):
+        print(f"Chunked articles: {len(parent_store)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="法律データをベクターストアに投入")
+    parser.add_argument("--input", default="data/sample_legal_texts.json", help="JSON配列またはJSONLファイル")
+    parser.add_argument("--manifest", default=None, help="内容ハッシュのマニフェスト（デフォルト: <input>.manifest.jsonl）")
+    parser.add_argument("--no-manifest", action="store_true", help="マニフェストを使わず全件投入する")
+    parser.add_argument("--prune", action="store_true", help="入力に含まれなくなった文書を削除する（全件スナップショット用）")
+    parser.add_argument("--no-lexical", action="store_true", help="BM25インデックスを更新しない")
+    parser.add_argument("--concurrency", type=int, default=None, help="並行して処理する埋め込みバッチ数")
+    parser.add_argument("--batch-items", type=int, default=None, help="埋め込みバッチあたりの最大件数")
+    parser.add_argument("--batch-tokens", type=int, default=None, help="埋め込みバッチあたりの最大トークン数")
+    parser.add_argument("--upsert-batch-size", type=int, default=None, help="upsertあたりの件数")
+    parser.add_argument("--namespace-field", default=None, help="投入先namespaceを決めるメタデータ項目（例: LawType、空文字でデフォルトnamespace）")
+    parser.add_argument("--chunking", action=argparse.BooleanOptionalAction, default=None, help="長い条文を項・号単位に分割する（デフォルト: CHUNKING_ENABLED）")
+    args = parser.parse_args()
+    if args.manifest is None:
+        args.manifest = f"{args.input}.manifest.jsonl"
+    return args
 
 
 if __name__ == "__main__":
-    asyncio.run(ingest_legal_data())
\ No newline at end of file
+    asyncio.run(ingest_legal_data(parse_args()))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+埋め込みのマイクロバッチ化の負荷テスト
+
+同時に多数の単一テキスト埋め込み要求（get_embedding）を発行し、
+マイクロバッチ化なし / ありのスループット・レイテンシ・API呼び出し回数を比較する。
+キャッシュは無効にして毎回APIを呼び出す
+
+スタブ埋め込みサーバーに対して実行する:
+    python scripts/stub_embedding_server.py --latency-ms 50 &
+    OPENAI_API_KEY=dummy OPENAI_BASE_URL=http://localhost:8100/v1 \\
+        python scripts/load_test_embeddings.py [--requests 2000] [--concurrency 64] [--window-ms 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from app.services.embeddings import EmbeddingsService
+from app.services.embedding_batcher import EmbeddingBatcher
+
+
+def stub_request_count() -> int:
+    """スタブサーバーが受けたAPI呼び出し回数（取得できない場合は-1）"""
+    base_url = (settings.openai_base_url or "").rstrip("/")
+    if base_url.endswith("/v1"):
+        base_url = base_url[:-len("/v1")]
+    try:
+        return httpx.get(f"{base_url}/stats", timeout=5).json()["request_count"]
+    except Exception:
+        return -1
+
+
+def make_texts(count: int, duplicate_ratio: float, seed: int = 0):
+    """負荷テスト用のテキスト（duplicate_ratio の割合で人気の質問を繰り返す）"""
+    rng = random.Random(seed)
+    popular = [f"よくある質問 {i}: 契約の解除について" for i in range(10)]
+    return [
+        rng.choice(popular) if rng.random() < duplicate_ratio else f"負荷テストのクエリ {i}: 損害賠償の範囲"
+        for i in range(count)
+    ]
+
+
+async def run(service: EmbeddingsService, texts, concurrency: int):
+    latencies = []
+    queue = list(reversed(texts))
+
+    async def client():
+        while queue:
+            text = queue.pop()
+            start = time.perf_counter()
+            await service.get_embedding(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies
+
+
+async def main(args):
+    texts = make_texts(args.requests, args.duplicate_ratio)
+    print(
+        f"📊 requests={args.requests} concurrency={args.concurrency} "
+        f"duplicate_ratio={args.duplicate_ratio} max_api_concurrency={settings.embedding_max_concurrency}"
+    )
+
+    for label, batching in (("no batching", False), ("micro-batching", True)):
+        service = EmbeddingsService()
+        service.cache = None
+        service.batcher = (
+            EmbeddingBatcher(service._create_embeddings, window_ms=args.window_ms, max_batch_size=args.batch_size)
+            if batching else None
+        )
+        # 接続確立の影響を除くためのウォームアップ
+        await service.get_embedding("ウォームアップ")
+
+        calls_before = stub_request_count()
+        elapsed, latencies = await run(service, texts, args.concurrency)
+        calls = stub_request_count() - calls_before if calls_before >= 0 else None
+
+        print(
+            f"{label:>15}: {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50={np.percentile(latencies, 50):.1f}ms p95={np.percentile(latencies, 95):.1f}ms  "
+            f"api_calls={calls if calls is not None else 'n/a'}"
+        )
+        if service.batcher:
+            stats = service.batcher.get_stats()
+            print(
+                f"{'':>15}  avg_batch_size={stats['avg_batch_size']:.1f} "
+                f"deduplicated={stats['deduplicated']}"
+            )
+        await service.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="埋め込みのマイクロバッチ化の負荷テスト")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64, help="同時に要求を発行するクライアント数")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="人気の質問（同一テキスト）の割合")
+    parser.add_argument("--window-ms", type=float, default=settings.embedding_batch_window_ms)
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_batch_max_size)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
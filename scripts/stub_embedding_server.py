@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+OpenAI互換のスタブ埋め込みサーバー
+
+OPENAI_BASE_URL をこのサーバーに向けることで、実際のOpenAI APIを呼ばずに
+埋め込みサービスの動作確認や負荷テストを行うためのスクリプト
+
+使用方法:
+    python scripts/stub_embedding_server.py [--port 8100] [--latency-ms 50] [--dimension 3072]
+
+    OPENAI_API_KEY=dummy OPENAI_BASE_URL=http://localhost:8100/v1 \\
+        uvicorn main:app --port 8000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+from typing import List, Union
+
+import uvicorn
+from fastapi import FastAPI, Response
+from pydantic import BaseModel
+
+
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str]]
+    model: str = "text-embedding-3-large"
+
+
+def fake_embedding(text: str, dimension: int) -> List[float]:
+    """テキストのハッシュから決定的な単位ベクトルを生成"""
+    values = []
+    counter = 0
+    while len(values) < dimension:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    values = values[:dimension]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+def create_app(latency_ms: float, dimension: int) -> FastAPI:
+    app = FastAPI(title="Stub Embedding Server")
+    app.state.request_count = 0
+    app.state.input_count = 0
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: EmbeddingRequest):
+        texts = [request.input] if isinstance(request.input, str) else request.input
+        app.state.request_count += 1
+        app.state.input_count += len(texts)
+
+        # 上流APIの往復時間を模擬
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000)
+
+        body = {
+            "object": "list",
+            "model": request.model,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimension)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {
+                "prompt_tokens": sum(len(text) for text in texts),
+                "total_tokens": sum(len(text) for text in texts)
+            }
+        }
+        # jsonable_encoder を通すと大きなバッチほど応答が遅くなり、上流APIの特性と異なるため直接シリアライズする
+        return Response(content=json.dumps(body), media_type="application/json")
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "request_count": app.state.request_count,
+            "input_count": app.state.input_count
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI互換スタブ埋め込みサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="1リクエストあたりの擬似レイテンシ")
+    parser.add_argument("--dimension", type=int, default=3072)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency_ms, args.dimension), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
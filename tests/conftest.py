@@ -0,0 +1,22 @@
+"""
+ユニットテスト共通の設定
+
+サービスのシングルトンはインポート時に設定を読むため、外部API・本番データに
+依存しないよう、インポートより前に環境変数の既定値を設定する
+"""
+
+import os
+import tempfile
+
+_DATA_DIR = tempfile.mkdtemp(prefix="legal-ai-rag-tests-")
+
+os.environ.setdefault("VECTOR_STORE_BACKEND", "local")
+os.environ.setdefault("LOCAL_VECTOR_STORE_PATH", os.path.join(_DATA_DIR, "vector_store"))
+os.environ.setdefault("LEXICAL_INDEX_PATH", os.path.join(_DATA_DIR, "lexical_index"))
+os.environ.setdefault("INDEX_REVISION_PATH", os.path.join(_DATA_DIR, "index_revision"))
+os.environ.setdefault("PARENT_STORE_PATH", os.path.join(_DATA_DIR, "parent_articles"))
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(_DATA_DIR, "embeddings.sqlite3"))
+os.environ.setdefault("CHAT_JOBS_PATH", os.path.join(_DATA_DIR, "jobs", "chat_jobs.sqlite3"))
+os.environ.setdefault("EMBEDDING_CACHE_BACKEND", "memory")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+from app.services import rag
+from app.services.chat_jobs import ChatJobManager, ChatJobStore
+
+
+def _items(count):
+    return [{"id": f"q{i}", "messages": [{"role": "user", "content": f"質問{i}"}]} for i in range(count)]
+
+
+def test_job_store_calls_run_off_the_event_loop(tmp_path, monkeypatch):
+    loop_thread = []
+    store_threads = set()
+
+    class RecordingStore(ChatJobStore):
+        def claim_next_item(self, job_id):
+            store_threads.add(threading.get_ident())
+            return super().claim_next_item(job_id)
+
+    async def chat_with_rag(messages, max_context_docs, rerank, use_cache):
+        return {
+            "user_query": messages[-1].content, "ai_response": "回答",
+            "context_documents": [], "total_context_docs": 0, "cached": False
+        }
+
+    monkeypatch.setattr(rag.rag_service, "chat_with_rag", chat_with_rag)
+    store = RecordingStore(str(tmp_path / "jobs.sqlite3"))
+    manager = ChatJobManager(store, concurrency=2, rate_per_second=0)
+
+    async def scenario():
+        loop_thread.append(threading.get_ident())
+        await manager.startup(resume=False)
+        job_id = await manager.submit(_items(3), {})
+        for _ in range(200):
+            job = await manager.get_job(job_id)
+            if job["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        await manager.shutdown()
+        return job_id, job
+
+    job_id, job = asyncio.run(scenario())
+    assert job["status"] == "completed" and job["completed"] == 3
+    assert [record["id"] for record in store.iter_results(job_id)] == ["q0", "q1", "q2"]
+    assert store_threads and loop_thread[0] not in store_threads
+    store.close()
+
+
+def test_jobs_use_their_own_upstream_budget_below_the_interactive_limit(tmp_path, monkeypatch):
+    from app.services import chat_jobs
+    from app.services.concurrency_limiter import UpstreamOverloaded
+
+    monkeypatch.setattr(chat_jobs.settings, "chat_job_max_upstream_concurrency", 100)
+    monkeypatch.setattr(chat_jobs.settings, "openrouter_max_concurrency", 8)
+    monkeypatch.setattr(chat_jobs.settings, "adaptive_concurrency_enabled", True)
+
+    async def chat_with_rag(messages, max_context_docs, rerank, use_cache):
+        raise UpstreamOverloaded("openrouter", 1, "queue full")
+
+    monkeypatch.setattr(rag.rag_service, "chat_with_rag", chat_with_rag)
+    store = ChatJobStore(str(tmp_path / "jobs.sqlite3"))
+    manager = ChatJobManager(store, concurrency=2, rate_per_second=0, max_retries=0)
+    assert manager.upstream_limiter.max_limit == 7
+
+    async def scenario():
+        job_id = await manager.submit(_items(1), {})
+        item = store.claim_next_item(job_id)
+        await manager._process_item(job_id, item, {})
+        return await manager.get_job(job_id)
+
+    job = asyncio.run(scenario())
+    assert job["failed"] == 1
+    # 対話的な利用で上流APIが混んでいる間はジョブの枠を下げる
+    assert manager.upstream_limiter.capacity < 7
+    store.close()
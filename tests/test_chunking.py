@@ -0,0 +1,67 @@
+from app.services.chunking import ParentStore, chunk_article, make_chunk_id, parent_id_of
+from app.utils.legal_text import split_article
+
+
+ARTICLE = (
+    "次に掲げる者は、この法律の適用については、事業者とみなす。\n"
+    "一　第一号の者" + "あ" * 40 + "\n"
+    "二　第二号の者" + "い" * 40 + "\n"
+    "２　前項の規定は、次の場合には適用しない。" + "う" * 40 + "\n"
+    "３　第一項の届出は、書面でしなければならない。"
+)
+METADATA = {"LawTitle": "テスト法", "ArticleTitle": "第十条", "LawType": "Act"}
+
+
+def test_split_article_into_paragraphs_and_items():
+    paragraphs = split_article(ARTICLE)
+    assert [p["paragraph"] for p in paragraphs] == [1, 2, 3]
+    assert [num for num, _ in paragraphs[0]["items"]] == [1, 2]
+    assert paragraphs[0]["lead"].startswith("次に掲げる者は")
+    assert paragraphs[1]["items"] == []
+
+
+def test_chunk_ids_round_trip():
+    assert make_chunk_id("law_10", 1) == "law_10#p1"
+    assert make_chunk_id("law_10", 1, 2) == "law_10#p1i2"
+    assert parent_id_of("law_10#p1i2") == "law_10"
+    assert parent_id_of("law_10") == "law_10"
+
+
+def test_short_or_single_paragraph_articles_are_not_chunked():
+    assert chunk_article("law_1", "短い条文。", METADATA, min_article_tokens=100) is None
+    assert chunk_article("law_1", "え" * 200, METADATA, min_article_tokens=10) is None
+
+
+def test_paragraphs_become_chunks_and_long_paragraphs_split_into_items():
+    chunks = chunk_article("law_10", ARTICLE, METADATA, min_article_tokens=10, max_chunk_tokens=60)
+
+    assert [chunk["id"] for chunk in chunks] == ["law_10#p1i1", "law_10#p1i2", "law_10#p2", "law_10#p3"]
+    item = chunks[1]
+    # 号のチャンクには柱書を付ける
+    assert item["document"].startswith("次に掲げる者は")
+    assert "二　第二号の者" in item["document"]
+    assert item["embed_text"].startswith("テスト法 第十条 第1項第2号")
+    assert item["metadata"]["ParentID"] == "law_10"
+    assert (item["metadata"]["ParagraphNum"], item["metadata"]["ItemNum"]) == (1, 2)
+    assert chunks[2]["metadata"]["ItemNum"] == 0
+
+    # 項全体が上限内であれば号に分けない
+    whole = chunk_article("law_10", ARTICLE, METADATA, min_article_tokens=10, max_chunk_tokens=1000)
+    assert [chunk["id"] for chunk in whole] == ["law_10#p1", "law_10#p2", "law_10#p3"]
+
+
+def test_parent_store_persists_only_when_changed(tmp_path):
+    store = ParentStore(str(tmp_path / "parents"))
+    store.put("law_10", ARTICLE, METADATA)
+    store.save()
+    assert ParentStore(str(tmp_path / "parents")).get("law_10") == (ARTICLE, METADATA)
+
+    articles_path = tmp_path / "parents" / "articles.jsonl"
+    modified = articles_path.stat().st_mtime_ns
+    store.put("law_10", ARTICLE, METADATA)
+    store.save()
+    assert articles_path.stat().st_mtime_ns == modified
+
+    store.delete(["law_10"])
+    store.save()
+    assert len(ParentStore(str(tmp_path / "parents"))) == 0
@@ -0,0 +1,149 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import concurrency_limiter
+from app.services.concurrency_limiter import AdaptiveLimiter, UpstreamOverloaded, is_overload_error
+
+
+def _limiter(**options):
+    options.setdefault("max_queue", 10)
+    options.setdefault("max_wait_ms", 1000)
+    options.setdefault("backoff_ratio", 0.5)
+    options.setdefault("adaptive", True)
+    return AdaptiveLimiter("test", options.pop("max_limit", 4), min_limit=1, **options)
+
+
+def test_is_overload_error_follows_wrapped_causes():
+    response = httpx.Response(429, request=httpx.Request("POST", "http://upstream"))
+    status_error = httpx.HTTPStatusError("rate limited", request=response.request, response=response)
+    status_error.status_code = 429
+    try:
+        try:
+            raise asyncio.TimeoutError()
+        except asyncio.TimeoutError as e:
+            raise Exception("Failed to get embedding") from e
+    except Exception as wrapped:
+        assert is_overload_error(wrapped)
+    assert is_overload_error(status_error)
+    assert not is_overload_error(ValueError("bad request"))
+
+
+def test_overload_decreases_limit_and_success_recovers_it(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(concurrency_limiter.time, "monotonic", lambda: now[0])
+    limiter = _limiter(max_limit=4)
+
+    async def call(overloaded=False, duration=0.1):
+        async with limiter.acquire() as slot:
+            await asyncio.sleep(0)
+            now[0] += duration
+            if overloaded:
+                slot.record_status(503)
+
+    async def saturate(count):
+        # 上限を使い切った状態で成功させる（上限は使い切っている間だけ戻す）
+        await asyncio.gather(*[call() for _ in range(count)])
+
+    async def scenario():
+        await call(overloaded=True)
+        assert limiter.capacity == 2
+        # 平均レイテンシの間は同じ過負荷で何度も下げない
+        await call(overloaded=True, duration=0.0)
+        assert limiter.capacity == 2
+        now[0] += 10
+        await call(overloaded=True)
+        assert limiter.capacity == 1
+        for _ in range(20):
+            await saturate(limiter.capacity)
+        assert limiter.capacity == 4
+
+    asyncio.run(scenario())
+    stats = limiter.get_stats()
+    assert stats["overloads"] == 3 and stats["limit_decreases"] == 2
+
+
+def test_waiters_are_granted_in_order():
+    limiter = _limiter(max_limit=1)
+    order = []
+
+    async def call(name):
+        async with limiter.acquire():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*[call(i) for i in range(4)])
+
+    asyncio.run(scenario())
+    assert order == [0, 1, 2, 3]
+    assert limiter.get_stats()["queued"] == 3
+    assert limiter.in_flight == 0
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    limiter = _limiter(max_limit=1, max_queue=1)
+
+    async def hold(release):
+        async with limiter.acquire():
+            await release.wait()
+
+    async def scenario():
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(release))
+        queued = asyncio.create_task(hold(release))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamOverloaded) as excinfo:
+            async with limiter.acquire():
+                pass
+        with pytest.raises(UpstreamOverloaded):
+            limiter.reject_if_full()
+        release.set()
+        await asyncio.gather(holder, queued)
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.upstream == "test" and error.retry_after >= 1
+    assert limiter.get_stats()["rejected_queue_full"] == 2
+    assert limiter.in_flight == 0
+
+
+def test_queue_wait_timeout_is_rejected():
+    limiter = _limiter(max_limit=1, max_wait_ms=10)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.acquire():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamOverloaded):
+            async with limiter.acquire():
+                pass
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
+    assert limiter.get_stats()["rejected_timeout"] == 1
+    assert limiter.in_flight == 0 and limiter.get_stats()["waiting"] == 0
+
+
+def test_batch_search_route_returns_503_when_shed(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from app.services.search import search_service
+
+    async def shed(requests):
+        raise UpstreamOverloaded("openai", 7, "queue full")
+
+    monkeypatch.setattr(search_service, "search_batch", shed)
+    response = TestClient(main.app).post("/api/v1/search/batch", json={"queries": [{"query": "民法"}]})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    assert response.json()["upstream"] == "openai"
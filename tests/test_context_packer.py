@@ -0,0 +1,110 @@
+from app.services.context_packer import ContextPacker, deduplicate_documents
+from app.utils.tokens import count_tokens
+
+
+SYSTEM_TEMPLATE = "以下の条文に基づいて回答してください。\n{context_text}"
+
+
+def _format_context(documents):
+    return "\n\n".join(f"【{doc['id']}】\n{doc['document']}" for doc in documents)
+
+
+def _doc(doc_id, text):
+    return {"id": doc_id, "document": text}
+
+
+def test_deduplicate_keeps_first_rank_and_longer_text():
+    documents = [
+        _doc("article-1-paragraph-1", "第一項の本文"),
+        _doc("article-2", "別の条文"),
+        _doc("article-1", "第一項の本文\n第二項の本文"),
+        _doc("article-2", "同じIDの重複"),
+    ]
+    kept = deduplicate_documents(documents)
+    assert [doc["id"] for doc in kept] == ["article-1", "article-2"]
+
+
+def test_pack_stays_within_prompt_budget_and_truncates_long_documents():
+    packer = ContextPacker(
+        prompt_token_budget=300, history_token_budget=100, history_summary_tokens=40,
+        max_doc_tokens=80, min_doc_tokens=20
+    )
+    documents = [_doc("long", "あ" * 500), _doc("short", "い" * 30), _doc("rest", "う" * 400)]
+    messages = [{"role": "user", "content": "損害賠償の要件は？"}]
+
+    packed = packer.pack(SYSTEM_TEMPLATE, messages, documents, _format_context)
+
+    assert packed.stats["prompt_tokens"] <= 300
+    assert [doc["id"] for doc in packed.documents][:2] == ["long", "short"]
+    assert packed.documents[0]["document"].endswith("…（以下省略）")
+    assert count_tokens(_format_context(packed.documents[:1])) <= 80
+    assert packed.stats["documents_truncated"] >= 1
+    assert packed.stats["truncated_ids"][0] == "long"
+    # クライアントに返す条文は切り詰め前の本文
+    assert [doc["id"] for doc in packed.source_documents] == [doc["id"] for doc in packed.documents]
+    assert packed.source_documents[0]["document"] == "あ" * 500
+    assert packed.stats["tokens_saved"] > 0
+    assert packed.messages[-1] == messages[-1]
+
+
+def test_documents_that_cannot_fit_are_skipped_for_shorter_ones():
+    base = count_tokens(SYSTEM_TEMPLATE.format(context_text="")) + 4 + count_tokens("質問") + 4
+    budget = base + 70
+    packer = ContextPacker(
+        prompt_token_budget=budget, history_token_budget=50, history_summary_tokens=20,
+        max_doc_tokens=1000, min_doc_tokens=60
+    )
+    # 1件目は切り詰めても最低限の長さ（60トークン）が入らないので除外し、2件目を入れる
+    documents = [_doc("huge", "あ" * 1000), _doc("small", "い" * 50)]
+
+    packed = packer.pack(SYSTEM_TEMPLATE, [{"role": "user", "content": "質問"}], documents, _format_context)
+
+    assert [doc["id"] for doc in packed.documents] == ["small"]
+    assert packed.documents[0]["document"] == "い" * 50
+    assert packed.stats["prompt_tokens"] <= budget
+
+
+def test_history_keeps_latest_turn_and_summarizes_older_questions():
+    packer = ContextPacker(
+        prompt_token_budget=4000, history_token_budget=60, history_summary_tokens=80,
+        max_doc_tokens=100, min_doc_tokens=10
+    )
+    messages = []
+    for i in range(6):
+        messages.append({"role": "user", "content": f"質問{i}" + "。" * 30})
+        messages.append({"role": "assistant", "content": "回答" + "。" * 30})
+    messages.append({"role": "user", "content": "最新の質問"})
+
+    history = packer.prepare_history(messages)
+
+    assert history.messages[-1] == {"role": "user", "content": "最新の質問"}
+    assert history.summarized and history.dropped > 0
+    assert history.messages[0]["role"] == "system"
+    # 要約には省略したターンの質問が新しい順に残る
+    assert "質問" in history.messages[0]["content"]
+    kept_turns = history.messages[1:-1]
+    assert sum(count_tokens(m["content"]) + 4 for m in kept_turns) <= 60
+    assert history.tokens < history.original_tokens
+
+
+def test_oversized_current_turn_is_truncated_to_leave_room_for_documents():
+    packer = ContextPacker(
+        prompt_token_budget=300, history_token_budget=200, history_summary_tokens=40,
+        max_doc_tokens=80, min_doc_tokens=20
+    )
+    messages = [
+        {"role": "user", "content": "前の質問"},
+        {"role": "assistant", "content": "前の回答"},
+        {"role": "user", "content": "長い質問" + "。" * 1000},
+    ]
+    documents = [_doc("article", "い" * 40)]
+
+    packed = packer.pack(SYSTEM_TEMPLATE, messages, documents, _format_context)
+
+    assert packed.stats["prompt_tokens"] <= 300
+    assert [doc["id"] for doc in packed.documents] == ["article"]
+    assert packed.stats["current_turn_truncated"]
+    assert packed.stats["history_turns_dropped"] == 2
+    assert [m["role"] for m in packed.messages] == ["system", "user"]
+    assert packed.messages[-1]["content"].startswith("長い質問")
+    assert packed.messages[-1]["content"].endswith("…（以下省略）")
@@ -0,0 +1,85 @@
+import asyncio
+import gc
+
+import pytest
+
+from app.services.embedding_batcher import EmbeddingBatcher
+
+
+class FakeBatchEmbedder:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = []
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_requests_share_one_deduplicated_call():
+    embedder = FakeBatchEmbedder()
+    batcher = EmbeddingBatcher(embedder, window_ms=5, max_batch_size=64)
+
+    async def scenario():
+        return await asyncio.gather(*[batcher.embed(text) for text in ["a", "bb", "a", "ccc"]])
+
+    assert asyncio.run(scenario()) == [[1.0], [2.0], [1.0], [3.0]]
+    assert embedder.calls == [["a", "bb", "ccc"]]
+    stats = batcher.get_stats()
+    assert (stats["requests"], stats["deduplicated"], stats["batches"]) == (4, 1, 1)
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    embedder = FakeBatchEmbedder()
+    batcher = EmbeddingBatcher(embedder, window_ms=10000, max_batch_size=2)
+
+    async def scenario():
+        return await asyncio.wait_for(asyncio.gather(batcher.embed("a"), batcher.embed("b")), timeout=1)
+
+    assert asyncio.run(scenario()) == [[1.0], [1.0]]
+
+
+def test_api_error_is_returned_to_callers():
+    batcher = EmbeddingBatcher(FakeBatchEmbedder(error=RuntimeError("boom")), window_ms=1, max_batch_size=64)
+
+    async def scenario():
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("a"), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(scenario())] == ["boom", "boom"]
+
+
+def test_cancelled_caller_does_not_affect_others():
+    embedder = FakeBatchEmbedder(delay=0.05)
+    batcher = EmbeddingBatcher(embedder, window_ms=1, max_batch_size=64)
+
+    async def scenario():
+        first = asyncio.create_task(batcher.embed("a"))
+        second = asyncio.create_task(batcher.embed("a"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == [1.0]
+
+
+def test_error_after_every_caller_cancelled_is_retrieved():
+    handler_calls = []
+    batcher = EmbeddingBatcher(FakeBatchEmbedder(delay=0.02, error=RuntimeError("boom")), window_ms=1, max_batch_size=64)
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: handler_calls.append(context))
+        caller = asyncio.create_task(batcher.embed("a"))
+        await asyncio.sleep(0.005)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        gc.collect()
+
+    asyncio.run(scenario())
+    gc.collect()
+    assert not [c for c in handler_calls if "never retrieved" in c.get("message", "")]
@@ -0,0 +1,101 @@
+import asyncio
+
+from app.services import embedding_cache
+from app.services.embedding_cache import (
+    EmbeddingCache,
+    MemoryCacheBackend,
+    SQLiteCacheBackend,
+    normalize_query,
+)
+
+
+def test_normalize_query_folds_width_punctuation_and_case():
+    assert normalize_query("  民法 第709条は？ ") == normalize_query("民法　第７０９条は?")
+    assert normalize_query("ABC") == "abc"
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2, ttl_seconds=0)
+    backend.set("a", [1.0])
+    backend.set("b", [2.0])
+    assert backend.get("a") == [1.0]
+    backend.set("c", [3.0])
+
+    assert backend.get("b") is None
+    assert backend.get("a") == [1.0]
+    assert backend.get("c") == [3.0]
+    assert backend.size() == 2
+
+
+def test_memory_backend_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+    backend = MemoryCacheBackend(max_entries=10, ttl_seconds=60)
+    backend.set("a", [1.0])
+
+    now[0] += 59
+    assert backend.get("a") == [1.0]
+    now[0] += 2
+    assert backend.get("a") is None
+    assert backend.size() == 0
+
+
+def test_sqlite_backend_persists_and_counts_rows(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    backend = SQLiteCacheBackend(path, max_entries=10, ttl_seconds=0)
+    backend.set("a", [0.5, 1.5])
+    backend.set("a", [2.5, 3.5])
+    backend.set("b", [4.0])
+    assert backend.size() == 2
+    backend.close()
+
+    reopened = SQLiteCacheBackend(path, max_entries=10, ttl_seconds=0)
+    assert reopened.size() == 2
+    assert reopened.get("a") == [2.5, 3.5]
+    reopened.clear()
+    assert reopened.size() == 0
+    assert reopened.get("a") is None
+
+
+def test_sqlite_backend_evicts_by_batched_last_access(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+    backend = SQLiteCacheBackend(str(tmp_path / "embeddings.sqlite3"), max_entries=2, ttl_seconds=0)
+    backend.set("a", [1.0])
+    now[0] += 1
+    backend.set("b", [2.0])
+    now[0] += 1
+    # ヒット時のアクセス時刻はまだ書き込まれていないが、削除の前に反映される
+    assert backend.get("a") == [1.0]
+    assert backend._pending_access == {"a": now[0]}
+    now[0] += 1
+    backend.set("c", [3.0])
+
+    assert backend.size() == 2
+    assert backend.get("b") is None
+    assert backend.get("a") == [1.0]
+    assert backend.get("c") == [3.0]
+
+
+def test_sqlite_backend_expires_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+    backend = SQLiteCacheBackend(str(tmp_path / "embeddings.sqlite3"), max_entries=10, ttl_seconds=60)
+    backend.set("a", [1.0])
+    now[0] += 61
+
+    assert backend.get("a") is None
+    assert backend.size() == 0
+
+
+def test_embedding_cache_async_access_counts_hits(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "embeddings.sqlite3"), max_entries=10, ttl_seconds=0)
+    cache = EmbeddingCache(backend, model="test-model")
+
+    async def scenario():
+        await cache.async_set("民法 709条", [1.0, 2.0])
+        return await cache.async_get_many(["民法　７０９条", "刑法 199条"])
+
+    assert asyncio.run(scenario()) == [[1.0, 2.0], None]
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.embeddings import EmbeddingsService
+
+
+class FakeEmbeddingsAPI:
+    """入力より1件少ない埋め込みを返すAPI"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, input, model):
+        self.calls.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(text))]) for text in input[:-1]])
+
+
+def _service():
+    service = EmbeddingsService()
+    service.client = SimpleNamespace(embeddings=FakeEmbeddingsAPI())
+    return service
+
+
+def test_get_embeddings_rejects_short_response_without_caching():
+    service = _service()
+
+    with pytest.raises(Exception, match="returned 1 embeddings for 2 inputs"):
+        asyncio.run(service.get_embeddings(["民法", "刑法"], use_cache=True))
+    assert service.cache.get_many(["民法", "刑法"]) == [None, None]
+
+
+def test_short_response_fails_every_batched_caller():
+    service = _service()
+
+    async def scenario():
+        return await asyncio.gather(service.get_embedding("a"), service.get_embedding("b"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert service.client.embeddings.calls == [["a", "b"]]
+    assert all(isinstance(result, Exception) for result in results)
+    assert "returned 1 embeddings for 2 inputs" in str(results[0])
@@ -0,0 +1,209 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.ingestion import IngestionPipeline, IngestManifest, iter_records
+from app.services.lexical_index import LexicalIndex
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    async def get_embeddings(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.documents = {}
+        self.add_calls = 0
+
+    async def async_add_documents(self, documents, metadatas, ids, embeddings, namespace=""):
+        self.add_calls += 1
+        for doc_id, document in zip(ids, documents):
+            self.documents[(namespace, doc_id)] = document
+
+    async def async_delete_documents(self, ids, namespace=""):
+        for doc_id in ids:
+            self.documents.pop((namespace, doc_id), None)
+
+
+def _records(count, prefix="本文"):
+    return [
+        {"id": f"doc-{i}", "law_name": "民法", "article": f"第{i + 1}条", "title": "", "content": f"{prefix}{i}"}
+        for i in range(count)
+    ]
+
+
+def _write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records), encoding="utf-8")
+    return str(path)
+
+
+def _pipeline(manifest_path, vector_store=None, embeddings=None, **options):
+    options.setdefault("concurrency", 1)
+    options.setdefault("batch_max_items", 1)
+    options.setdefault("upsert_batch_size", 1)
+    options.setdefault("chunking", False)
+    return IngestionPipeline(
+        embeddings_service=embeddings or FakeEmbeddings(),
+        vector_store=vector_store or FakeVectorStore(),
+        manifest_path=str(manifest_path),
+        namespace_field="",
+        progress_interval=3600,
+        **options
+    )
+
+
+def test_iter_records_reads_json_array_and_jsonl(tmp_path):
+    records = _records(3)
+    array_path = tmp_path / "records.json"
+    array_path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+
+    assert list(iter_records(str(array_path))) == records
+    assert list(iter_records(_write_jsonl(tmp_path / "records.jsonl", records))) == records
+
+
+def test_manifest_replays_appended_entries(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text(
+        '{"id": "a", "hash": "1"}\n'
+        '{"id": "b", "hash": "2", "namespace": "Act"}\n'
+        '{"id": "a", "hash": "3"}\n'
+        '{"id": "b", "deleted": true}\n',
+        encoding="utf-8"
+    )
+    manifest = IngestManifest(str(path))
+    assert manifest.hashes == {"a": "3"}
+    assert manifest.get_namespace("b") == ""
+
+    manifest.compact()
+    assert IngestManifest(str(path)).hashes == {"a": "3"}
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_rerun_embeds_only_new_and_changed_documents(tmp_path):
+    manifest_path = tmp_path / "input.manifest.jsonl"
+    vector_store = FakeVectorStore()
+    input_path = _write_jsonl(tmp_path / "input.jsonl", _records(3))
+    summary = asyncio.run(_pipeline(manifest_path, vector_store).run(input_path))
+    assert (summary["new"], summary["skipped"]) == (3, 0)
+
+    records = _records(4)
+    records[1]["content"] = "改正後の本文"
+    embeddings = FakeEmbeddings()
+    input_path = _write_jsonl(tmp_path / "input.jsonl", records)
+    summary = asyncio.run(_pipeline(manifest_path, vector_store, embeddings).run(input_path))
+
+    assert (summary["new"], summary["changed"], summary["skipped"]) == (1, 1, 2)
+    assert sorted(len(call) for call in embeddings.calls) == [1, 1]
+    assert vector_store.documents[("", "doc-1")] == "改正後の本文"
+
+
+def test_prune_deletes_documents_missing_from_snapshot(tmp_path):
+    manifest_path = tmp_path / "input.manifest.jsonl"
+    vector_store = FakeVectorStore()
+    asyncio.run(_pipeline(manifest_path, vector_store).run(_write_jsonl(tmp_path / "input.jsonl", _records(3))))
+
+    input_path = _write_jsonl(tmp_path / "input.jsonl", _records(2))
+    summary = asyncio.run(_pipeline(manifest_path, vector_store).run(input_path, prune=True))
+
+    assert summary["deleted"] == 1
+    assert ("", "doc-2") not in vector_store.documents
+    assert "doc-2" not in IngestManifest(str(manifest_path)).hashes
+
+
+def test_resume_after_failed_batch_embeds_only_unfinished_documents(tmp_path):
+    class FailingOnce(FakeVectorStore):
+        async def async_add_documents(self, documents, metadatas, ids, embeddings, namespace=""):
+            if "doc-1" in ids and not getattr(self, "failed", False):
+                self.failed = True
+                raise Exception("upsert failed")
+            await super().async_add_documents(documents, metadatas, ids, embeddings, namespace)
+
+    manifest_path = tmp_path / "input.manifest.jsonl"
+    vector_store = FailingOnce()
+    input_path = _write_jsonl(tmp_path / "input.jsonl", _records(3))
+    try:
+        asyncio.run(_pipeline(manifest_path, vector_store).run(input_path))
+    except Exception as e:
+        assert "1 batches failed" in str(e)
+    else:
+        raise AssertionError("the failed batch should be reported")
+
+    embeddings = FakeEmbeddings()
+    summary = asyncio.run(_pipeline(manifest_path, vector_store, embeddings).run(input_path))
+    assert (summary["new"], summary["skipped"]) == (1, 2)
+    assert len(vector_store.documents) == 3
+
+
+class Killed(BaseException):
+    """プロセスの強制終了の代わり（Exceptionではないのでパイプラインの後始末を通らない）"""
+
+
+@pytest.mark.parametrize("checkpoint_interval", [0, 3600])
+def test_resume_after_kill_keeps_lexical_index_in_step_with_manifest(tmp_path, checkpoint_interval):
+    class KilledAfterFirstChunk(FakeVectorStore):
+        async def async_add_documents(self, documents, metadatas, ids, embeddings, namespace=""):
+            if self.add_calls == 1:
+                raise Killed()
+            await super().async_add_documents(documents, metadatas, ids, embeddings, namespace)
+
+    manifest_path = tmp_path / "input.manifest.jsonl"
+    lexical_path = tmp_path / "lexical"
+    input_path = _write_jsonl(tmp_path / "input.jsonl", _records(3))
+    with pytest.raises(Killed):
+        asyncio.run(_pipeline(
+            manifest_path, KilledAfterFirstChunk(),
+            lexical_index=LexicalIndex(str(lexical_path)), checkpoint_interval=checkpoint_interval
+        ).run(input_path))
+
+    # マニフェストに記録済みの文書は、保存済みのBM25インデックスに必ず含まれる
+    recorded = set(IngestManifest(str(manifest_path)).hashes)
+    assert recorded <= set(LexicalIndex(str(lexical_path))._docs)
+
+    vector_store = FakeVectorStore()
+    asyncio.run(_pipeline(
+        manifest_path, vector_store,
+        lexical_index=LexicalIndex(str(lexical_path)), checkpoint_interval=checkpoint_interval
+    ).run(input_path))
+
+    lexical_index = LexicalIndex(str(lexical_path))
+    assert set(lexical_index._docs) == {"doc-0", "doc-1", "doc-2"}
+    assert lexical_index.search("本文0", n_results=1)[0]["id"] == "doc-0"
+    assert {doc_id for _, doc_id in vector_store.documents} | recorded == {"doc-0", "doc-1", "doc-2"}
+
+
+def test_parent_store_is_saved_before_chunks_are_recorded(tmp_path, monkeypatch):
+    from app.services import chunking
+    from app.services.chunking import ParentStore
+
+    monkeypatch.setattr(chunking.settings, "chunk_min_article_tokens", 10)
+    monkeypatch.setattr(chunking.settings, "chunk_max_tokens", 1000)
+
+    class KilledAfterFirstChunk(FakeVectorStore):
+        async def async_add_documents(self, documents, metadatas, ids, embeddings, namespace=""):
+            if self.add_calls == 1:
+                raise Killed()
+            await super().async_add_documents(documents, metadatas, ids, embeddings, namespace)
+
+    record = {
+        "LawID": "law", "LawTitle": "テスト法", "ArticleTitle": "第一条",
+        "original_text": "第一項の本文です。\n２　第二項の本文です。\n３　第三項の本文です。"
+    }
+    manifest_path = tmp_path / "input.manifest.jsonl"
+    parents_path = tmp_path / "parents"
+    input_path = _write_jsonl(tmp_path / "input.jsonl", [record])
+    with pytest.raises(Killed):
+        asyncio.run(_pipeline(
+            manifest_path, KilledAfterFirstChunk(), chunking=True,
+            parent_store=ParentStore(str(parents_path)), checkpoint_interval=0
+        ).run(input_path))
+
+    recorded = IngestManifest(str(manifest_path)).hashes
+    assert list(recorded) == ["law_1#p1"]
+    # 記録済みのチャンクの親条文は保存済み
+    assert ParentStore(str(parents_path)).get("law_1") is not None
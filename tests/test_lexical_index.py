@@ -0,0 +1,62 @@
+import pytest
+
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from app.services.metadata_filter import normalize_filters
+
+
+def test_tokenize_uses_bigrams_for_japanese_and_words_for_ascii():
+    assert tokenize("公序良俗") == ["公序", "序良", "良俗"]
+    assert tokenize("第415条") == ["第", "415", "条"]
+    # NFKC正規化で全角英数字も同じトークンになる
+    assert tokenize("ＡＢＣ　１２３") == ["abc", "123"]
+    assert tokenize("の") == ["の"]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical"))
+    index.upsert(
+        ids=["civil-90", "civil-415", "penal-199"],
+        documents=[
+            "公の秩序又は善良の風俗に反する法律行為は、無効とする。",
+            "債務者がその債務の本旨に従った履行をしないときは、債権者は、これによって生じた損害の賠償を請求することができる。",
+            "人を殺した者は、死刑又は無期若しくは五年以上の拘禁刑に処する。",
+        ],
+        metadatas=[
+            {"LawTitle": "民法", "ArticleTitle": "第九十条", "LawType": "Act"},
+            {"LawTitle": "民法", "ArticleTitle": "第四百十五条", "LawType": "Act"},
+            {"LawTitle": "刑法", "ArticleTitle": "第百九十九条", "LawType": "Act"},
+        ]
+    )
+    index.build()
+    return index
+
+
+def test_search_ranks_exact_terms(index):
+    results = index.search("損害の賠償", n_results=3)
+    assert results[0]["id"] == "civil-415"
+    assert results[0]["bm25_score"] > 0
+    assert index.search("xyz", n_results=3) == []
+
+
+def test_search_applies_metadata_filters(index):
+    filters = normalize_filters({"law_title": ["刑法"]})
+    assert [result["id"] for result in index.search("無効 死刑", n_results=3, filters=filters)] == ["penal-199"]
+
+
+def test_save_and_reload(index, tmp_path):
+    index.delete(["penal-199"])
+    index.save()
+
+    reloaded = LexicalIndex(str(tmp_path / "lexical"))
+    assert reloaded.document_count == 2
+    assert reloaded.search("死刑", n_results=3) == []
+    assert reloaded.search("善良の風俗", n_results=1)[0]["id"] == "civil-90"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a"]], k=60)
+    assert fused["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused["b"] == pytest.approx(fused["a"])
+    assert fused["c"] == pytest.approx(1 / 63)
+    assert max(fused, key=fused.get) in ("a", "b")
@@ -0,0 +1,138 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.local_vector_store import LocalVectorStore
+from app.services.metadata_filter import normalize_filters
+from config import settings
+
+
+def _unit(index: int, dimension: int = 8) -> list:
+    vector = [0.0] * dimension
+    vector[index % dimension] = 1.0
+    return vector
+
+
+def _add(store, ids, vectors, metadatas=None, namespace=""):
+    metadatas = metadatas or [{"LawTitle": "民法"} for _ in ids]
+    store.add_documents([f"doc {doc_id}" for doc_id in ids], metadatas, ids, vectors, namespace=namespace)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "index"), scan_dtype="float32", ivf_threshold=10 ** 9)
+    yield store
+    store.close()
+
+
+def test_add_search_and_overwrite(store):
+    _add(store, ["a", "b", "c"], [_unit(0), _unit(1), _unit(2)])
+    result = store.search(_unit(1), n_results=2)
+    assert result["ids"][0][0] == "b"
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-6)
+
+    # 既存IDは同じ行を上書きする
+    _add(store, ["b"], [_unit(3)])
+    assert store.search(_unit(3), n_results=1)["ids"] == [["b"]]
+    assert store.get_collection_info()["document_count"] == 3
+
+
+def test_delete_excludes_rows_and_survives_reload(store, tmp_path):
+    _add(store, ["a", "b"], [_unit(0), _unit(1)])
+    store.delete_documents(["a"])
+    assert "a" not in store.search(_unit(0), n_results=5)["ids"][0]
+
+    reloaded = LocalVectorStore(str(tmp_path / "index"), scan_dtype="float32", ivf_threshold=10 ** 9)
+    try:
+        assert reloaded.search(_unit(0), n_results=5)["ids"] == [["b"]]
+    finally:
+        reloaded.close()
+
+
+def test_metadata_filter(store):
+    metadatas = [
+        {"LawTitle": "民法", "LawType": "Act", "updateDate": "2020-04-01"},
+        {"LawTitle": "刑法", "LawType": "Act", "updateDate": "2023-06-01"},
+        {"LawTitle": "民法施行規則", "LawType": "MinisterialOrdinance", "updateDate": "2021-01-01"},
+    ]
+    _add(store, ["a", "b", "c"], [_unit(0), _unit(0), _unit(0)], metadatas)
+
+    by_title = store.search(_unit(0), n_results=5, filters=normalize_filters({"law_title": "刑法"}))
+    assert by_title["ids"] == [["b"]]
+    by_date = store.search(
+        _unit(0), n_results=5,
+        filters=normalize_filters({"law_type": ["Act"], "update_date_from": "2021-01-01"})
+    )
+    assert by_date["ids"] == [["b"]]
+
+
+def test_namespaces_are_separate_partitions(store):
+    _add(store, ["a"], [_unit(0)])
+    _add(store, ["b"], [_unit(0)], namespace="Act")
+
+    assert store.search(_unit(0), n_results=5)["ids"] == [["a"]]
+    assert store.search(_unit(0), n_results=5, namespace="Act")["ids"] == [["b"]]
+    assert store.list_namespaces() == ["", "Act"]
+    partition = store._partition("Act")
+    assert partition._executor is store._executor
+    assert partition.limiter is store.limiter
+
+
+def test_grows_capacity_beyond_initial_size(store):
+    count = 1100
+    vectors = np.random.default_rng(0).normal(size=(count, 8)).astype(np.float32)
+    _add(store, [str(i) for i in range(count)], vectors.tolist())
+
+    assert store._capacity >= count
+    assert store.search(vectors[1050].tolist(), n_results=1)["ids"] == [["1050"]]
+
+
+def test_failed_capacity_growth_leaves_no_dangling_ids(store, monkeypatch):
+    _add(store, ["a"], [_unit(0)])
+
+    def fail(required):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_ensure_capacity", fail)
+    with pytest.raises(Exception):
+        _add(store, ["b"], [_unit(1)])
+    assert "b" not in store._id_to_row
+    monkeypatch.undo()
+
+    _add(store, ["b"], [_unit(1)])
+    assert store.search(_unit(1), n_results=1)["ids"] == [["b"]]
+
+
+def test_ivf_build_runs_outside_store_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "local_ivf_nlist", 4)
+    monkeypatch.setattr(settings, "local_ivf_nprobe", 4)
+    store = LocalVectorStore(str(tmp_path / "index"), scan_dtype="float32", ivf_threshold=50)
+    vectors = np.random.default_rng(1).normal(size=(60, 8)).astype(np.float32)
+    _add(store, [str(i) for i in range(60)], vectors.tolist())
+    assert store._centroids is not None
+
+    original_assign = store._assign_to_centroids
+    writer_finished = []
+
+    def assign_while_writing(vectors, centroids=None):
+        if centroids is not None and not writer_finished:
+            # k-meansの最中に別スレッドから追加・更新できること（ロックを持っていれば待たされる）
+            writer = threading.Thread(
+                target=_add, args=(store, ["0", "new"], [_unit(5), _unit(6)])
+            )
+            writer.start()
+            writer.join(timeout=5)
+            writer_finished.append(not writer.is_alive())
+        return original_assign(vectors, centroids)
+
+    monkeypatch.setattr(store, "_assign_to_centroids", assign_while_writing)
+    store.build_index()
+    monkeypatch.undo()
+
+    assert writer_finished == [True]
+    assert len(store._assign) == store._count == 61
+    expected = original_assign(np.asarray(store._vectors[[0, 60]]))
+    assert list(store._assign[[0, 60]]) == list(expected)
+    assert store.search(_unit(6), n_results=1)["ids"] == [["new"]]
+    store.close()
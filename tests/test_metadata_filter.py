@@ -0,0 +1,66 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.schemas import SearchFilters
+from app.services.metadata_filter import (
+    MetadataBitmapIndex,
+    matches_filters,
+    normalize_filters,
+    to_pinecone_filter,
+)
+from app.utils.dates import parse_date
+
+
+def test_parse_date_formats():
+    assert parse_date("2023-04-01") == 20230401
+    assert parse_date("2023/4/1") == 20230401
+    assert parse_date("20230401") == 20230401
+    assert parse_date("2023-04-01T09:00:00") == 20230401
+    assert parse_date("April 1") is None
+
+
+def test_normalize_filters():
+    assert normalize_filters(None) is None
+    assert normalize_filters({"law_title": None, "law_type": []}) is None
+    assert normalize_filters({
+        "law_title": "民法",
+        "law_type": ["Act", "Act", "CabinetOrder"],
+        "update_date_from": "2020-01-01",
+    }) == {
+        "LawTitle": ["民法"],
+        "LawType": ["Act", "CabinetOrder"],
+        "updateDate": {"gte": 20200101},
+    }
+    with pytest.raises(ValueError):
+        normalize_filters({"update_date_to": "not a date"})
+    with pytest.raises(ValueError):
+        normalize_filters({"unknown": "x"})
+
+
+def test_search_filters_schema_accepts_single_strings_and_rejects_bad_dates():
+    filters = SearchFilters(law_title="民法", law_type=["Act"], update_date_to="2023/12/31")
+    assert filters.law_title == ["民法"]
+    assert normalize_filters(filters.model_dump(exclude_none=True))["updateDate"] == {"lte": 20231231}
+    with pytest.raises(ValidationError):
+        SearchFilters(update_date_from="yesterday")
+
+
+def test_pinecone_filter_and_matches():
+    filters = normalize_filters({"law_type": "Act", "update_date_from": "2021-01-01"})
+    assert to_pinecone_filter(filters) == {
+        "$and": [{"LawType": {"$in": ["Act"]}}, {"updateDateNum": {"$gte": 20210101}}]
+    }
+    assert matches_filters({"LawType": "Act", "updateDate": "2022-05-01"}, filters)
+    assert not matches_filters({"LawType": "Act", "updateDate": "2020-05-01"}, filters)
+    assert not matches_filters({"LawType": "Act"}, filters)
+
+
+def test_bitmap_index_mask():
+    index = MetadataBitmapIndex()
+    index.set_rows(range(3), [
+        {"LawTitle": "民法", "updateDate": "2020-01-01"},
+        {"LawTitle": "刑法", "updateDate": "2022-01-01"},
+        {"LawTitle": "民法", "updateDate": "2023-01-01"},
+    ])
+    mask = index.mask(normalize_filters({"law_title": "民法", "update_date_from": "2021-01-01"}), 3)
+    assert mask.tolist() == [False, False, True]
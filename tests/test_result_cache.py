@@ -0,0 +1,99 @@
+import asyncio
+
+from app.services import result_cache
+from app.services.result_cache import IndexRevision, ResultCache, make_result_cache_key
+
+
+def test_cache_key_ignores_query_formatting_but_not_options():
+    key = make_result_cache_key("民法 709条", 5, filters={"law_type": ["Act"]}, mode="hybrid")
+    assert key == make_result_cache_key("民法　７０９条？", 5, filters={"law_type": ["Act"]}, mode="hybrid")
+    assert key != make_result_cache_key("民法 709条", 5, filters={"law_type": ["Act"]}, mode="vector")
+    assert key != make_result_cache_key("民法 709条", 10, filters={"law_type": ["Act"]}, mode="hybrid")
+
+
+def test_cache_returns_copies_and_evicts_oldest():
+    cache = ResultCache(max_entries=2, max_bytes=1024 * 1024, ttl_seconds=0)
+    cache.set("a", [{"id": "a"}])
+    cache.set("b", [{"id": "b"}])
+    cache.get("a")[0]["id"] = "changed"
+    cache.set("c", [{"id": "c"}])
+
+    assert cache.get("a") == [{"id": "a"}]
+    assert cache.get("b") is None
+    assert cache.get("c") == [{"id": "c"}]
+
+
+def test_cache_respects_byte_budget():
+    cache = ResultCache(max_entries=100, max_bytes=40, ttl_seconds=0)
+    cache.set("large", ["x" * 50])
+    cache.set("a", ["x" * 20])
+    cache.set("b", ["x" * 20])
+
+    assert cache.get("large") is None
+    assert cache.get("a") is None
+    assert cache.get("b") == ["x" * 20]
+    assert cache.get_stats()["approx_bytes"] <= 40
+
+
+def test_cache_invalidated_by_revision_written_in_another_process(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    path = str(tmp_path / "index_revision")
+    cache = ResultCache(max_entries=10, max_bytes=1024 * 1024, ttl_seconds=0, revision=IndexRevision(path))
+    cache.set("a", [{"id": "a"}])
+
+    # 投入スクリプト側のプロセスがリビジョンを更新
+    IndexRevision(path).bump()
+    assert cache.get("a") == [{"id": "a"}]
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_local_invalidation_does_not_invalidate_twice(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    revision = IndexRevision(str(tmp_path / "index_revision"))
+    cache = ResultCache(max_entries=10, max_bytes=1024 * 1024, ttl_seconds=0, revision=revision)
+
+    revision.bump()
+    cache.invalidate()
+    cache.set("a", [{"id": "a"}])
+    now[0] += 2
+    assert cache.get("a") == [{"id": "a"}]
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_set_skips_results_computed_before_invalidation():
+    cache = ResultCache(max_entries=10, max_bytes=1024 * 1024, ttl_seconds=0)
+    generation = cache.generation()
+    cache.invalidate()
+    cache.set("a", [{"id": "old"}], generation)
+    assert cache.get("a") is None
+
+    cache.set("a", [{"id": "new"}], cache.generation())
+    assert cache.get("a") == [{"id": "new"}]
+
+
+def test_search_invalidated_mid_flight_is_not_cached(monkeypatch):
+    from app.services.search import search_service
+
+    cache = ResultCache(max_entries=10, max_bytes=1024 * 1024, ttl_seconds=0)
+    calls = []
+
+    async def single_query_search(query, n_results, *args):
+        calls.append(query)
+        # 検索の途中でインデックスが更新された
+        cache.invalidate()
+        return [{"id": "stale"}]
+
+    monkeypatch.setattr(search_service, "result_cache", cache)
+    monkeypatch.setattr(search_service, "citation_index", None)
+    monkeypatch.setattr(search_service, "_single_query_search", single_query_search)
+
+    for _ in range(2):
+        results = asyncio.run(search_service.search_documents(
+            "損害賠償", n_results=1, expand_to_parent=False, multi_query=False
+        ))
+        assert results == [{"id": "stale"}]
+    assert len(calls) == 2
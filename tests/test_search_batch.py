@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app.services.concurrency_limiter import UpstreamOverloaded
+from app.services.search import search_service
+
+
+class FakeEmbeddings:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    async def get_embeddings(self, texts, use_cache=False):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+
+def test_batch_embeddings_deduplicates_queries(monkeypatch):
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(search_service, "embeddings_service", embeddings)
+
+    vectors = asyncio.run(search_service._batch_embeddings(["民法", "刑法典", "民法", " "]))
+
+    assert embeddings.calls == [["民法", "刑法典"]]
+    assert vectors == [[2.0], [3.0], [2.0], None]
+
+
+def test_batch_embeddings_falls_back_to_per_query_on_errors(monkeypatch):
+    monkeypatch.setattr(search_service, "embeddings_service", FakeEmbeddings(Exception("bad request")))
+
+    assert asyncio.run(search_service._batch_embeddings(["a", "b"])) == [None, None]
+
+
+def test_batch_embeddings_propagates_load_shedding(monkeypatch):
+    overloaded = UpstreamOverloaded("openai", 3, "queue full")
+    monkeypatch.setattr(search_service, "embeddings_service", FakeEmbeddings(overloaded))
+
+    with pytest.raises(UpstreamOverloaded):
+        asyncio.run(search_service.search_batch([{"query": "a"}, {"query": "b"}]))
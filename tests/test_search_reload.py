@@ -0,0 +1,41 @@
+import asyncio
+
+from app.services.chunking import ParentStore
+from app.services.citation_index import CitationIndex
+from app.services.lexical_index import LexicalIndex
+from app.services.result_cache import ResultCache, index_revision
+from app.services.search import search_service
+
+from test_ingestion import _pipeline, _write_jsonl
+
+
+def test_search_reloads_indexes_saved_by_another_process(tmp_path, monkeypatch):
+    lexical_path = str(tmp_path / "lexical")
+    parents_path = str(tmp_path / "parents")
+    cache = ResultCache(max_entries=10, max_bytes=1024 * 1024, ttl_seconds=0, revision=index_revision)
+    monkeypatch.setattr(search_service, "lexical_index", LexicalIndex(lexical_path))
+    monkeypatch.setattr(search_service, "parent_store", ParentStore(parents_path))
+    monkeypatch.setattr(search_service, "citation_index", CitationIndex())
+    monkeypatch.setattr(search_service, "result_cache", cache)
+    monkeypatch.setattr(search_service, "_index_revision", index_revision.current())
+    cache.set("stale", [{"id": "stale"}])
+
+    # 投入スクリプト側のプロセスが別のインスタンスで保存
+    record = {"LawID": "law", "LawTitle": "テスト法", "ArticleTitle": "第一条", "original_text": "契約の本文です。"}
+    asyncio.run(_pipeline(
+        tmp_path / "input.manifest.jsonl",
+        lexical_index=LexicalIndex(lexical_path), parent_store=ParentStore(parents_path)
+    ).run(_write_jsonl(tmp_path / "input.jsonl", [record])))
+
+    # 確認間隔内は読み直さない
+    monkeypatch.setattr(search_service, "_index_checked_at", float("inf"))
+    asyncio.run(search_service._refresh_indexes())
+    assert search_service.lexical_index.document_count == 0
+
+    monkeypatch.setattr(search_service, "_index_checked_at", float("-inf"))
+    asyncio.run(search_service._refresh_indexes())
+    assert search_service.lexical_index.document_count == 1
+    assert search_service.lexical_index.search("契約", n_results=1)[0]["id"] == "law_1"
+    results, citation_only = search_service.citation_index.lookup("テスト法第1条")
+    assert [result["id"] for result in results] == ["law_1"] and citation_only
+    assert cache.get("stale") is None
@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_do_shares_one_execution_and_copies_results():
+    flight = SingleFlight("test")
+    executions = []
+
+    async def work():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": ["a"]}
+
+    async def scenario():
+        results = await asyncio.gather(*[flight.do("key", work) for _ in range(5)])
+        results[0]["answer"].append("changed")
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(executions) == 1
+    assert results[1] == {"answer": ["a"]}
+    stats = flight.get_stats()
+    assert (stats["requests"], stats["executions"], stats["collapsed"], stats["in_flight"]) == (5, 1, 4, 0)
+
+
+def test_leader_changes_do_not_reach_followers():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.01)
+        return {"answer": ["a"]}
+
+    async def leader():
+        result = await flight.do("key", work)
+        # 後続の呼び出し元が結果を受け取る前に変更する
+        result["answer"].append("changed")
+        return result
+
+    async def scenario():
+        return await asyncio.gather(leader(), *[flight.do("key", work) for _ in range(3)])
+
+    results = asyncio.run(scenario())
+    assert results[0] == {"answer": ["a", "changed"]}
+    assert results[1:] == [{"answer": ["a"]}] * 3
+
+
+def test_do_runs_again_after_completion_and_propagates_errors():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await flight.do("key", failing)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_stream_replays_events_to_late_subscribers():
+    flight = SingleFlight("test")
+    started = []
+
+    async def produce():
+        started.append(1)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield {"token": i}
+
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return [event async for event in flight.stream("key", produce)]
+
+    async def scenario():
+        return await asyncio.gather(collect(0), collect(0.015))
+
+    first, late = asyncio.run(scenario())
+    assert first == late == [{"token": 0}, {"token": 1}, {"token": 2}]
+    assert len(started) == 1
+    assert flight.get_stats()["collapsed"] == 1
+
+
+def test_stream_errors_reach_every_subscriber():
+    flight = SingleFlight("test")
+
+    async def produce():
+        yield "first"
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    async def collect():
+        events = []
+        try:
+            async for event in flight.stream("key", produce):
+                events.append(event)
+        except RuntimeError as e:
+            events.append(str(e))
+        return events
+
+    async def scenario():
+        return await asyncio.gather(collect(), collect())
+
+    assert asyncio.run(scenario()) == [["first", "upstream failed"]] * 2
+
+
+def test_stream_stops_producing_when_every_subscriber_leaves():
+    flight = SingleFlight("test")
+    produced = []
+
+    async def produce():
+        for i in range(100):
+            produced.append(i)
+            yield i
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        stream = flight.stream("key", produce)
+        assert await stream.__anext__() == 0
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        return flight.in_flight("key")
+
+    assert asyncio.run(scenario()) is False
+    assert len(produced) < 5
+
+
+def test_caller_arriving_after_last_subscriber_leaves_gets_a_fresh_stream():
+    flight = SingleFlight("test")
+
+    async def produce():
+        for i in range(3):
+            yield i
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        first = flight.stream("key", produce)
+        assert await first.__anext__() == 0
+        await first.aclose()
+        # 中止した生成の後始末が終わる前に同じ key の呼び出しが届く
+        return [event async for event in flight.stream("key", produce)]
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+    assert flight.get_stats()["executions"] == 2